@@ -0,0 +1,138 @@
+# benchmarks/bench_backends.py
+#
+# Compares the retrieval backends (INDEX_MODE values) on the QA corpus: index
+# build time, cold open to first answer (in a fresh process), single-query and
+# batched latency, and top-k agreement with ChromaDB:
+#
+#     python -m benchmarks.bench_backends --backends chroma,numpy,compact,snapshot --questions 200
+
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import QA_DATA_PATH, REPO_ROOT, latency_summary, peak_rss_mb, sample_questions, save_results
+
+COLLECTION_NAME = "backend_bench"
+
+
+def cold_open(backend: str, persist_dir: str, question: str, n_results: int) -> dict:
+    """
+    Opens an existing index and answers one question; run in a child process so
+    nothing is already loaded.
+    """
+    import qa_module  # Import cost is shared by every backend and not counted
+    from embeddings import collection_options
+    from retrieval_backends import open_client, serve
+
+    start = time.perf_counter()
+    client = open_client(persist_dir, backend)
+    collection = serve(client.get_collection(name=COLLECTION_NAME, **collection_options()), backend, persist_dir)
+    opened = time.perf_counter()
+    collection.query(query_texts=[question], n_results=n_results)
+    answered = time.perf_counter()
+    qa_module.close_chroma_client(client)
+    return {"open_ms": (opened - start) * 1000, "first_query_ms": (answered - opened) * 1000, "peak_rss_mb": peak_rss_mb()}
+
+
+def run_cold_open(backend: str, persist_dir: str, question: str, n_results: int) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_backends", "--cold-open", backend, persist_dir, question, "--n-results", str(n_results)],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        print(completed.stderr)
+        return {}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run(args):
+    import qa_module
+    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+    from embeddings import get_embedding_function
+
+    questions = sample_questions(args.questions, seed=args.seed)
+    # Embed once so only the index search is timed
+    embeddings = (get_embedding_function() or DefaultEmbeddingFunction())(questions)
+
+    results = {}
+    reference = None
+    for backend in args.backends.split(","):
+        persist_dir = tempfile.mkdtemp(prefix=f"tallman_backend_{backend}_")
+        try:
+            build_start = time.perf_counter()
+            collection, client = qa_module.ensure_database(COLLECTION_NAME, QA_DATA_PATH, persist_dir, args.max_lines_per_chunk, backend=backend)
+            build_seconds = time.perf_counter() - build_start
+
+            for embedding in embeddings[: args.warmup]:
+                collection.query(query_embeddings=[embedding], n_results=args.n_results)
+
+            single, ranked_ids = [], []
+            for embedding in embeddings:
+                start = time.perf_counter()
+                response = collection.query(query_embeddings=[embedding], n_results=args.n_results, include=["documents", "distances"])
+                single.append(time.perf_counter() - start)
+                ranked_ids.append(response["ids"][0])
+
+            batch_start = time.perf_counter()
+            for start in range(0, len(embeddings), args.batch_size):
+                collection.query(query_embeddings=embeddings[start:start + args.batch_size], n_results=args.n_results)
+            batch_seconds = time.perf_counter() - batch_start
+            qa_module.close_chroma_client(client)
+
+            if reference is None:
+                reference = ranked_ids
+            agreement = sum(
+                len(set(ids) & set(reference_ids)) / max(len(reference_ids), 1)
+                for ids, reference_ids in zip(ranked_ids, reference)
+            ) / max(len(ranked_ids), 1)
+
+            results[backend] = {
+                "build_seconds": build_seconds,
+                "cold_open": run_cold_open(backend, persist_dir, questions[0], args.n_results),
+                "single_query": latency_summary(single),
+                "batch_queries_per_second": len(embeddings) / batch_seconds if batch_seconds else 0.0,
+                f"agreement_at_{args.n_results}": agreement,
+            }
+            print_row(backend, results[backend], args.n_results)
+        finally:
+            shutil.rmtree(persist_dir, ignore_errors=True)
+    return {"config": vars(args), "reference_backend": args.backends.split(",")[0], "backends": results}
+
+
+def print_row(backend: str, outcome: dict, n_results: int):
+    single = outcome["single_query"]
+    cold = outcome["cold_open"]
+    print(
+        f"{backend:<9} build {outcome['build_seconds']:6.1f}s  open {cold.get('open_ms', 0):8.1f} ms  "
+        f"first {cold.get('first_query_ms', 0):8.1f} ms  p50 {single.get('p50_ms', 0):6.2f} ms  "
+        f"p95 {single.get('p95_ms', 0):6.2f} ms  batch {outcome['batch_queries_per_second']:8.0f} q/s  "
+        f"agree@{n_results} {outcome[f'agreement_at_{n_results}']:.3f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval backend comparison on the QA corpus.")
+    parser.add_argument("--backends", default="chroma,numpy,compact,snapshot", help="Comma-separated INDEX_MODE values; the first is the agreement reference.")
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-lines-per-chunk", type=int, default=100)
+    parser.add_argument("--cold-open", nargs=3, metavar=("BACKEND", "PERSIST_DIR", "QUESTION"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_open:
+        print(json.dumps(cold_open(*args.cold_open, n_results=args.n_results)))
+        return
+
+    results = run(args)
+    save_results("backends", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/bench_embeddings.py
+#
+# Compares embedding backends on corpus text: bulk ingestion throughput
+# (chunks per second, batches of 64 as populate_collection sends them) and
+# query embedding throughput and latency with concurrent single-question
+# callers, with and without micro-batching:
+#
+#     python -m benchmarks.bench_embeddings --concurrency 1,8,32 --questions 400
+
+import argparse
+import threading
+import time
+from typing import Callable, Dict, List
+
+from benchmarks.common import QA_DATA_PATH, latency_summary, sample_questions, save_results
+
+
+def bulk_throughput(embedding_function: Callable, chunks: List[str], batch_size: int = 64) -> float:
+    start = time.perf_counter()
+    for offset in range(0, len(chunks), batch_size):
+        embedding_function(chunks[offset:offset + batch_size])
+    seconds = time.perf_counter() - start
+    return len(chunks) / seconds if seconds else 0.0
+
+
+def concurrent_queries(embedding_function: Callable, questions: List[str], concurrency: int) -> Dict:
+    """
+    Embeds each question in its own call from `concurrency` threads, as
+    concurrent users' query_chroma calls do.
+    """
+    latencies, lock = [], threading.Lock()
+    next_index = [0]
+
+    def worker():
+        while True:
+            with lock:
+                index = next_index[0]
+                next_index[0] += 1
+            if index >= len(questions):
+                return
+            start = time.perf_counter()
+            embedding_function([questions[index]])
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    return {"queries_per_second": len(questions) / seconds if seconds else 0.0, "latency": latency_summary(latencies)}
+
+
+def run(args):
+    import qa_module
+    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+    from embeddings import EmbeddingBatcher, OnnxEmbeddingFunction
+
+    questions = sample_questions(args.questions, seed=args.seed)
+    chunks = qa_module.load_qa_data(QA_DATA_PATH, args.max_lines_per_chunk)[: args.chunks]
+    onnx = OnnxEmbeddingFunction()
+    backends = {
+        "default": DefaultEmbeddingFunction(),
+        "onnx": onnx,
+        "onnx+batcher": EmbeddingBatcher(onnx, max_batch=args.max_batch, max_wait_ms=args.batch_wait_ms),
+    }
+
+    results = {}
+    for name, embedding_function in backends.items():
+        embedding_function(questions[:4])  # Load the model before timing
+        outcome = {"bulk_chunks_per_second": bulk_throughput(embedding_function, chunks), "concurrency": {}}
+        for concurrency in (int(value) for value in args.concurrency.split(",")):
+            outcome["concurrency"][concurrency] = concurrent_queries(embedding_function, questions, concurrency)
+        results[name] = outcome
+        print_row(name, outcome)
+    return {"config": vars(args), "backends": results}
+
+
+def print_row(name: str, outcome: Dict):
+    cells = "  ".join(
+        f"c={concurrency}: {row['queries_per_second']:7.0f} q/s p95 {row['latency'].get('p95_ms', 0):6.1f} ms"
+        for concurrency, row in outcome["concurrency"].items()
+    )
+    print(f"{name:<13} bulk {outcome['bulk_chunks_per_second']:7.1f} chunks/s  {cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend throughput and latency.")
+    parser.add_argument("--questions", type=int, default=400)
+    parser.add_argument("--chunks", type=int, default=256, help="Chunks embedded for the bulk ingestion measurement.")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated numbers of concurrent callers.")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--batch-wait-ms", type=float, default=5.0)
+    parser.add_argument("--max-lines-per-chunk", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = run(args)
+    save_results("embeddings", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# benchmarks/common.py
+
+import datetime
+import glob
+import json
+import os
+import random
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# ============================
+# Path Definitions
+# ============================
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QA_DATA_PATH = os.path.join(REPO_ROOT, "QA_data", "qa_data.txt")
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+# Benchmarks run as "python -m benchmarks.<name>" from the repository root, where
+# Streamlit finds .streamlit/secrets.toml; data paths are resolved from REPO_ROOT
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from tracing import percentile  # noqa: E402
+
+
+# ============================
+# Question Sampling
+# ============================
+def sample_questions(n: int, seed: int = 0, qa_data_path: str = QA_DATA_PATH) -> List[str]:
+    """
+    Samples question texts from the QA corpus.
+
+    Args:
+        n (int): Number of questions; sampling repeats questions when n exceeds the corpus.
+        seed (int): Random seed so runs are comparable.
+        qa_data_path (str): Path to the QA data file.
+
+    Returns:
+        List[str]: Question texts without their QUESTION: labels.
+    """
+    from qa_module import parse_qa_entries, strip_question_prefix
+
+    questions = [strip_question_prefix(entry["question"]) for entry in parse_qa_entries(qa_data_path)]
+    questions = [question for question in questions if question]
+    rng = random.Random(seed)
+    if n <= len(questions):
+        return rng.sample(questions, n)
+    return [rng.choice(questions) for _ in range(n)]
+
+
+# ============================
+# Measurements
+# ============================
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    """
+    Summarizes latencies given in seconds as milliseconds.
+    """
+    values = sorted(value * 1000.0 for value in seconds)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": values[-1],
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Returns the process's peak resident set size in MB, or None where unsupported.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+# ============================
+# LLM Admission Limits
+# ============================
+def add_llm_limit_arguments(parser):
+    parser.add_argument("--llm-concurrency", type=int, default=None,
+                        help="LLM scheduler concurrency (default: unlimited with the fake LLM, LLM_MAX_CONCURRENCY otherwise).")
+    parser.add_argument("--llm-rpm", type=int, default=None,
+                        help="LLM requests per minute, 0 = unlimited (default: unlimited with the fake LLM, LLM_REQUESTS_PER_MINUTE otherwise).")
+    parser.add_argument("--llm-tpm", type=int, default=None,
+                        help="LLM tokens per minute, 0 = unlimited (default: unlimited with the fake LLM, LLM_TOKENS_PER_MINUTE otherwise).")
+
+
+def install_llm_scheduler(args, fake_llm: bool, concurrency: int) -> Tuple[Dict, object]:
+    """
+    Replaces the app's LLM scheduler for a benchmark run. Against the fake LLM
+    the limits default to none, so the run measures the pipeline rather than
+    the production rate limits; the flags from add_llm_limit_arguments override.
+
+    Args:
+        args: Parsed arguments including the add_llm_limit_arguments flags.
+        fake_llm (bool): Whether the run uses the fake LLM server.
+        concurrency (int): The benchmark's own concurrency, the unlimited scheduler concurrency.
+
+    Returns:
+        tuple: (limits in effect, for the result file; the replaced scheduler, to put back afterwards).
+    """
+    import qa_module
+    from config import (
+        LLM_MAX_CONCURRENCY,
+        LLM_MAX_QUEUE,
+        LLM_MAX_RETRIES,
+        LLM_QUEUE_TIMEOUT_SECONDS,
+        LLM_REQUESTS_PER_MINUTE,
+        LLM_TOKENS_PER_MINUTE,
+    )
+    from llm_scheduler import LLMScheduler
+
+    def pick(value, unlimited, configured):
+        if value is not None:
+            return value
+        return unlimited if fake_llm else configured
+
+    limits = {
+        "max_concurrency": pick(args.llm_concurrency, max(1, concurrency), LLM_MAX_CONCURRENCY),
+        "requests_per_minute": pick(args.llm_rpm, 0, LLM_REQUESTS_PER_MINUTE),
+        "tokens_per_minute": pick(args.llm_tpm, 0, LLM_TOKENS_PER_MINUTE),
+    }
+    previous = qa_module.LLM_SCHEDULER
+    qa_module.LLM_SCHEDULER = LLMScheduler(
+        max_queue=max(LLM_MAX_QUEUE, concurrency), queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES, **limits
+    )
+    return limits, previous
+
+
+# ============================
+# Result Storage
+# ============================
+def save_results(name: str, payload: Dict) -> str:
+    """
+    Writes a benchmark result as JSON under benchmarks/results/.
+
+    Args:
+        name (str): Benchmark name, used as the file prefix.
+        payload (Dict): The measurements and configuration.
+
+    Returns:
+        str: The path of the written file.
+    """
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    payload = dict(payload, benchmark=name, revision=git_revision(), timestamp=timestamp)
+    path = os.path.join(RESULTS_DIR, f"{name}-{timestamp}.json")
+    with open(path, "w", encoding="utf-8") as results_file:
+        json.dump(payload, results_file, indent=2, sort_keys=True)
+    print(f"Results written to {path}")
+    return path
+
+
+def load_previous_results(name: str, exclude: Optional[str] = None) -> Optional[Dict]:
+    paths = sorted(glob.glob(os.path.join(RESULTS_DIR, f"{name}-*.json")))
+    paths = [path for path in paths if os.path.abspath(path) != os.path.abspath(exclude or "")]
+    if not paths:
+        return None
+    with open(paths[-1], "r", encoding="utf-8") as results_file:
+        return json.load(results_file)
+
+
+def print_comparison(current: Dict, previous: Optional[Dict], keys: List[str]):
+    """
+    Prints flat numeric metrics next to the previous run's values.
+
+    Args:
+        current (Dict): This run's results.
+        previous (Dict): The previous run's results, or None.
+        keys (List[str]): Dotted paths of the metrics to compare, e.g. "total.p95_ms".
+    """
+    def lookup(data, dotted):
+        for part in dotted.split("."):
+            if not isinstance(data, dict) or part not in data:
+                return None
+            data = data[part]
+        return data
+
+    if previous is None:
+        print("No previous results to compare against.")
+        return
+    print(f"Compared with {previous.get('revision')} at {previous.get('timestamp')}:")
+    for key in keys:
+        now, before = lookup(current, key), lookup(previous, key)
+        if not isinstance(now, (int, float)) or not isinstance(before, (int, float)):
+            continue
+        change = ((now - before) / before * 100.0) if before else 0.0
+        print(f"  {key:<32}{before:>12.2f} -> {now:>12.2f} ({change:+.1f}%)")
@@ -0,0 +1,120 @@
+# benchmarks/eval_compression.py
+#
+# Measures extractive context compression on the QA corpus: each entry's
+# question retrieves context through query_chroma, and the context is
+# compressed at several token budgets. A budget is scored by how many prompt
+# tokens it saves and how often the entry's own answer, when it was retrieved,
+# survives compression:
+#
+#     python -m benchmarks.eval_compression --budgets 400,800,1200 --questions 300
+
+import argparse
+import random
+import re
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.common import QA_DATA_PATH, latency_summary, save_results
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def squash(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def evaluate_budget(cases: List[Dict], budget: int) -> Dict:
+    from context_compression import compress_context
+
+    retained = partial = retrievable = 0
+    tokens_before = tokens_after = 0
+    latencies = []
+    for case in cases:
+        start = time.perf_counter()
+        compressed, before, after = compress_context(case["question"], case["snippets"], token_budget=budget)
+        latencies.append(time.perf_counter() - start)
+        tokens_before += before
+        tokens_after += after
+        if not case["answer_retrieved"]:
+            continue
+        retrievable += 1
+        context = squash(" ".join(compressed))
+        if case["answer"] in context:
+            retained += 1
+        elif case["answer_start"] in context:
+            partial += 1  # The answer's entry was kept, but not every sentence
+    n_cases = len(cases) or 1
+    return {
+        "budget": budget,
+        "mean_tokens_before": tokens_before / n_cases,
+        "mean_tokens_after": tokens_after / n_cases,
+        "token_reduction": 1.0 - tokens_after / tokens_before if tokens_before else 0.0,
+        "answers_retrievable": retrievable,
+        "answer_retained": retained / retrievable if retrievable else 0.0,
+        "answer_partially_retained": partial / retrievable if retrievable else 0.0,
+        "latency": latency_summary(latencies),
+    }
+
+
+def run(args):
+    import qa_module
+    from faq_index import strip_answer_prefix
+
+    entries = [entry for entry in qa_module.parse_qa_entries(QA_DATA_PATH) if qa_module.strip_question_prefix(entry["question"])]
+    rng = random.Random(args.seed)
+    if args.questions and args.questions < len(entries):
+        entries = rng.sample(entries, args.questions)
+
+    persist_dir = tempfile.mkdtemp(prefix="tallman_compression_")
+    try:
+        collection, client = qa_module.ensure_database("eval_compression", QA_DATA_PATH, persist_dir, args.max_lines_per_chunk)
+        cases = []
+        for entry in entries:
+            question = qa_module.strip_question_prefix(entry["question"])
+            snippets = qa_module.query_chroma(question, collection, n_results=args.n_results)
+            answer = squash(strip_answer_prefix(entry["answer"]))
+            cases.append({
+                "question": question,
+                "snippets": snippets,
+                "answer": answer,
+                "answer_start": answer[:60],
+                "answer_retrieved": answer in squash(" ".join(snippets).replace("ANSWER:", " ")),
+            })
+        qa_module.close_chroma_client(client)
+    finally:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+    results = []
+    for budget in (int(value) for value in args.budgets.split(",")):
+        outcome = evaluate_budget(cases, budget)
+        results.append(outcome)
+        print_row(outcome)
+    return {"config": vars(args), "questions": len(cases), "budgets": results}
+
+
+def print_row(outcome: Dict):
+    latency = outcome["latency"]
+    print(
+        f"budget={outcome['budget']:<5} tokens {outcome['mean_tokens_before']:7.0f} -> {outcome['mean_tokens_after']:7.0f} "
+        f"({outcome['token_reduction']:.0%} saved)  answer kept {outcome['answer_retained']:.3f}  "
+        f"partial {outcome['answer_partially_retained']:.3f}  p50 {latency.get('p50_ms', 0):.1f} ms  p95 {latency.get('p95_ms', 0):.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token savings and answer retention of context compression.")
+    parser.add_argument("--budgets", default="0,400,800,1200", help="Comma-separated token budgets; 0 is no compression.")
+    parser.add_argument("--questions", type=int, default=300, help="Entries to sample (0 = all).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--max-lines-per-chunk", type=int, default=100)
+    args = parser.parse_args()
+
+    results = run(args)
+    save_results("compression_eval", results)
+
+
+if __name__ == "__main__":
+    main()
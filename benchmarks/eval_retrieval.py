@@ -0,0 +1,265 @@
+# benchmarks/eval_retrieval.py
+#
+# Uses every QUESTION/ANSWER pair in qa_data.txt as a labeled query: the
+# question text is sent through query_chroma and the chunk(s) holding that
+# entry are the relevant results. The evaluation is leave-one-out: while an
+# entry is the query, its chunk is indexed without that entry's question line,
+# so a chunk can only be found through its answer and neighbouring entries.
+# Each retrieval config is scored side by side:
+#
+#     python -m benchmarks.eval_retrieval --chunk-sizes 25,50,100 --n-results 3,10 --modes vector,hybrid,rerank
+
+import argparse
+import math
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Set
+
+from benchmarks.common import QA_DATA_PATH, latency_summary, save_results
+from chunk_metadata import SNIPPET_MAX_CHARS, describe_chunks
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+# ============================
+# Alternative Rankers
+# ============================
+class BM25:
+    """
+    Okapi BM25 over the chunk texts, used for the hybrid config.
+    """
+
+    def __init__(self, documents: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(document)) for document in documents]
+        self.lengths = [sum(freqs.values()) for freqs in self.term_freqs]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        self.document_freqs = Counter()
+        for freqs in self.term_freqs:
+            self.document_freqs.update(freqs.keys())
+        self.idf = {term: self._idf(freq) for term, freq in self.document_freqs.items()}
+
+    def _idf(self, freq: int) -> float:
+        return math.log(1.0 + (len(self.term_freqs) - freq + 0.5) / (freq + 0.5))
+
+    def replace(self, index: int, document: str):
+        """
+        Replaces one document's text, updating the statistics it contributes to.
+        """
+        old, new = self.term_freqs[index], Counter(tokenize(document))
+        self.document_freqs.subtract(old.keys())
+        self.document_freqs.update(new.keys())
+        for term in set(old) ^ set(new):
+            if self.document_freqs[term] > 0:
+                self.idf[term] = self._idf(self.document_freqs[term])
+            else:
+                self.idf.pop(term, None)
+        self.term_freqs[index] = new
+        self.lengths[index] = sum(new.values())
+        self.average_length = sum(self.lengths) / len(self.lengths)
+
+    def rank(self, query: str, limit: int) -> List[int]:
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scores = []
+        for index, freqs in enumerate(self.term_freqs):
+            norm = self.k1 * (1.0 - self.b + self.b * self.lengths[index] / (self.average_length or 1.0))
+            score = 0.0
+            for term in terms:
+                freq = freqs.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1.0) / (freq + norm)
+            if score > 0.0:
+                scores.append((score, index))
+        scores.sort(reverse=True)
+        return [index for _, index in scores[:limit]]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[int]:
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, index in enumerate(ranking):
+            fused[index] = fused.get(index, 0.0) + 1.0 / (k + rank + 1)
+    return [index for index, _ in sorted(fused.items(), key=lambda item: -item[1])]
+
+
+def question_overlap_rerank(query: str, candidates: Sequence[int], chunks: Sequence[str]) -> List[int]:
+    """
+    Re-orders candidate chunks by their best token overlap between the query and
+    any QUESTION: line inside the chunk, keeping vector order for ties.
+    """
+    query_terms = set(tokenize(query))
+
+    def best_overlap(chunk_index):
+        best = 0.0
+        for line in chunks[chunk_index].split("\n"):
+            if "QUESTION:" not in line:
+                continue
+            line_terms = set(tokenize(line)) - {"user", "question"}
+            union = query_terms | line_terms
+            if union:
+                best = max(best, len(query_terms & line_terms) / len(union))
+        return best
+
+    order = {index: position for position, index in enumerate(candidates)}
+    return sorted(candidates, key=lambda index: (-best_overlap(index), order[index]))
+
+
+# ============================
+# Evaluation
+# ============================
+def build_labels(entries: List[dict], chunks: List[str]) -> List[Set[int]]:
+    """
+    Finds the chunk indexes holding each entry, matching the text load_qa_data writes.
+    """
+    labels = []
+    for entry in entries:
+        needle = f"USER QUESTION: {entry['question']}\nANSWER: {entry['answer']}"
+        labels.append({index for index, chunk in enumerate(chunks) if needle in chunk})
+    return labels
+
+
+def summarize_config(first_hits: List, latencies: List[float], ks: Sequence[int]) -> Dict:
+    """
+    Scores one config from the rank of each query's first relevant chunk (None when missed).
+    """
+    hits = {k: sum(1 for first_hit in first_hits if first_hit is not None and first_hit < k) for k in ks}
+    reciprocal_ranks = sum(1.0 / (first_hit + 1) for first_hit in first_hits if first_hit is not None)
+    n_queries = len(first_hits) or 1
+    return {
+        "recall": {f"@{k}": hits[k] / n_queries for k in ks},
+        "mrr": reciprocal_ranks / n_queries,
+        "latency": latency_summary(latencies),
+    }
+
+
+def without_question(chunk: str, entry: dict) -> str:
+    return chunk.replace(f"USER QUESTION: {entry['question']}\n", "", 1)
+
+
+def run(args):
+    import qa_module
+    import query_cache
+
+    # Every config re-runs the same questions, and held-out chunks change the
+    # index between them; measure cold retrieval, not cache hits
+    query_cache.QUERY_VECTOR_CACHE.maxsize = 0
+    query_cache.RETRIEVAL_CACHE.maxsize = 0
+
+    entries = qa_module.parse_qa_entries(QA_DATA_PATH)
+    entries = [entry for entry in entries if qa_module.strip_question_prefix(entry["question"])]
+    if args.limit:
+        entries = entries[: args.limit]
+    queries = [qa_module.strip_question_prefix(entry["question"]) for entry in entries]
+
+    n_results_options = [int(value) for value in args.n_results.split(",")]
+    modes = args.modes.split(",")
+    results = []
+    persist_dir = tempfile.mkdtemp(prefix="tallman_eval_")
+    try:
+        for chunk_size in (int(value) for value in args.chunk_sizes.split(",")):
+            chunks = qa_module.load_qa_data(QA_DATA_PATH, chunk_size)
+            labels = build_labels(entries, chunks)
+            collection, client = qa_module.ensure_database(f"eval_chunks_{chunk_size}", QA_DATA_PATH, persist_dir, chunk_size)
+
+            # query_chroma returns snippets truncated to SNIPPET_MAX_CHARS characters
+            snippet_to_index = {}
+            for index, chunk in enumerate(chunks):
+                snippet_to_index.setdefault(chunk[:SNIPPET_MAX_CHARS], index)
+            served_chunks = list(chunks)
+            bm25 = BM25(chunks) if "hybrid" in modes else None
+
+            def index_chunks(texts: Dict[int, str]):
+                collection.upsert(
+                    documents=list(texts.values()),
+                    ids=[f"id_{index}" for index in texts],
+                    metadatas=describe_chunks(list(texts.values()), [f"QA_data_chunk_{index}" for index in texts]),
+                )
+                for index, text in texts.items():
+                    served_chunks[index] = text
+                    snippet_to_index[text[:SNIPPET_MAX_CHARS]] = index
+                    if bm25 is not None:
+                        bm25.replace(index, text)
+
+            @contextmanager
+            def hold_out(position: int):
+                # The query's own question line is removed from its chunk(s) while it is asked
+                held = {index: without_question(chunks[index], entries[position]) for index in labels[position]}
+                index_chunks(held)
+                try:
+                    yield
+                finally:
+                    index_chunks({index: chunks[index] for index in held})
+
+            def vector(query, limit):
+                snippets = qa_module.query_chroma(query, collection, n_results=limit)
+                return [snippet_to_index[snippet] for snippet in snippets if snippet in snippet_to_index]
+
+            retrievers = {
+                "vector": vector,
+                "hybrid": lambda query, limit: reciprocal_rank_fusion([vector(query, limit), bm25.rank(query, limit)]),
+                "rerank": lambda query, limit: question_overlap_rerank(query, vector(query, limit), served_chunks),
+            }
+            for mode in modes:
+                if mode not in retrievers:
+                    print(f"Skipping unknown mode: {mode}")
+            configs = [(n_results, mode) for n_results in n_results_options for mode in modes if mode in retrievers]
+            first_hits = {config: [] for config in configs}
+            latencies = {config: [] for config in configs}
+            for position, query in enumerate(queries):
+                with hold_out(position):
+                    for n_results, mode in configs:
+                        limit = n_results if mode == "vector" else max(n_results, args.candidates)
+                        start = time.perf_counter()
+                        ranked = retrievers[mode](query, limit)[:n_results]
+                        latencies[(n_results, mode)].append(time.perf_counter() - start)
+                        first_hits[(n_results, mode)].append(
+                            next((rank for rank, index in enumerate(ranked) if index in labels[position]), None)
+                        )
+
+            for n_results, mode in configs:
+                ks = sorted({k for k in (1, 3, 5, 10) if k <= n_results} | {n_results})
+                outcome = summarize_config(first_hits[(n_results, mode)], latencies[(n_results, mode)], ks)
+                outcome.update({"chunk_size": chunk_size, "chunks": len(chunks), "n_results": n_results, "mode": mode})
+                results.append(outcome)
+                print_row(outcome)
+            qa_module.close_chroma_client(client)
+    finally:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+    return {"queries": len(queries), "configs": results}
+
+
+def print_row(outcome: Dict):
+    recall = "  ".join(f"R{k} {value:.3f}" for k, value in outcome["recall"].items())
+    latency = outcome["latency"]
+    print(
+        f"chunk={outcome['chunk_size']:<4} chunks={outcome['chunks']:<4} n={outcome['n_results']:<3} "
+        f"{outcome['mode']:<7} {recall}  MRR {outcome['mrr']:.3f}  "
+        f"p50 {latency.get('p50_ms', 0):.1f} ms  p95 {latency.get('p95_ms', 0):.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval recall/MRR/latency evaluation over the QA corpus.")
+    parser.add_argument("--chunk-sizes", default="25,50,100", help="Comma-separated max_lines_per_chunk values.")
+    parser.add_argument("--n-results", default="3,10", help="Comma-separated n_results values.")
+    parser.add_argument("--modes", default="vector,hybrid,rerank", help="Any of vector, hybrid, rerank.")
+    parser.add_argument("--candidates", type=int, default=20, help="Candidate pool for hybrid fusion and reranking.")
+    parser.add_argument("--limit", type=int, default=0, help="Evaluate only the first N entries (0 = all).")
+    args = parser.parse_args()
+
+    results = run(args)
+    results["config"] = vars(args)
+    save_results("retrieval_eval", results)
+
+
+if __name__ == "__main__":
+    main()
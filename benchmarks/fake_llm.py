@@ -0,0 +1,188 @@
+# benchmarks/fake_llm.py
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ============================
+# Fake OpenAI-Compatible Chat Server
+# ============================
+FILLER_WORDS = (
+    "Tallman", "Equipment", "offers", "rope", "gloves", "testing", "climbers", "fall",
+    "protection", "for", "lineman", "crews", "and", "utility", "repair", "services",
+)
+
+
+class FakeLLMServer:
+    """
+    A local stand-in for the Groq chat completions API.
+
+    Streams server-sent events in the OpenAI/Groq chunk format after a
+    configurable time-to-first-token, then emits tokens at a fixed rate.
+    It answers any path ending in /chat/completions, so it serves both the
+    Groq client (/openai/v1/...) and plain OpenAI-compatible clients (/v1/...).
+
+    Args:
+        port (int): Port to listen on; 0 picks a free port.
+        ttft_ms (float): Delay before the first token.
+        tokens_per_second (float): Streaming rate after the first token.
+        response_tokens (int): Tokens per response, capped by the request's max_tokens.
+        jitter (float): Relative random jitter applied to ttft_ms, e.g. 0.2 for ±20%.
+        error_rate (float): Fraction of requests answered with HTTP 429.
+    """
+
+    def __init__(self, port=0, ttft_ms=300.0, tokens_per_second=200.0, response_tokens=150, jitter=0.0, error_rate=0.0, host="127.0.0.1"):
+        self.ttft_ms = ttft_ms
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests_served = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+                    return
+
+                with server._lock:
+                    server.requests_served += 1
+                if server.error_rate and random.random() < server.error_rate:
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit"}})
+                    return
+
+                n_tokens = min(server.response_tokens, int(body.get("max_tokens") or server.response_tokens))
+                ttft = server.ttft_ms * (1.0 + random.uniform(-server.jitter, server.jitter))
+                time.sleep(max(ttft, 0.0) / 1000.0)
+                if body.get("stream"):
+                    self._stream(body.get("model", "fake"), n_tokens)
+                else:
+                    time.sleep(n_tokens / server.tokens_per_second if server.tokens_per_second else 0)
+                    self._send_json(200, self._completion(body.get("model", "fake"), n_tokens))
+
+            def _stream(self, model, n_tokens):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                interval = 1.0 / server.tokens_per_second if server.tokens_per_second else 0.0
+                self.close_connection = True
+                try:
+                    for i in range(n_tokens):
+                        if i and interval:
+                            time.sleep(interval)
+                        word = FILLER_WORDS[i % len(FILLER_WORDS)]
+                        self._write_event(_chunk(completion_id, model, {"content": (" " if i else "") + word}, None))
+                    self._write_event(_chunk(completion_id, model, {}, "stop"))
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client stopped reading, e.g. an abandoned hedged request
+
+            def _write_event(self, payload):
+                self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def _completion(self, model, n_tokens):
+                text = " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(n_tokens))
+                return {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": n_tokens, "total_tokens": n_tokens},
+                }
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _chunk(completion_id, model, delta, finish_reason):
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake streaming LLM server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=150)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeLLMServer(
+        port=args.port,
+        ttft_ms=args.ttft_ms,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+    )
+    print(f"Fake LLM listening on {fake.base_url} (set GROQ_BASE_URL to this URL)")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
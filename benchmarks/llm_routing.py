@@ -0,0 +1,104 @@
+# benchmarks/llm_routing.py
+#
+# Exercises llm_providers.LLMRouter offline against local fake LLM servers:
+# fallback from a provider that always answers 429, latency-aware routing away
+# from a degraded provider, and the same with hedged requests:
+#
+#     python -m benchmarks.llm_routing --requests 40 --slow-ttft-ms 3000 --fast-ttft-ms 300
+
+import argparse
+import time
+
+from benchmarks.common import latency_summary, save_results
+from benchmarks.fake_llm import FakeLLMServer
+from llm_providers import LLMRouter, OpenAICompatibleProvider
+
+MESSAGES = [
+    {"role": "system", "content": "You are an AI expert on Tallman Equipment."},
+    {"role": "user", "content": "What fall protection do you sell?"},
+]
+
+
+def run_scenario(router: LLMRouter, requests: int, max_tokens: int) -> dict:
+    """
+    Sends requests one after another and records time to first chunk and total time.
+    """
+    ttfts, totals, errors = [], [], 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        first = None
+        try:
+            for _chunk in router.stream_chat(MESSAGES, max_tokens=max_tokens):
+                if first is None:
+                    first = time.perf_counter() - start
+        except Exception as e:
+            errors += 1
+            print(f"Request failed: {e}")
+            continue
+        ttfts.append(first if first is not None else time.perf_counter() - start)
+        totals.append(time.perf_counter() - start)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "ttft": latency_summary(ttfts),
+        "total": latency_summary(totals),
+        "providers": {
+            name: {"ttft_ewma_ms": (stats.ttft_ewma or 0.0) * 1000.0, "error_ewma": stats.error_ewma}
+            for name, stats in router.stats.items()
+        },
+    }
+
+
+def print_row(name: str, outcome: dict):
+    ttft = outcome["ttft"]
+    print(
+        f"{name:<16} errors {outcome['errors']:3d}/{outcome['requests']:<3d}  ttft p50 {ttft.get('p50_ms', 0):7.1f} ms  "
+        f"p95 {ttft.get('p95_ms', 0):7.1f} ms  max {ttft.get('max_ms', 0):7.1f} ms"
+    )
+
+
+def run(args):
+    servers = {
+        "failing": FakeLLMServer(ttft_ms=args.fast_ttft_ms, error_rate=1.0),
+        "slow": FakeLLMServer(ttft_ms=args.slow_ttft_ms, tokens_per_second=args.tokens_per_second, response_tokens=args.response_tokens),
+        "fast": FakeLLMServer(ttft_ms=args.fast_ttft_ms, jitter=0.2, tokens_per_second=args.tokens_per_second, response_tokens=args.response_tokens),
+    }
+    for server in servers.values():
+        server.start()
+
+    def provider(name):
+        return OpenAICompatibleProvider(name, f"{servers[name].base_url}/v1", "fake")
+
+    scenarios = {
+        # Each scenario gets a fresh router so no latency statistics carry over
+        "fallback": lambda: LLMRouter([provider("failing"), provider("fast")]),
+        "routing": lambda: LLMRouter([provider("slow"), provider("fast")]),
+        "routing+hedge": lambda: LLMRouter([provider("slow"), provider("fast")], hedge=True, hedge_min_seconds=args.hedge_min_ms / 1000.0),
+    }
+    results = {}
+    try:
+        for name, make_router in scenarios.items():
+            results[name] = run_scenario(make_router(), args.requests, args.response_tokens)
+            print_row(name, results[name])
+    finally:
+        for server in servers.values():
+            server.stop()
+    return {"config": vars(args), "scenarios": results, "requests_served": {name: server.requests_served for name, server in servers.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline check of LLM provider fallback, routing and hedging.")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--fast-ttft-ms", type=float, default=300.0)
+    parser.add_argument("--slow-ttft-ms", type=float, default=3000.0)
+    parser.add_argument("--hedge-min-ms", type=float, default=800.0)
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--response-tokens", type=int, default=50)
+    args = parser.parse_args()
+
+    results = run(args)
+    save_results("llm_routing", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+# benchmarks/load_test.py
+#
+# Simulates N concurrent Streamlit users driving main.py's real callbacks
+# (login -> ask -> correct) against a fake LLM, in a scratch copy of the
+# data directories so the real qa_data.txt and chroma_db are never touched:
+#
+#     python -m benchmarks.load_test --users 50 --questions-per-user 5 --think-time 2
+
+import argparse
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from benchmarks.common import (
+    QA_DATA_PATH,
+    REPO_ROOT,
+    add_llm_limit_arguments,
+    install_llm_scheduler,
+    latency_summary,
+    peak_rss_mb,
+    sample_questions,
+    save_results,
+)
+from benchmarks.fake_llm import FakeLLMServer
+
+LOAD_TEST_PIN = "1234"
+
+
+# ============================
+# Per-Thread Session State
+# ============================
+class SimulatedSessionState(dict):
+    """
+    A dict with attribute access, standing in for one browser session's st.session_state.
+    """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class ThreadSessionStateProxy:
+    """
+    Routes st.session_state to the calling thread's simulated session.
+
+    Outside of `streamlit run` Streamlit hands out a fresh, empty session state
+    on every access, so each simulated user thread installs its own.
+    """
+
+    def __init__(self):
+        object.__setattr__(self, "_local", threading.local())
+
+    def bind(self, session: SimulatedSessionState):
+        self._local.session = session
+
+    @property
+    def _session(self) -> SimulatedSessionState:
+        return self._local.session
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._session, name, value)
+
+    def __delattr__(self, name):
+        delattr(self._session, name)
+
+    def __contains__(self, key):
+        return key in self._session
+
+    def __getitem__(self, key):
+        return self._session[key]
+
+    def __setitem__(self, key, value):
+        self._session[key] = value
+
+    def __delitem__(self, key):
+        del self._session[key]
+
+    def get(self, key, default=None):
+        return self._session.get(key, default)
+
+
+# ============================
+# Scratch Workspace
+# ============================
+def prepare_workspace(n_users: int) -> str:
+    """
+    Creates a working directory with a copy of the QA data and N approved users.
+    """
+    import bcrypt
+
+    workdir = tempfile.mkdtemp(prefix="tallman_load_")
+    os.makedirs(os.path.join(workdir, "QA_data"))
+    os.makedirs(os.path.join(workdir, "approved_user_list"))
+    shutil.copy(QA_DATA_PATH, os.path.join(workdir, "QA_data", "qa_data.txt"))
+    secrets_dir = os.path.join(REPO_ROOT, ".streamlit")
+    if os.path.isdir(secrets_dir):
+        shutil.copytree(secrets_dir, os.path.join(workdir, ".streamlit"))
+
+    # One hash shared by every simulated user keeps setup fast; login still pays bcrypt.checkpw
+    hashed_pin = bcrypt.hashpw(LOAD_TEST_PIN.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    with open(os.path.join(workdir, "approved_user_list", "approved_user_list.csv"), "w", encoding="utf-8") as csvfile:
+        csvfile.write("id,username,pin,email,role\n")
+        for i in range(n_users):
+            role = "admin" if i == 0 else "user"
+            csvfile.write(f"{i + 1},loaduser{i},{hashed_pin},loaduser{i}@example.com,{role}\n")
+    return workdir
+
+
+# ============================
+# Simulated User
+# ============================
+def simulate_user(user_index: int, args, main_module, proxy, questions: List[str], timings: Dict[str, List[float]], failures: Dict[str, int], sessions: List[int], lock: threading.Lock):
+    rng = random.Random(args.seed + user_index)
+    session = SimulatedSessionState()
+    proxy.bind(session)
+
+    def think():
+        if args.think_time > 0:
+            time.sleep(rng.expovariate(1.0 / args.think_time))
+
+    def timed(step, fn, succeeded):
+        start = time.perf_counter()
+        try:
+            fn()
+            ok = succeeded()
+        except Exception as e:
+            print(f"User {user_index} {step} failed: {e}")
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            timings.setdefault(step, []).append(elapsed)
+            if not ok:
+                failures[step] = failures.get(step, 0) + 1
+        return ok
+
+    session.user = None
+    session.screen = "login"
+    session.login_username = f"loaduser{user_index}"
+    session.login_pin = LOAD_TEST_PIN
+    if not timed("login", main_module.handle_login_callback, lambda: session.get("screen") == "qa"):
+        return
+
+    collection_holder = {}
+    if not timed("load_collection", lambda: collection_holder.setdefault("collection", main_module.get_collection()), lambda: collection_holder.get("collection") is not None):
+        return
+    collection = collection_holder["collection"]
+
+    for question in questions:
+        think()
+        session.qa_user_question_input = question
+        session.qa_query_type = rng.choice(["Tallman", "Sales", "Product", "Tutorial"])
+        session.pop("last_response", None)
+        answered = timed(
+            "answer",
+            lambda: main_module.handle_answer_callback(collection),
+            lambda: "last_response" in session and not session.last_response.startswith("Error generating AI response:"),
+        )
+        if answered and session.get("last_faq_match") is not None and rng.random() < args.ask_ai_rate:
+            think()
+            timed(
+                "ask_ai",
+                lambda: main_module.handle_ask_ai_callback(collection),
+                lambda: not session.last_response.startswith("Error generating AI response:"),
+            )
+        if answered and rng.random() < args.correction_rate:
+            think()
+            session.correct_correction_input = f"Load test correction from user {user_index}."
+            timed("correct", main_module.handle_correction_callback, lambda: True)
+
+    try:
+        with lock:
+            sessions.append(len(pickle.dumps({k: v for k, v in session.items() if k != "chroma_client"})))
+    except Exception:
+        pass
+
+
+def run(args):
+    import streamlit as st
+    import qa_module
+    import main as main_module
+    from query_log import QUERY_LOG_WRITER
+
+    proxy = ThreadSessionStateProxy()
+    original_session_state = st.session_state
+    original_cwd = os.getcwd()
+    original_qa_data_path = main_module.qa_data_path
+    original_queue_path = main_module.CORRECTION_QUEUE_PATH
+    original_query_log_path = QUERY_LOG_WRITER.path
+    original_base_url = qa_module.GROQ_BASE_URL
+    previous_scheduler = None
+    workdir = prepare_workspace(args.users)
+    fake = FakeLLMServer(ttft_ms=args.ttft_ms, tokens_per_second=args.tokens_per_second, response_tokens=args.response_tokens, jitter=0.2).start()
+    try:
+        st.session_state = proxy
+        os.chdir(workdir)
+        main_module.qa_data_path = os.path.join(workdir, "QA_data", "qa_data.txt")
+        main_module.CORRECTION_QUEUE_PATH = os.path.join(workdir, "QA_data", "correction_queue.sqlite3")
+        QUERY_LOG_WRITER.path = os.path.join(workdir, "QA_data", "query_log.jsonl")
+        qa_module.GROQ_BASE_URL = fake.base_url
+        llm_limits, previous_scheduler = install_llm_scheduler(args, True, args.users)
+
+        all_questions = sample_questions(args.users * args.questions_per_user, seed=args.seed, qa_data_path=main_module.qa_data_path)
+        timings: Dict[str, List[float]] = {}
+        failures: Dict[str, int] = {}
+        session_sizes: List[int] = []
+        lock = threading.Lock()
+        rss_before = peak_rss_mb()
+        cpu_before = time.process_time()
+
+        threads = []
+        start = time.perf_counter()
+        for i in range(args.users):
+            questions = all_questions[i * args.questions_per_user:(i + 1) * args.questions_per_user]
+            thread = threading.Thread(
+                target=simulate_user,
+                args=(i, args, main_module, proxy, questions, timings, failures, session_sizes, lock),
+                name=f"load-user-{i}",
+            )
+            threads.append(thread)
+            thread.start()
+            if args.ramp_up:
+                time.sleep(args.ramp_up / args.users)
+        for thread in threads:
+            thread.join()
+        wall_seconds = time.perf_counter() - start
+        # Process CPU, including the in-process fake LLM (which mostly sleeps)
+        cpu_seconds = time.process_time() - cpu_before
+        interactions = sum(len(values) for values in timings.values())
+        rss_after = peak_rss_mb()
+
+        answers = len(timings.get("answer", []))
+        return {
+            "config": vars(args),
+            "wall_seconds": wall_seconds,
+            "answers_per_second": answers / wall_seconds if wall_seconds else 0.0,
+            "steps": {step: latency_summary(values) for step, values in timings.items()},
+            "failures": failures,
+            "cpu_seconds": cpu_seconds,
+            "cpu_ms_per_interaction": (cpu_seconds * 1000 / interactions) if interactions else None,
+            "peak_rss_mb": rss_after,
+            "rss_growth_per_session_mb": ((rss_after - rss_before) / args.users) if rss_before is not None and rss_after is not None else None,
+            "session_state_bytes_mean": (sum(session_sizes) / len(session_sizes)) if session_sizes else None,
+            "llm_limits": llm_limits,
+        }
+    finally:
+        qa_module.GROQ_BASE_URL = original_base_url
+        if previous_scheduler is not None:
+            qa_module.LLM_SCHEDULER = previous_scheduler
+        fake.stop()
+        st.session_state = original_session_state
+        main_module.qa_data_path = original_qa_data_path
+        main_module.CORRECTION_QUEUE_PATH = original_queue_path
+        QUERY_LOG_WRITER.path = original_query_log_path
+        os.chdir(original_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent user load test for the QA app.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--questions-per-user", type=int, default=3)
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean seconds between actions (exponential).")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which to start all users.")
+    parser.add_argument("--correction-rate", type=float, default=0.1, help="Probability a user corrects an answer.")
+    parser.add_argument("--ask-ai-rate", type=float, default=0.2, help="Probability a user asks the AI after a direct FAQ answer.")
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=0)
+    add_llm_limit_arguments(parser)
+    args = parser.parse_args()
+
+    results = run(args)
+    print(f"{args.users} users, {results['answers_per_second']:.2f} answers/s over {results['wall_seconds']:.1f}s")
+    for step, stats in sorted(results["steps"].items()):
+        print(
+            f"  {step:<16} n={stats['count']:<5} p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  "
+            f"max {stats['max_ms']:8.1f} ms  failures {results['failures'].get(step, 0)}"
+        )
+    print(f"  peak RSS {results['peak_rss_mb']} MB, growth/session {results['rss_growth_per_session_mb']} MB")
+    save_results("load_test", results)
+
+
+if __name__ == "__main__":
+    main()
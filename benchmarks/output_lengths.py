@@ -0,0 +1,75 @@
+# benchmarks/output_lengths.py
+#
+# Summarizes response lengths per subject from the "generation" spans in the
+# trace log (app.log), to tune the max_tokens of each generation profile:
+#
+#     python -m benchmarks.output_lengths --log app.log
+#
+# A subject whose responses often hit max_tokens needs a larger budget; one
+# whose p99 sits far below it can reserve less.
+
+import argparse
+import json
+import math
+from typing import Dict, List
+
+from benchmarks.common import save_results
+from generation_profiles import SUBJECT_NAMES
+from tracing import TRACE_LOG_PATH, percentile
+
+
+def read_generations(log_path: str) -> Dict[str, List[Dict]]:
+    generations: Dict[str, List[Dict]] = {}
+    with open(log_path, "r", encoding="utf-8") as log_file:
+        for line in log_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict) or record.get("span") != "generation" or "output_tokens" not in record:
+                continue
+            subject = record.get("subject")
+            generations.setdefault(SUBJECT_NAMES.get(subject, str(subject)), []).append(record)
+    return generations
+
+
+def summarize_subject(records: List[Dict], headroom: float) -> Dict:
+    lengths = sorted(float(record["output_tokens"]) for record in records)
+    durations = sorted(float(record["duration_ms"]) for record in records)
+    p99 = percentile(lengths, 99)
+    return {
+        "count": len(records),
+        "max_tokens": max(int(record.get("max_tokens", 0)) for record in records),
+        "p50_tokens": percentile(lengths, 50),
+        "p95_tokens": percentile(lengths, 95),
+        "p99_tokens": p99,
+        "hit_limit_rate": sum(1 for record in records if record.get("hit_limit")) / len(records),
+        "p50_generation_ms": percentile(durations, 50),
+        # Rounded up to a multiple of 32 tokens
+        "suggested_max_tokens": int(math.ceil(p99 * headroom / 32.0) * 32),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response lengths per subject, for tuning generation profiles.")
+    parser.add_argument("--log", default=TRACE_LOG_PATH)
+    parser.add_argument("--headroom", type=float, default=1.2, help="Suggested max_tokens as a multiple of the p99 length.")
+    args = parser.parse_args()
+
+    generations = read_generations(args.log)
+    if not generations:
+        print(f"No generation spans with output_tokens found in {args.log}")
+        return
+    results = {}
+    print(f"{'subject':<9}{'count':>7}{'max':>7}{'p50':>7}{'p95':>7}{'p99':>7}{'at max':>8}{'p50 ms':>9}{'suggest':>9}")
+    for subject, records in sorted(generations.items()):
+        row = results[subject] = summarize_subject(records, args.headroom)
+        print(
+            f"{subject:<9}{row['count']:>7}{row['max_tokens']:>7}{row['p50_tokens']:>7.0f}{row['p95_tokens']:>7.0f}"
+            f"{row['p99_tokens']:>7.0f}{row['hit_limit_rate']:>8.1%}{row['p50_generation_ms']:>9.0f}{row['suggested_max_tokens']:>9}"
+        )
+    save_results("output_lengths", {"config": vars(args), "subjects": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# benchmarks/run_benchmark.py
+#
+# Replays sampled corpus questions through query_chroma and generate_ai_response
+# against a fake LLM server, e.g.:
+#
+#     python -m benchmarks.run_benchmark --questions 200 --concurrency 8 --ttft-ms 400
+
+import argparse
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import (
+    QA_DATA_PATH,
+    add_llm_limit_arguments,
+    install_llm_scheduler,
+    latency_summary,
+    load_previous_results,
+    peak_rss_mb,
+    print_comparison,
+    sample_questions,
+    save_results,
+)
+from benchmarks.fake_llm import FakeLLMServer
+
+
+def run(args):
+    import qa_module
+    import query_cache
+    from metrics import LLM_TOKENS
+
+    if args.no_cache:
+        query_cache.QUERY_VECTOR_CACHE.maxsize = 0
+        query_cache.RETRIEVAL_CACHE.maxsize = 0
+
+    persist_dir = args.persist_dir or tempfile.mkdtemp(prefix="tallman_bench_")
+    fake = None
+    previous_scheduler = None
+    original_base_url = qa_module.GROQ_BASE_URL
+    try:
+        if args.fake_llm_url:
+            qa_module.GROQ_BASE_URL = args.fake_llm_url
+        elif args.llm_base_url:
+            qa_module.GROQ_BASE_URL = args.llm_base_url
+        elif not args.real_llm:
+            fake = FakeLLMServer(
+                ttft_ms=args.ttft_ms,
+                tokens_per_second=args.tokens_per_second,
+                response_tokens=args.response_tokens,
+                jitter=args.jitter,
+            ).start()
+            qa_module.GROQ_BASE_URL = fake.base_url
+        # Only fake servers are unlimited; any other server keeps the configured limits
+        fake_llm = fake is not None or bool(args.fake_llm_url)
+        llm_limits, previous_scheduler = install_llm_scheduler(args, fake_llm, args.concurrency)
+
+        build_start = time.perf_counter()
+        collection, client = qa_module.ensure_database(args.collection, QA_DATA_PATH, persist_dir, args.max_lines_per_chunk, backend=args.backend)
+        build_seconds = time.perf_counter() - build_start
+
+        questions = sample_questions(args.questions, seed=args.seed)
+        for question in questions[: args.warmup]:
+            qa_module.query_chroma(question, collection, n_results=args.n_results)
+
+        prompt_tokens_before = LLM_TOKENS.value(kind="prompt")
+        completion_tokens_before = LLM_TOKENS.value(kind="completion")
+
+        def one_request(question):
+            start = time.perf_counter()
+            snippets = qa_module.query_chroma(question, collection, n_results=args.n_results)
+            retrieved = time.perf_counter()
+            response = ""
+            if not args.retrieval_only:
+                response = qa_module.generate_ai_response(question, snippets, args.subject)
+            finished = time.perf_counter()
+            failed = response.startswith("Error generating AI response:")
+            return retrieved - start, finished - retrieved, finished - start, failed
+
+        run_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            outcomes = list(pool.map(one_request, questions))
+        wall_seconds = time.perf_counter() - run_start
+
+        n_requests = len(outcomes)
+        prompt_tokens = LLM_TOKENS.value(kind="prompt") - prompt_tokens_before
+        completion_tokens = LLM_TOKENS.value(kind="completion") - completion_tokens_before
+        results = {
+            "config": {
+                key: value for key, value in vars(args).items() if key not in ("persist_dir",)
+            },
+            "index_build_seconds": build_seconds,
+            "requests": n_requests,
+            "errors": sum(1 for outcome in outcomes if outcome[3]),
+            "wall_seconds": wall_seconds,
+            "qps": n_requests / wall_seconds if wall_seconds else 0.0,
+            "retrieval": latency_summary([outcome[0] for outcome in outcomes]),
+            "generation": latency_summary([outcome[1] for outcome in outcomes]),
+            "total": latency_summary([outcome[2] for outcome in outcomes]),
+            "tokens_per_request": {
+                "prompt": prompt_tokens / n_requests if n_requests else 0.0,
+                "completion": completion_tokens / n_requests if n_requests else 0.0,
+            },
+            "peak_rss_mb": peak_rss_mb(),
+            "llm_limits": llm_limits,
+        }
+        qa_module.close_chroma_client(client)
+        return results
+    finally:
+        qa_module.GROQ_BASE_URL = original_base_url
+        if previous_scheduler is not None:
+            qa_module.LLM_SCHEDULER = previous_scheduler
+        if fake is not None:
+            fake.stop()
+        if not args.persist_dir:
+            shutil.rmtree(persist_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline QA pipeline benchmark with a fake LLM.")
+    parser.add_argument("--name", default="pipeline", help="Result file prefix.")
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--subject", type=int, default=1, help="Prompt subject index passed to generate_ai_response.")
+    parser.add_argument("--max-lines-per-chunk", type=int, default=100)
+    parser.add_argument("--collection", default="benchmark_knowledge")
+    parser.add_argument("--backend", default=None, help="Retrieval backend (INDEX_MODE value); defaults to the configured one.")
+    parser.add_argument("--persist-dir", default=None, help="Reuse an existing index directory instead of a temporary one.")
+    parser.add_argument("--retrieval-only", action="store_true", help="Skip generation.")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the query embedding and retrieval caches.")
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=150)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--fake-llm-url", default=None, help="Use an already running fake server; limits default to none as with the built-in one.")
+    parser.add_argument("--llm-base-url", default=None, help="Use an already running OpenAI-compatible server with the configured limits.")
+    parser.add_argument("--real-llm", action="store_true", help="Call the configured provider instead of the fake server.")
+    add_llm_limit_arguments(parser)
+    args = parser.parse_args()
+
+    results = run(args)
+    print(
+        f"{results['requests']} requests in {results['wall_seconds']:.2f}s "
+        f"({results['qps']:.2f} QPS, {results['errors']} errors)"
+    )
+    for stage in ("retrieval", "generation", "total"):
+        stats = results[stage]
+        if stats.get("count"):
+            print(f"  {stage:<12} p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms")
+    print(f"  tokens/request prompt {results['tokens_per_request']['prompt']:.0f} completion {results['tokens_per_request']['completion']:.0f}")
+    print(f"  peak RSS {results['peak_rss_mb']} MB, LLM limits {results['llm_limits']}")
+
+    path = save_results(args.name, results)
+    print_comparison(
+        results,
+        load_previous_results(args.name, exclude=path),
+        ["qps", "retrieval.p50_ms", "retrieval.p95_ms", "total.p50_ms", "total.p95_ms", "total.p99_ms", "peak_rss_mb"],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/startup_profile.py
+#
+# Guards login-screen cold start: imports main.py in a fresh interpreter under
+# `python -X importtime` and fails if the retrieval/LLM stack is pulled in or
+# the import takes longer than the budget:
+#
+#     python -m benchmarks.startup_profile --budget-ms 2500
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from benchmarks.common import REPO_ROOT, save_results
+
+# Modules the login, new-account and reset-password screens must not need
+DEFERRED_MODULES = ("qa_module", "chromadb", "groq", "tiktoken", "pandas", "spacy", "en_core_web_sm", "onnxruntime")
+
+PROBE = "import json, sys, main; print(json.dumps(sorted(sys.modules)))"
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Parses `-X importtime` output into {module: (self_us, cumulative_us)}.
+    """
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if len(parts) != 3 or not parts[0].isdigit():
+            continue
+        timings[parts[2].strip()] = (int(parts[0]), int(parts[1]))
+    return timings
+
+
+def profile_startup() -> Dict:
+    env = dict(os.environ, METRICS_PORT="0")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing main failed:\n{completed.stderr[-2000:]}")
+    loaded = json.loads(completed.stdout.strip().splitlines()[-1])
+    timings = parse_importtime(completed.stderr)
+    slowest = sorted(timings.items(), key=lambda item: -item[1][0])[:15]
+    return {
+        "main_cumulative_ms": timings.get("main", (0, 0))[1] / 1000.0,
+        "deferred_modules_loaded": [name for name in DEFERRED_MODULES if name in loaded],
+        "slowest_self_ms": {name: self_us / 1000.0 for name, (self_us, _) in slowest},
+        "modules_loaded": len(loaded),
+    }
+
+
+def check(result: Dict, budget_ms: float) -> List[str]:
+    problems = []
+    if result["deferred_modules_loaded"]:
+        problems.append(f"login screen imports deferred modules: {', '.join(result['deferred_modules_loaded'])}")
+    if result["main_cumulative_ms"] > budget_ms:
+        problems.append(f"import main took {result['main_cumulative_ms']:.0f} ms (budget {budget_ms:.0f} ms)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile main.py import time for the login screen.")
+    parser.add_argument("--budget-ms", type=float, default=2500.0, help="Maximum cumulative import time of main.")
+    parser.add_argument("--save", action="store_true", help="Store the profile under benchmarks/results/.")
+    args = parser.parse_args()
+
+    result = profile_startup()
+    print(f"import main: {result['main_cumulative_ms']:.0f} ms cumulative, {result['modules_loaded']} modules loaded")
+    for name, self_ms in result["slowest_self_ms"].items():
+        print(f"  {self_ms:8.1f} ms  {name}")
+    if args.save:
+        save_results("startup", dict(result, budget_ms=args.budget_ms))
+
+    problems = check(result, args.budget_ms)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# chunk_metadata.py
+
+import re
+from typing import Dict, List, Optional
+
+# Retrieved chunks are cut to this many characters before they enter a prompt
+SNIPPET_MAX_CHARS = 2000
+QUESTION_PREFIXES = ("USER QUESTION:", "QUESTION:")
+# Newlines separate the per-entry values of a metadata field; ChromaDB only stores scalars
+FIELD_SEPARATOR = "\n"
+
+_ENTRY_BREAK = re.compile(r"\n\s*\n")
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        import tiktoken
+
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_tokens(texts: List[str]) -> List[int]:
+    """
+    Counts cl100k_base tokens, the tokenizer prompt assembly budgets with.
+    """
+    return [len(tokens) for tokens in _get_encoding().encode_ordinary_batch(texts)]
+
+
+def _entries(document: str) -> List[Dict]:
+    breaks = list(_ENTRY_BREAK.finditer(document))
+    starts = [0] + [match.end() for match in breaks]
+    ends = [match.start() for match in breaks] + [len(document)]
+    entries = []
+    for start, end in zip(starts, ends):
+        lines = [line.strip() for line in document[start:end].split("\n")]
+        question_index = next(
+            (i for i, line in enumerate(lines) if any(line.upper().startswith(prefix) for prefix in QUESTION_PREFIXES)), None
+        )
+        if question_index is None:
+            continue
+        question = lines[question_index]
+        # Ingested lines read "USER QUESTION: QUESTION: ..."; drop every label
+        prefix = next((prefix for prefix in QUESTION_PREFIXES if question.upper().startswith(prefix)), None)
+        while prefix is not None:
+            question = question[len(prefix):].strip()
+            prefix = next((prefix for prefix in QUESTION_PREFIXES if question.upper().startswith(prefix)), None)
+        entries.append({
+            "offset": start,
+            "date": lines[question_index - 1] if question_index > 0 else "",
+            "question": question,
+        })
+    return entries
+
+
+def describe_chunks(documents: List[str], sources: List[str]) -> List[Dict]:
+    """
+    Builds the metadata stored with each chunk at ingestion, so retrieval
+    results can be budgeted and cited without re-tokenizing or re-parsing:
+
+    - source: where the chunk came from, as before.
+    - tokens: tokens of the text that enters the prompt (the first SNIPPET_MAX_CHARS characters).
+    - entries: number of QA entries in the chunk.
+    - date_from, date_to: the range of the entries' dates.
+    - dates, questions: each entry's date and question, newline-separated.
+    - offsets: each entry's character offset in the chunk, comma-separated.
+    - span_tokens: for each entry context_compression splits the snippet into,
+      the tokens of its question header and of each answer sentence,
+      comma-separated; entries newline-separated.
+    """
+    snippets = [document[:SNIPPET_MAX_CHARS] for document in documents]
+    token_counts = count_tokens(snippets)
+    span_counts = _span_tokens(snippets)
+    metadatas = []
+    for document, source, tokens, spans in zip(documents, sources, token_counts, span_counts):
+        entries = _entries(document)
+        dates = sorted(entry["date"] for entry in entries if entry["date"])
+        metadatas.append({
+            "source": source,
+            "tokens": tokens,
+            "entries": len(entries),
+            "date_from": dates[0] if dates else "",
+            "date_to": dates[-1] if dates else "",
+            "dates": FIELD_SEPARATOR.join(entry["date"] for entry in entries),
+            "questions": FIELD_SEPARATOR.join(entry["question"] for entry in entries),
+            "offsets": ",".join(str(entry["offset"]) for entry in entries),
+            "span_tokens": FIELD_SEPARATOR.join(",".join(str(count) for count in entry) for entry in spans),
+        })
+    return metadatas
+
+
+def _span_tokens(snippets: List[str]) -> List[List[List[int]]]:
+    # Split exactly as compress_context splits at query time, so the counts line up
+    from context_compression import entry_spans, split_snippets
+
+    entries = split_snippets(snippets)
+    texts = [entry_spans(entry) for entry in entries]
+    counts = iter(count_tokens([text for spans in texts for text in spans]))
+    per_snippet = [[] for _ in snippets]
+    for entry, spans in zip(entries, texts):
+        per_snippet[entry.order[0]].append([next(counts) for _ in spans])
+    return per_snippet
+
+
+def chunk_entries(metadata: Optional[Dict]) -> List[Dict]:
+    """
+    Returns a chunk's entries ({"offset", "date", "question"}) from its
+    metadata, or an empty list for chunks ingested without it.
+    """
+    if not metadata or not metadata.get("offsets"):
+        return []
+    offsets = [int(offset) for offset in metadata["offsets"].split(",")]
+    dates = metadata.get("dates", "").split(FIELD_SEPARATOR)
+    questions = metadata.get("questions", "").split(FIELD_SEPARATOR)
+    return [
+        {"offset": offset, "date": date, "question": question}
+        for offset, date, question in zip(offsets, dates, questions)
+    ]
+
+
+def entry_span_tokens(metadata: Optional[Dict]) -> Optional[List[List[int]]]:
+    """
+    Returns a chunk's span token counts (see describe_chunks) per entry, or
+    None for chunks ingested without them.
+    """
+    if not metadata or metadata.get("span_tokens") is None:
+        return None
+    if not metadata["span_tokens"]:
+        return []
+    return [[int(count) for count in entry.split(",")] for entry in metadata["span_tokens"].split(FIELD_SEPARATOR)]
+
+
+def snippet_tokens(snippets: List[str], metadatas: List[Optional[Dict]]) -> List[int]:
+    """
+    Token counts of retrieved snippets, read from their metadata where
+    ingestion stored them and counted only for the rest.
+    """
+    counts = [metadata.get("tokens") if metadata else None for metadata in metadatas]
+    missing = [i for i, count in enumerate(counts) if count is None]
+    if missing:
+        for i, count in zip(missing, count_tokens([snippets[i] for i in missing])):
+            counts[i] = count
+    return counts
+
+
+def cite_sources(metadatas: List[Optional[Dict]]) -> List[Dict]:
+    """
+    Source citations for retrieved chunks: {"source", "date_from", "date_to",
+    "questions"} per chunk that has metadata.
+    """
+    return [
+        {
+            "source": metadata.get("source", ""),
+            "date_from": metadata.get("date_from", ""),
+            "date_to": metadata.get("date_to", ""),
+            "questions": [entry["question"] for entry in chunk_entries(metadata)],
+        }
+        for metadata in metadatas
+        if metadata
+    ]
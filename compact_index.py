@@ -0,0 +1,526 @@
+# compact_index.py
+#
+# An optional compact serving copy of a ChromaDB collection (INDEX_MODE=compact)
+# and garbage collection of orphaned ChromaDB segment directories. Maintenance:
+#
+#     python compact_index.py gc chroma_db --dry-run
+#     python compact_index.py stats chroma_db/compact/tallman_knowledge_v2
+
+import argparse
+import datetime
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from retrieval_backends import RetrievalBackend
+
+COMPACT_DIRNAME = "compact"
+# Directories of files derived from a collection, named after it and removed with it
+DERIVED_DIRNAMES = (COMPACT_DIRNAME, "snapshots", "faq")
+MANIFEST_FILE = "manifest.json"
+CODES_FILE = "codes.npy"          # int8 (N, D), held in memory
+SCALES_FILE = "scales.npy"        # float32 (D,), per-dimension dequantization scale
+NORMS_FILE = "norms.npy"          # float32 (N,), squared L2 norms of the float vectors
+VECTORS_FILE = "vectors.npy"      # float32 (N, D), memory-mapped for re-scoring only
+RECORDS_FILE = "records.json"     # ids, documents, metadatas
+OVERLAY_FILE = "overlay.jsonl"    # writes made after the build
+
+# Rows scored per block in the int8 pass, bounding the float32 scratch memory
+SCAN_BLOCK_ROWS = 8192
+
+_UUID_DIR = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def compact_directory(persist_directory: str, collection_name: str) -> str:
+    return os.path.join(persist_directory, COMPACT_DIRNAME, collection_name)
+
+
+def quantize(vectors: np.ndarray):
+    """
+    Symmetric per-dimension int8 quantization.
+
+    Returns:
+        tuple: (codes int8 (N, D), scales float32 (D,)) with vectors ~= codes * scales.
+    """
+    scales = np.abs(vectors).max(axis=0) / 127.0 if len(vectors) else np.ones(vectors.shape[1], dtype=np.float32)
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def _distance_space(collection) -> str:
+    metadata = getattr(collection, "metadata", None) or {}
+    return metadata.get("hnsw:space", "l2")
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+# ============================
+# Building
+# ============================
+def export_records(collection, page_size: int = 1000):
+    """
+    Reads every record of a collection, page by page.
+
+    Vectors are normalized for cosine collections, so a dot product gives the
+    similarity directly.
+
+    Returns:
+        tuple: (ids, documents, metadatas, float32 vectors (N, D), distance space).
+    """
+    ids, documents, metadatas, embeddings = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"] or [None] * len(page["ids"]))
+        embeddings.extend(page["embeddings"])
+        offset += len(page["ids"])
+
+    space = _distance_space(collection)
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if vectors.ndim != 2:  # Empty collection
+        vectors = vectors.reshape(0, 0)
+    if space == "cosine":
+        vectors = _normalize_rows(vectors)
+    return ids, documents, metadatas, vectors, space
+
+
+def build_compact_index(collection, directory: str, page_size: int = 1000) -> Dict:
+    """
+    Exports a collection's embeddings and documents into a compact index directory.
+
+    The files are written to a temporary directory and moved into place, so a
+    reader never sees a partial index.
+
+    Returns:
+        Dict: The manifest.
+    """
+    ids, documents, metadatas, vectors, space = export_records(collection, page_size)
+    codes, scales = quantize(vectors)
+
+    temp_directory = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(temp_directory, ignore_errors=True)
+    os.makedirs(temp_directory)
+    np.save(os.path.join(temp_directory, CODES_FILE), codes)
+    np.save(os.path.join(temp_directory, SCALES_FILE), scales)
+    np.save(os.path.join(temp_directory, NORMS_FILE), np.einsum("ij,ij->i", vectors, vectors).astype(np.float32))
+    np.save(os.path.join(temp_directory, VECTORS_FILE), vectors)
+    with open(os.path.join(temp_directory, RECORDS_FILE), "w", encoding="utf-8") as records_file:
+        json.dump({"ids": ids, "documents": documents, "metadatas": metadatas}, records_file)
+    manifest = {
+        "collection": collection.name,
+        "count": len(ids),
+        "dimension": int(vectors.shape[1]),
+        "space": space,
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "bytes": {
+            "codes": int(codes.nbytes),
+            "vectors": int(vectors.nbytes),
+        },
+    }
+    with open(os.path.join(temp_directory, MANIFEST_FILE), "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(os.path.dirname(directory) or ".", exist_ok=True)
+    os.replace(temp_directory, directory)
+    print(
+        f"Built compact index for '{collection.name}': {len(ids)} vectors, "
+        f"{codes.nbytes / 1e6:.1f} MB in memory, {vectors.nbytes / 1e6:.1f} MB mapped for re-scoring."
+    )
+    return manifest
+
+
+# ============================
+# Serving
+# ============================
+class CompactCollection(RetrievalBackend):
+    """
+    Serves nearest-neighbour queries for a ChromaDB collection from int8 codes.
+
+    Every vector is scored against its int8 code, then the best
+    n_results * oversample candidates are re-scored with their float32 vectors,
+    read from a memory-mapped file, so only the int8 codes stay resident and the
+    HNSW index is never loaded for reads. Distances match the collection's
+    space (squared L2 by default).
+
+    Writes go to the ChromaDB collection, the source of truth for rebuilds, and
+    to an in-memory overlay journaled to overlay.jsonl, so they are searchable
+    immediately and survive a restart; deletes are journaled as tombstones.
+    Anything else (get, update, ...) is forwarded to the ChromaDB collection.
+
+    Args:
+        collection: The ChromaDB collection the index was built from.
+        directory (str): The compact index directory.
+        oversample (int): Candidates re-scored per requested result.
+    """
+
+    def __init__(self, collection, directory: str, oversample: int = 4):
+        self._source = collection
+        self.directory = directory
+        self.oversample = max(1, oversample)
+        with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as manifest_file:
+            self.manifest = json.load(manifest_file)
+        self.space = self.manifest["space"]
+        self._codes = np.load(os.path.join(directory, CODES_FILE))
+        self._scales = np.load(os.path.join(directory, SCALES_FILE))
+        self._norms = np.load(os.path.join(directory, NORMS_FILE))
+        self._vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+        with open(os.path.join(directory, RECORDS_FILE), "r", encoding="utf-8") as records_file:
+            records = json.load(records_file)
+        self._ids: List[str] = records["ids"]
+        self._documents: List[str] = records["documents"]
+        self._metadatas: List[Optional[dict]] = records["metadatas"]
+        self._row_of = {record_id: row for row, record_id in enumerate(self._ids)}
+
+        self._lock = threading.Lock()
+        self._overlay: Dict[str, tuple] = {}
+        self._masked = np.zeros(len(self._ids), dtype=bool)
+        self._load_overlay()
+
+    @classmethod
+    def open(cls, collection, persist_directory: str, oversample: int = 4):
+        """
+        Opens the compact index for a collection, building it first if missing.
+        """
+        directory = compact_directory(persist_directory, collection.name)
+        if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+            build_compact_index(collection, directory)
+        return cls(collection, directory, oversample)
+
+    @property
+    def name(self) -> str:
+        return self._source.name
+
+    @property
+    def source(self):
+        return self._source
+
+    def __getattr__(self, name):
+        # Only reached for attributes not defined here (get, update, _embedding_function, ...)
+        if name.startswith("__") or "_source" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self._source, name)
+
+    def count(self) -> int:
+        with self._lock:
+            return int(len(self._ids) - self._masked.sum() + len(self._overlay))
+
+    # ============================
+    # Queries
+    # ============================
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, include=("documents", "distances"), where=None, where_document=None, **kwargs):
+        """
+        Chroma-compatible query over the compact index.
+
+        Metadata and document filters are not indexed here and are answered by
+        the ChromaDB collection instead.
+        """
+        if where or where_document or kwargs:
+            return self._source.query(
+                query_embeddings=query_embeddings, query_texts=query_texts, n_results=n_results,
+                include=list(include), where=where, where_document=where_document, **kwargs
+            )
+        if query_embeddings is None:
+            query_embeddings = self._source._embedding_function(list(query_texts))
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query_embedding in query_embeddings:
+            hits = self._search(np.asarray(query_embedding, dtype=np.float32), n_results)
+            results["ids"].append([hit[0] for hit in hits])
+            results["documents"].append([hit[1] for hit in hits])
+            results["metadatas"].append([hit[2] for hit in hits])
+            results["distances"].append([hit[3] for hit in hits])
+        for key in ("documents", "metadatas", "distances"):
+            if key not in include:
+                results[key] = None
+        results["embeddings"] = None
+        return results
+
+    def _distances(self, dots: np.ndarray, norms: np.ndarray, query_norm: float) -> np.ndarray:
+        if self.space == "l2":
+            return norms - 2.0 * dots + query_norm
+        return 1.0 - dots
+
+    def _search(self, query: np.ndarray, n_results: int) -> List[tuple]:
+        if self.space == "cosine":
+            query = query / (np.linalg.norm(query) or 1.0)
+        query_norm = float(query @ query)
+        with self._lock:
+            masked = self._masked.copy()
+            overlay = list(self._overlay.items())
+
+        hits = []
+        n_rows = len(self._ids)
+        if n_rows and n_results > 0:
+            # Approximate pass: int8 codes against the query scaled per dimension
+            scaled_query = query * self._scales
+            dots = np.empty(n_rows, dtype=np.float32)
+            for start in range(0, n_rows, SCAN_BLOCK_ROWS):
+                block = self._codes[start:start + SCAN_BLOCK_ROWS]
+                dots[start:start + len(block)] = block.astype(np.float32) @ scaled_query
+            approximate = self._distances(dots, self._norms, query_norm)
+            approximate[masked] = np.inf
+
+            n_candidates = min(n_rows, n_results * self.oversample)
+            candidates = np.argpartition(approximate, n_candidates - 1)[:n_candidates]
+            candidates = candidates[np.isfinite(approximate[candidates])]
+
+            # Exact pass: float32 vectors for the candidates only
+            candidates.sort()  # Sequential reads from the mapped file
+            exact = self._distances(np.asarray(self._vectors[candidates]) @ query, self._norms[candidates], query_norm)
+            hits.extend(
+                (self._ids[row], self._documents[row], self._metadatas[row], float(distance))
+                for row, distance in zip(candidates.tolist(), exact.tolist())
+            )
+
+        for record_id, (vector, document, metadata, norm) in overlay:
+            distance = float(self._distances(np.float32(vector @ query), norm, query_norm))
+            hits.append((record_id, document, metadata, distance))
+
+        hits.sort(key=lambda hit: hit[3])
+        return hits[:n_results]
+
+    # ============================
+    # Writes
+    # ============================
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None, **kwargs):
+        """
+        Upserts into the ChromaDB collection and the in-memory overlay.
+
+        Documents are embedded only when given; otherwise each record keeps the
+        vector (and any document or metadata not given) it already has here.
+        """
+        result = self._source.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings, **kwargs)
+        if embeddings is None and documents is not None:
+            embeddings = self._source._embedding_function(list(documents))
+        with self._lock:
+            current = [self._current(record_id) for record_id in ids]
+        missing = [record_id for record_id, existing in zip(ids, current) if existing is None]
+        if embeddings is None and missing:
+            # New ids without documents or embeddings: take what ChromaDB stored for them
+            stored = self._source.get(ids=missing, include=["embeddings", "documents", "metadatas"])
+            for record_id, vector, document, metadata in zip(stored["ids"], stored["embeddings"], stored["documents"], stored["metadatas"]):
+                current[ids.index(record_id)] = (np.asarray(vector, dtype=np.float32), document, metadata)
+
+        records = []
+        for i, record_id in enumerate(ids):
+            existing = current[i] or (None, None, None)
+            vector = embeddings[i] if embeddings is not None else existing[0]
+            if vector is None:
+                continue
+            records.append({
+                "id": record_id,
+                "document": documents[i] if documents is not None else existing[1],
+                "metadata": metadatas[i] if metadatas is not None else existing[2],
+                "embedding": [float(value) for value in vector],
+            })
+        self._journal(records)
+        return result
+
+    def delete(self, ids=None, where=None, where_document=None, **kwargs):
+        """
+        Deletes from the ChromaDB collection and masks the records here, with a
+        tombstone in the overlay journal so they stay deleted after a restart.
+        """
+        if where or where_document:
+            ids = self._source.get(ids=ids, where=where, where_document=where_document, include=[])["ids"]
+        result = self._source.delete(ids=ids, where=where, where_document=where_document, **kwargs)
+        self._journal([{"id": record_id, "deleted": True} for record_id in ids or []])
+        return result
+
+    def _current(self, record_id: str) -> Optional[tuple]:
+        # (vector, document, metadata) of a live record, or None; called with the lock held
+        if record_id in self._overlay:
+            vector, document, metadata, _ = self._overlay[record_id]
+            return vector, document, metadata
+        row = self._row_of.get(record_id)
+        if row is None or self._masked[row]:
+            return None
+        return np.asarray(self._vectors[row]), self._documents[row], self._metadatas[row]
+
+    def _journal(self, records: List[Dict]):
+        if not records:
+            return
+        with self._lock:
+            with open(os.path.join(self.directory, OVERLAY_FILE), "a", encoding="utf-8") as overlay_file:
+                for record in records:
+                    overlay_file.write(json.dumps(record) + "\n")
+                overlay_file.flush()
+                os.fsync(overlay_file.fileno())
+            for record in records:
+                self._apply_overlay(record)
+
+    def _apply_overlay(self, record: Dict):
+        row = self._row_of.get(record["id"])
+        if row is not None:
+            self._masked[row] = True
+        if record.get("deleted"):
+            self._overlay.pop(record["id"], None)
+            return
+        vector = np.asarray(record["embedding"], dtype=np.float32)
+        if self.space == "cosine":
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        self._overlay[record["id"]] = (vector, record["document"], record["metadata"], float(vector @ vector))
+
+    def _load_overlay(self):
+        overlay_path = os.path.join(self.directory, OVERLAY_FILE)
+        if not os.path.exists(overlay_path):
+            return
+        with open(overlay_path, "r", encoding="utf-8") as overlay_file:
+            for line_number, line in enumerate(overlay_file, 1):
+                try:
+                    self._apply_overlay(json.loads(line))
+                except (ValueError, KeyError) as e:
+                    # A torn last line from a crash mid-append
+                    print(f"Skipping overlay line {line_number} in {overlay_path}: {e}")
+
+    def footprint(self) -> Dict[str, int]:
+        """
+        Returns bytes held in memory versus mapped from disk.
+        """
+        return {
+            "resident_bytes": int(self._codes.nbytes + self._norms.nbytes + self._scales.nbytes),
+            "mapped_bytes": int(self._vectors.nbytes),
+            "overlay_entries": len(self._overlay),
+        }
+
+
+# ============================
+# Garbage Collection
+# ============================
+def _live_segment_ids(persist_directory: str) -> set:
+    database_path = Path(persist_directory, "chroma.sqlite3").resolve()
+    conn = sqlite3.connect(f"{database_path.as_uri()}?mode=ro", uri=True, timeout=30)
+    try:
+        # Segments of dropped collections can outlive them when a delete is
+        # interrupted (e.g. files locked on Windows), so join against collections
+        rows = conn.execute(
+            "SELECT segments.id FROM segments JOIN collections ON segments.collection = collections.id"
+        ).fetchall()
+        return {row[0] for row in rows}
+    finally:
+        conn.close()
+
+
+def _live_collection_names(persist_directory: str) -> set:
+    database_path = Path(persist_directory, "chroma.sqlite3").resolve()
+    conn = sqlite3.connect(f"{database_path.as_uri()}?mode=ro", uri=True, timeout=30)
+    try:
+        return {row[0] for row in conn.execute("SELECT name FROM collections").fetchall()}
+    finally:
+        conn.close()
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+
+def _is_derived_orphan(entry: str, live_collections: set) -> bool:
+    # Named "<collection>" or "<collection>.<ext>", with a ".tmp-<pid>" suffix
+    # while being written, so in-progress files of live collections are kept
+    name = entry.split(".tmp-", 1)[0]
+    return name not in live_collections and os.path.splitext(name)[0] not in live_collections
+
+
+def gc_orphaned_segments(persist_directory: str = "chroma_db", dry_run: bool = False, other_collections=()) -> List[str]:
+    """
+    Removes segment directories that no live collection references, and
+    compact indexes, snapshots and FAQ caches of collections that no longer exist.
+
+    Only directories named like segment UUIDs are considered, and anything
+    referenced by a live collection in chroma.sqlite3 is kept.
+
+    Args:
+        other_collections: Names of live collections kept outside chroma.sqlite3
+            (e.g. by the numpy backend), whose derived files are kept too.
+
+    Returns:
+        List[str]: The directories removed (or that would be, with dry_run).
+    """
+    has_database = os.path.exists(os.path.join(persist_directory, "chroma.sqlite3"))
+    if not has_database and not other_collections:
+        return []
+    orphans = []
+    if has_database:
+        live_segments = _live_segment_ids(persist_directory)
+        orphans = [
+            os.path.join(persist_directory, entry)
+            for entry in sorted(os.listdir(persist_directory))
+            if _UUID_DIR.match(entry) and entry not in live_segments and os.path.isdir(os.path.join(persist_directory, entry))
+        ]
+    live_collections = None
+    for dirname in DERIVED_DIRNAMES:
+        derived_root = os.path.join(persist_directory, dirname)
+        if not os.path.isdir(derived_root):
+            continue
+        if live_collections is None:
+            live_collections = set(other_collections)
+            if has_database:
+                live_collections |= _live_collection_names(persist_directory)
+        orphans.extend(
+            os.path.join(derived_root, entry)
+            for entry in sorted(os.listdir(derived_root))
+            if _is_derived_orphan(entry, live_collections)
+        )
+
+    removed = []
+    for path in orphans:
+        size_mb = _directory_size(path) / 1e6
+        if dry_run:
+            print(f"Would remove {path} ({size_mb:.1f} MB)")
+            removed.append(path)
+            continue
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            print(f"Removed orphaned {path} ({size_mb:.1f} MB)")
+            removed.append(path)
+        except OSError as e:
+            print(f"Failed to remove {path}: {e}")
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact index and ChromaDB segment maintenance.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    gc_parser = subparsers.add_parser("gc", help="Remove orphaned segment directories, compact indexes and snapshots.")
+    gc_parser.add_argument("persist_directory", nargs="?", default="chroma_db")
+    gc_parser.add_argument("--dry-run", action="store_true")
+    stats_parser = subparsers.add_parser("stats", help="Print a compact index manifest.")
+    stats_parser.add_argument("directory")
+    args = parser.parse_args()
+
+    if args.command == "gc":
+        removed = gc_orphaned_segments(args.persist_directory, dry_run=args.dry_run)
+        print(f"{len(removed)} orphaned director{'y' if len(removed) == 1 else 'ies'}.")
+    else:
+        with open(os.path.join(args.directory, MANIFEST_FILE), "r", encoding="utf-8") as manifest_file:
+            print(json.dumps(json.load(manifest_file), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# config.py
+
+import os
+from dotenv import load_dotenv
+
+# ============================
+# Load Environment Variables
+# ============================
+load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Invalid integer for {name}: {value!r}, using {default}")
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"Invalid number for {name}: {value!r}, using {default}")
+        return default
+
+
+# ============================
+# Metrics
+# ============================
+# Port for the Prometheus text endpoint; 0 disables the endpoint.
+METRICS_PORT = _env_int("METRICS_PORT", 9108)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# ============================
+# LLM Provider
+# ============================
+# Point the Groq client at another host, e.g. the fake server in benchmarks/fake_llm.py.
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.2-90b-text-preview")
+# Providers tried in order of measured latency (llm_providers.py): groq, openai, llamacpp.
+LLM_PROVIDERS = [name.strip().lower() for name in os.getenv("LLM_PROVIDERS", "groq").split(",") if name.strip()]
+# Any OpenAI-compatible chat completions API, e.g. https://api.openai.com/v1
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or None
+# A local llama.cpp llama-server
+LLAMACPP_BASE_URL = os.getenv("LLAMACPP_BASE_URL", "http://127.0.0.1:8080/v1")
+LLAMACPP_MODEL = os.getenv("LLAMACPP_MODEL", "local")
+# Also send a request to the next provider when the first is slower than its p95
+# time-to-first-token (at least LLM_HEDGE_MIN_MS).
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0").strip().lower() in ("1", "true", "yes")
+LLM_HEDGE_MIN_MS = _env_int("LLM_HEDGE_MIN_MS", 800)
+# Admission control for LLM calls (llm_scheduler.py); 0 disables a rate limit.
+LLM_MAX_CONCURRENCY = _env_int("LLM_MAX_CONCURRENCY", 4)
+LLM_REQUESTS_PER_MINUTE = _env_int("LLM_REQUESTS_PER_MINUTE", 30)
+LLM_TOKENS_PER_MINUTE = _env_int("LLM_TOKENS_PER_MINUTE", 0)
+# Requests allowed to wait, and how long each may wait, before failing fast
+LLM_MAX_QUEUE = _env_int("LLM_MAX_QUEUE", 100)
+LLM_QUEUE_TIMEOUT_SECONDS = _env_int("LLM_QUEUE_TIMEOUT_SECONDS", 120)
+# Retries after HTTP 429, with exponential backoff
+LLM_MAX_RETRIES = _env_int("LLM_MAX_RETRIES", 4)
+
+# ============================
+# Startup
+# ============================
+# Import the retrieval/LLM stack in a background thread while the login screen is shown.
+PRELOAD_QA_STACK = os.getenv("PRELOAD_QA_STACK", "1").strip().lower() not in ("0", "false", "no")
+
+# ============================
+# Retrieval
+# ============================
+# Entries kept in each of the query-vector and retrieval-result LRU caches; 0 disables them.
+QUERY_CACHE_SIZE = _env_int("QUERY_CACHE_SIZE", 1024)
+# Retrieval backend: "chroma" queries the HNSW index; "compact" serves reads from
+# int8 codes with float re-scoring (compact_index.py); "snapshot" from a
+# memory-mapped file shared by all worker processes (index_snapshot.py); "numpy"
+# stores and searches an in-memory matrix without ChromaDB (retrieval_backends.py).
+INDEX_MODE = os.getenv("INDEX_MODE", "chroma").strip().lower()
+# Candidates re-scored with float vectors per requested result in compact mode
+COMPACT_OVERSAMPLE = _env_int("COMPACT_OVERSAMPLE", 4)
+# Embedding backend: "default" uses ChromaDB's ONNX MiniLM; "onnx" the same model
+# int8-quantized with dynamic padding and micro-batching (embeddings.py).
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "default").strip().lower()
+# Concurrent query embeddings arriving within this window share one inference call
+EMBEDDING_BATCH_WAIT_MS = _env_int("EMBEDDING_BATCH_WAIT_MS", 5)
+EMBEDDING_MAX_BATCH = _env_int("EMBEDDING_MAX_BATCH", 64)
+# onnxruntime intra-op threads; 0 lets onnxruntime decide
+EMBEDDING_THREADS = _env_int("EMBEDDING_THREADS", 0)
+# Token budget for retrieved context after extractive compression (context_compression.py); 0 disables it.
+CONTEXT_TOKEN_BUDGET = _env_int("CONTEXT_TOKEN_BUDGET", 1200)
+# Answer questions that match a stored QA question directly, without the LLM (faq_index.py)
+FAQ_DIRECT_ANSWERS = os.getenv("FAQ_DIRECT_ANSWERS", "1").strip().lower() not in ("0", "false", "no")
+# Minimum cosine similarity between question embeddings for a non-exact FAQ match
+FAQ_MATCH_THRESHOLD = _env_float("FAQ_MATCH_THRESHOLD", 0.92)
+
+# ============================
+# Corrections
+# ============================
+script_dir = os.path.dirname(os.path.abspath(__file__))
+# SQLite journal backing the write-behind correction queue
+CORRECTION_QUEUE_PATH = os.getenv("CORRECTION_QUEUE_PATH") or os.path.join(script_dir, "QA_data", "correction_queue.sqlite3")
+
+# ============================
+# Knowledge Bases
+# ============================
+# JSON list of knowledge bases (knowledge_bases.py); without it the single Tallman knowledge base is served.
+KNOWLEDGE_BASES_PATH = os.getenv("KNOWLEDGE_BASES_PATH") or os.path.join(script_dir, "QA_data", "knowledge_bases.json")
+# Knowledge bases kept open at once; the least recently used is released beyond this. 0 means unlimited.
+KNOWLEDGE_BASES_MAX_OPEN = _env_int("KNOWLEDGE_BASES_MAX_OPEN", 3)
+# Memory for HNSW segments loaded by ChromaDB, evicted least recently used first; 0 means unlimited.
+# ChromaDB shares loaded segments across collections, so closing a knowledge base does not unload
+# them; by default the cache allows CHROMA_MEMORY_PER_KNOWLEDGE_BASE_MB for each one kept open.
+CHROMA_MEMORY_PER_KNOWLEDGE_BASE_MB = _env_int("CHROMA_MEMORY_PER_KNOWLEDGE_BASE_MB", 256)
+CHROMA_MEMORY_LIMIT_MB = _env_int("CHROMA_MEMORY_LIMIT_MB", KNOWLEDGE_BASES_MAX_OPEN * CHROMA_MEMORY_PER_KNOWLEDGE_BASE_MB)
+
+# ============================
+# Profiling
+# ============================
+# Output directory of on-demand profiling sessions started from User Management (profiling.py)
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(script_dir, "profiles")
+# Time between stack samples, and the longest session an admin can start
+PROFILE_INTERVAL_MS = _env_int("PROFILE_INTERVAL_MS", 10)
+PROFILE_MAX_SECONDS = _env_int("PROFILE_MAX_SECONDS", 300)
+# Stack depth recorded per allocation, and allocation sites written per session
+PROFILE_TRACEMALLOC_FRAMES = _env_int("PROFILE_TRACEMALLOC_FRAMES", 10)
+PROFILE_TOP_ALLOCATIONS = _env_int("PROFILE_TOP_ALLOCATIONS", 25)
+
+# ============================
+# Query Log and Pre-Warming
+# ============================
+# Append-only JSON-lines log of answered questions (query_log.py)
+QUERY_LOG = os.getenv("QUERY_LOG", "1").strip().lower() not in ("0", "false", "no")
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH") or os.path.join(script_dir, "QA_data", "query_log.jsonl")
+# The most frequent questions of the last PREWARM_LOOKBACK_DAYS are answered ahead
+# of time every day at PREWARM_HOUR (local time; -1 disables the schedule).
+PREWARM_HOUR = _env_int("PREWARM_HOUR", 5)
+PREWARM_TOP_N = _env_int("PREWARM_TOP_N", 50)
+PREWARM_LOOKBACK_DAYS = _env_int("PREWARM_LOOKBACK_DAYS", 7)
+
+# ============================
+# Correction Replication
+# ============================
+# Shared SQLite log that every app node publishes corrections to and applies them
+# from (replication.py); empty keeps corrections local to this node.
+REPLICATION_LOG_PATH = os.getenv("REPLICATION_LOG_PATH", "").strip()
+# This node's name in the log; defaults to the host name
+REPLICATION_NODE_ID = os.getenv("REPLICATION_NODE_ID", "").strip()
+REPLICATION_POLL_SECONDS = _env_float("REPLICATION_POLL_SECONDS", 2.0)
+
+# ============================
+# Generation Profiles
+# ============================
+# Per-subject max_tokens, temperature, stop sequences and context size (generation_profiles.py)
+GENERATION_PROFILES_PATH = os.getenv("GENERATION_PROFILES_PATH") or os.path.join(script_dir, "QA_data", "generation_profiles.json")
+# Total context size of the model in tokens, unless a profile sets its own
+LLM_CONTEXT_WINDOW = _env_int("LLM_CONTEXT_WINDOW", 8192)
@@ -0,0 +1,249 @@
+# context_compression.py
+
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from chunk_metadata import count_tokens, entry_span_tokens, snippet_tokens
+from config import CONTEXT_TOKEN_BUDGET
+
+QUESTION_PREFIXES = ("USER QUESTION:", "QUESTION:")
+ANSWER_PREFIX = "ANSWER:"
+# Entries scoring below this fraction of the best entry are dropped as unrelated
+MIN_RELATIVE_SCORE = 0.2
+# BM25 parameters for scoring spans against the question
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TERM = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+_DATE_LINE = re.compile(r"^\d{4}-\d{2}-\d{2}\s*$")
+
+_nlp = None
+_stop_words = frozenset()
+_load_lock = threading.Lock()
+
+
+def _load_nlp():
+    """
+    Loads en_core_web_sm once with only a rule-based sentencizer; the tagger,
+    parser and NER are not needed for sentence splitting.
+    """
+    global _nlp, _stop_words
+    with _load_lock:
+        if _nlp is None:
+            try:
+                import spacy
+
+                nlp = spacy.load("en_core_web_sm", exclude=["tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer", "ner"])
+                nlp.add_pipe("sentencizer")
+                _stop_words = frozenset(nlp.Defaults.stop_words)
+            except (ImportError, OSError) as e:
+                print(f"spaCy model unavailable ({e}); splitting sentences on punctuation.")
+                nlp = False
+            _nlp = nlp
+    return _nlp or None
+
+
+def _terms(text: str) -> List[str]:
+    return [term for term in _TERM.findall(text.lower()) if term not in _stop_words]
+
+
+# ============================
+# Splitting Snippets
+# ============================
+class _Entry:
+    """
+    One QA pair (or free-text block) from a retrieved chunk, split into sentences.
+    """
+
+    __slots__ = ("question", "sentences", "order")
+
+    def __init__(self, question: Optional[str], sentences: List[str], order: Tuple[int, int]):
+        self.question = question
+        self.sentences = sentences
+        self.order = order  # (snippet rank, position in snippet)
+
+
+def _parse_block(block: str) -> Tuple[Optional[str], str]:
+    question, answer_lines = None, []
+    for line in block.split("\n"):
+        stripped = line.strip()
+        if not stripped or _DATE_LINE.match(stripped):
+            continue
+        upper = stripped.upper()
+        prefix = next((prefix for prefix in QUESTION_PREFIXES if upper.startswith(prefix)), None)
+        if prefix is not None and question is None:
+            question = stripped[len(prefix):].strip()
+        elif upper.startswith(ANSWER_PREFIX):
+            answer_lines.append(stripped[len(ANSWER_PREFIX):].strip())
+        else:
+            answer_lines.append(stripped)
+    return question, " ".join(answer_lines)
+
+
+def split_snippets(snippets: List[str]) -> List[_Entry]:
+    """
+    Splits retrieved chunks into QA entries and each answer into sentences.
+    """
+    blocks = []
+    for rank, snippet in enumerate(snippets):
+        for position, block in enumerate(re.split(r"\n\s*\n", snippet)):
+            question, answer = _parse_block(block)
+            if question or answer:
+                blocks.append((question, answer, (rank, position)))
+
+    nlp = _load_nlp()
+    answers = [answer for _, answer, _ in blocks]
+    if nlp is not None:
+        split = [[sentence.text.strip() for sentence in doc.sents if sentence.text.strip()] for doc in nlp.pipe(answers)]
+    else:
+        split = [[sentence for sentence in _SENTENCE_END.split(answer) if sentence] for answer in answers]
+    return [_Entry(question, sentences, order) for (question, _, order), sentences in zip(blocks, split)]
+
+
+# ============================
+# Scoring and Selection
+# ============================
+def _score_units(question: str, units: List[str]) -> np.ndarray:
+    """
+    BM25 of every unit against the question's terms, with IDF taken over the
+    units themselves, as one matrix product.
+    """
+    query_terms = sorted(set(_terms(question)))
+    if not query_terms or not units:
+        return np.zeros(len(units), dtype=np.float32)
+    unit_counts = [Counter(_terms(unit)) for unit in units]
+    tf = np.array([[counts.get(term, 0) for term in query_terms] for counts in unit_counts], dtype=np.float32)
+    lengths = np.array([sum(counts.values()) for counts in unit_counts], dtype=np.float32)
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((len(units) - df + 0.5) / (df + 0.5)).astype(np.float32)
+    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths / max(float(lengths.mean()), 1.0))
+    return (tf * (BM25_K1 + 1.0) / (tf + norm[:, None])) @ idf
+
+
+def _format(question: Optional[str], sentences: List[str]) -> str:
+    answer = " ".join(sentences)
+    if question is None:
+        return answer
+    return f"USER QUESTION: {question}\nANSWER: {answer}"
+
+
+def entry_spans(entry: _Entry) -> List[str]:
+    """
+    The texts an entry's token cost is counted from: its question header
+    ("" for a free-text block) followed by each answer sentence.
+    """
+    return [_format(entry.question, []) if entry.question is not None else ""] + entry.sentences
+
+
+def _span_tokens(entries: List[_Entry], metadatas: List[Optional[Dict]]) -> List[List[int]]:
+    """
+    Token counts of every entry's spans, read from the snippets' ingestion
+    metadata and counted only for snippets whose stored spans do not line up.
+    """
+    by_snippet = {}
+    for index, entry in enumerate(entries):
+        by_snippet.setdefault(entry.order[0], []).append(index)
+    counts: List[Optional[List[int]]] = [None] * len(entries)
+    for rank, indexes in by_snippet.items():
+        stored = entry_span_tokens(metadatas[rank])
+        if stored is not None and len(stored) == len(indexes) and all(
+            len(spans) == len(entries[index].sentences) + 1 for spans, index in zip(stored, indexes)
+        ):
+            for spans, index in zip(stored, indexes):
+                counts[index] = spans
+    missing = [index for index, spans in enumerate(counts) if spans is None]
+    if missing:
+        texts = [entry_spans(entries[index]) for index in missing]
+        counted = iter(count_tokens([text for spans in texts for text in spans]))
+        for index, spans in zip(missing, texts):
+            counts[index] = [next(counted) for _ in spans]
+    return counts
+
+
+def compress_context(question: str, snippets: List[str], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                     metadatas: Optional[List[Optional[Dict]]] = None) -> Tuple[List[str], int, int]:
+    """
+    Keeps the QA pairs and sentences of the retrieved snippets that best match
+    the question, within a token budget.
+
+    Entries are ranked by their best-matching span (question line or answer
+    sentence). The best entries are kept whole while they fit; an entry that
+    does not fit keeps its question and its best sentences that do. Entries
+    sharing no terms with the question are dropped, and the kept spans stay in
+    their retrieval order.
+
+    Costs are added up from the span token counts stored at ingestion
+    (chunk_metadata.describe_chunks), allowing one token per joining space, so
+    only snippets without them are tokenized.
+
+    Args:
+        question (str): The user's question.
+        snippets (List[str]): Retrieved chunks, most relevant first.
+        token_budget (int): Maximum context tokens; 0 returns the snippets unchanged.
+        metadatas (List[Dict]): The snippets' ingestion metadata, if known.
+
+    Returns:
+        Tuple[List[str], int, int]: (compressed snippets, tokens before, tokens after).
+    """
+    metadatas = metadatas if metadatas is not None else [None] * len(snippets)
+    tokens_before = sum(snippet_tokens(snippets, metadatas))
+    if not token_budget or not snippets:
+        return snippets, tokens_before, tokens_before
+
+    entries = split_snippets(snippets)
+    span_tokens = _span_tokens(entries, metadatas)
+    units, owners = [], []
+    for index, entry in enumerate(entries):
+        for text in ([entry.question] if entry.question else []) + entry.sentences:
+            units.append(text)
+            owners.append(index)
+    scores = _score_units(question, units)
+
+    entry_scores = np.zeros(len(entries), dtype=np.float32)
+    np.maximum.at(entry_scores, np.asarray(owners, dtype=np.int64), scores)
+    sentence_scores = {}
+    for text, owner, score in zip(units, owners, scores):
+        sentence_scores[(owner, text)] = float(score)
+
+    best = float(entry_scores.max()) if len(entry_scores) else 0.0
+    if best <= 0.0:
+        ranked = list(range(len(entries)))  # No overlap at all: keep retrieval order
+    else:
+        ranked = [int(index) for index in np.argsort(-entry_scores, kind="stable") if entry_scores[index] >= MIN_RELATIVE_SCORE * best]
+
+    kept, used = [], 0
+    for index in ranked:
+        entry = entries[index]
+        header, sentence_tokens = span_tokens[index][0], span_tokens[index][1:]
+        tokens = header + sum(count + 1 for count in sentence_tokens)
+        cost = tokens + 2  # Separator between entries
+        if used + cost <= token_budget:
+            kept.append((entry.order, _format(entry.question, entry.sentences), tokens))
+            used += cost
+            continue
+        # Keep the question and the best sentences that still fit, in their original order
+        tokens = header
+        chosen = set()
+        for position in sorted(range(len(entry.sentences)), key=lambda position: -sentence_scores.get((index, entry.sentences[position]), 0.0)):
+            if sentence_scores.get((index, entry.sentences[position]), 0.0) <= 0.0:
+                break
+            sentence_cost = sentence_tokens[position] + 1
+            if used + tokens + 2 + sentence_cost <= token_budget:
+                chosen.add(position)
+                tokens += sentence_cost
+        if chosen:
+            kept.append((entry.order, _format(entry.question, [sentence for position, sentence in enumerate(entry.sentences) if position in chosen]), tokens))
+            used += tokens + 2
+        if token_budget - used < math.ceil(0.05 * token_budget):
+            break
+
+    if not kept:
+        return snippets, tokens_before, tokens_before  # Budget too small for any span; prompt truncation applies
+    kept.sort(key=lambda item: item[0])
+    return [text for _, text, _ in kept], tokens_before, sum(tokens for _, _, tokens in kept)
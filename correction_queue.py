@@ -0,0 +1,279 @@
+# correction_queue.py
+
+import datetime
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from chunk_metadata import describe_chunks
+from metrics import CORRECTIONS, CORRECTION_QUEUE_DEPTH
+
+# Pipeline stages, in order; each is committed before the next one starts
+PENDING = "pending"
+REFORMULATED = "reformulated"
+JOURNALED = "journaled"
+DONE = "done"
+FAILED = "failed"
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 2.0
+LEASE_SECONDS = 300.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS corrections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    submitted_by TEXT,
+    entry_date TEXT NOT NULL,
+    user_question TEXT NOT NULL,
+    last_response TEXT NOT NULL,
+    correction TEXT NOT NULL,
+    new_answer TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0,
+    error TEXT
+)
+"""
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def index_correction(collection, entry_date: str, user_question: str, new_answer: str):
+    """
+    Upserts a reformulated correction into the index and the FAQ index.
+    """
+    document = f"{entry_date}\nQUESTION: {user_question}\nANSWER: {new_answer}\n\n"
+    collection.upsert(
+        documents=[document],
+        ids=[f"{user_question}_correction_{entry_date}"],
+        metadatas=describe_chunks([document], [f"QA_data_correction_{entry_date}"]),
+    )
+    # The corrected answer replaces the stored one for direct FAQ answers
+    add_faq_entry = getattr(collection, "add_faq_entry", None)
+    if add_faq_entry is not None:
+        add_faq_entry(user_question, new_answer, entry_date)
+
+
+def apply_correction(qa_data_path: str, collection, entry_date: str, user_question: str, new_answer: str):
+    """
+    Prepends a reformulated correction to the QA file and indexes it. Safe to
+    repeat: the QA entry is skipped if it is already present and the index
+    write is an upsert.
+    """
+    from qa_module import append_qa_entry
+
+    append_qa_entry(entry_date, user_question, new_answer, qa_data_path, skip_if_present=True)
+    index_correction(collection, entry_date, user_question, new_answer)
+
+
+class CorrectionQueue:
+    """
+    A durable write-behind queue for admin corrections.
+
+    Submitting only inserts a row into a SQLite journal. A background worker
+    then reformulates the answer with the LLM, prepends it to qa_data.txt and
+    upserts it into the index. The job's stage is committed after each step, so
+    a crash resumes from the last completed step instead of losing or
+    duplicating the correction. Failed steps are retried with exponential
+    backoff, up to MAX_ATTEMPTS.
+
+    With replication, the reformulated answer is published to the shared log
+    instead, and every node (this one included) applies it from there.
+
+    Args:
+        db_path (str): Path of the SQLite journal.
+        qa_data_path (str): The QA data file corrections are prepended to.
+        collection: The collection (or KnowledgeIndex) corrections are upserted into.
+        replication (ReplicationTailer): This node's tailer of the shared log, or None.
+    """
+
+    def __init__(self, db_path, qa_data_path, collection, replication=None):
+        self.db_path = db_path
+        self.qa_data_path = qa_data_path
+        self.collection = collection
+        self.replication = replication
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ============================
+    # Submitting and Inspecting Jobs
+    # ============================
+    def submit(self, user_question: str, last_response: str, correction: str, submitted_by: Optional[str] = None) -> int:
+        """
+        Records a correction and wakes the worker.
+
+        Returns:
+            int: The job ID.
+        """
+        now = _now()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO corrections (created_at, updated_at, submitted_by, entry_date, user_question, last_response, correction, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (now, now, submitted_by, datetime.datetime.now().strftime("%Y-%m-%d"), user_question, last_response, correction, PENDING),
+            )
+            job_id = cursor.lastrowid
+        self._update_depth()
+        self._wake.set()
+        return job_id
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                "SELECT id, created_at, updated_at, submitted_by, user_question, status, attempts, error "
+                "FROM corrections ORDER BY id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def depth(self) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM corrections WHERE status NOT IN (?, ?)", (DONE, FAILED)
+            ).fetchone()[0]
+
+    def retry(self, job_id: int):
+        """
+        Puts a failed job back in the queue from the stage it reached.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE corrections SET status = CASE WHEN new_answer IS NULL THEN ? ELSE ? END, "
+                "attempts = 0, next_attempt_at = 0, lease_until = 0, error = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ?",
+                (PENDING, REFORMULATED, _now(), job_id, FAILED),
+            )
+        self._update_depth()
+        self._wake.set()
+
+    def _update_depth(self):
+        try:
+            CORRECTION_QUEUE_DEPTH.set(self.depth())
+        except Exception as e:
+            print(f"Failed to read correction queue depth: {e}")
+
+    # ============================
+    # Background Worker
+    # ============================
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="correction-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        self._update_depth()
+        while not self._stop.is_set():
+            try:
+                job = self._claim_next()
+            except Exception as e:
+                print(f"Correction worker failed to claim a job: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(timeout=1.0)
+                self._wake.clear()
+                continue
+            self._process(job)
+            self._update_depth()
+
+    def _claim_next(self) -> Optional[Dict]:
+        now = time.time()
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM corrections WHERE status IN (?, ?, ?) AND next_attempt_at <= ? AND lease_until <= ? "
+                "ORDER BY id LIMIT 1",
+                (PENDING, REFORMULATED, JOURNALED, now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE corrections SET lease_until = ? WHERE id = ?", (now + LEASE_SECONDS, row["id"]))
+        return dict(row)
+
+    def _save(self, job_id: int, **fields):
+        fields["updated_at"] = _now()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE corrections SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _process(self, job: Dict):
+        from qa_module import generate_ai_response
+
+        try:
+            if job["status"] == PENDING:
+                new_answer = generate_ai_response(
+                    user_question=job["user_question"],
+                    snippets=[job["last_response"], job["correction"]],
+                    subject=6,  # Subject index for corrections
+                    user="correction-queue",  # Shares the LLM fairly with interactive users
+                    compress=False,  # The snippets are the previous answer and the correction
+                )
+                if new_answer.startswith("Error generating AI response:"):
+                    raise RuntimeError(new_answer)
+                job.update(new_answer=new_answer, status=REFORMULATED)
+                self._save(job["id"], new_answer=new_answer, status=REFORMULATED)
+
+            if job["status"] == REFORMULATED and self.replication is not None:
+                # Publishing is idempotent, so a retry after a crash does not duplicate the entry
+                seq = self.replication.log.publish(
+                    self.replication.knowledge_base, job["id"], job["entry_date"], job["user_question"], job["new_answer"]
+                )
+                self._save(job["id"], status=DONE, lease_until=0, error=None)
+                self.replication.wake()
+                CORRECTIONS.inc(outcome="ok")
+                print(f"Correction {job['id']} published as #{seq}.")
+                return
+
+            if job["status"] == REFORMULATED:
+                from qa_module import append_qa_entry
+
+                append_qa_entry(job["entry_date"], job["user_question"], job["new_answer"], self.qa_data_path, skip_if_present=True)
+                job["status"] = JOURNALED
+                self._save(job["id"], status=JOURNALED)
+
+            if job["status"] == JOURNALED:
+                index_correction(self.collection, job["entry_date"], job["user_question"], job["new_answer"])
+                self._save(job["id"], status=DONE, lease_until=0, error=None)
+                CORRECTIONS.inc(outcome="ok")
+                print(f"Correction {job['id']} applied.")
+        except Exception as e:
+            attempts = job["attempts"] + 1
+            print(f"Correction {job['id']} failed at stage '{job['status']}' (attempt {attempts}): {e}")
+            if attempts >= MAX_ATTEMPTS:
+                self._save(job["id"], status=FAILED, attempts=attempts, lease_until=0, error=str(e))
+                CORRECTIONS.inc(outcome="failed")
+            else:
+                delay = RETRY_BASE_SECONDS * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+                self._save(job["id"], attempts=attempts, next_attempt_at=time.time() + delay, lease_until=0, error=str(e))
+                CORRECTIONS.inc(outcome="retry")
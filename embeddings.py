@@ -0,0 +1,239 @@
+# embeddings.py
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import EMBEDDING_BACKEND, EMBEDDING_BATCH_WAIT_MS, EMBEDDING_MAX_BATCH, EMBEDDING_THREADS
+from metrics import EMBEDDING_BATCH_TEXTS, EMBEDDING_LATENCY
+
+EMBEDDING_BACKENDS = ("default", "onnx")
+MODEL_NAME = "all-MiniLM-L6-v2"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+MAX_SEQUENCE_LENGTH = 256
+# Texts per inference call inside one embedding request
+INFERENCE_BATCH_SIZE = 32
+
+
+# ============================
+# Quantized ONNX Model
+# ============================
+def _model_directory() -> Path:
+    """
+    Returns the directory of ChromaDB's ONNX MiniLM model, downloading it if needed,
+    so this backend embeds with the same model as the default one.
+    """
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+    default = ONNXMiniLM_L6_V2()
+    default._download_model_if_not_exists()
+    return Path(default.DOWNLOAD_PATH) / default.EXTRACTED_FOLDER_NAME
+
+
+def _quantized_model(model_directory: Path) -> Path:
+    """
+    Returns an int8 dynamically quantized copy of model.onnx, creating it once.
+    Falls back to the float model if the quantization tools are unavailable.
+    """
+    source = model_directory / "model.onnx"
+    target = model_directory / QUANTIZED_MODEL_FILE
+    if target.exists():
+        return target
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        print(f"ONNX quantization unavailable ({e}); using the float model.")
+        return source
+    temp_path = model_directory / f"{QUANTIZED_MODEL_FILE}.tmp-{os.getpid()}"
+    print(f"Quantizing {source} to int8.")
+    quantize_dynamic(str(source), str(temp_path), weight_type=QuantType.QInt8)
+    os.replace(temp_path, target)
+    return target
+
+
+class OnnxEmbeddingFunction:
+    """
+    all-MiniLM-L6-v2 on onnxruntime's CPU provider, int8 quantized.
+
+    Unlike ChromaDB's default, which pads every text to 256 tokens, inputs are
+    sorted by length and padded only to the longest text in each inference
+    batch. Vectors are mean-pooled and L2-normalized like the default's, so
+    indexes stay comparable, though a rebuild is recommended after switching.
+
+    Args:
+        threads (int): onnxruntime intra-op threads; 0 lets onnxruntime decide.
+        quantize (bool): Use the int8 model.
+    """
+
+    def __init__(self, threads: int = EMBEDDING_THREADS, quantize: bool = True):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_directory = _model_directory()
+        model_path = _quantized_model(model_directory) if quantize else model_directory / "model.onnx"
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self._session = onnxruntime.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self._input_names = {model_input.name for model_input in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(str(model_directory / "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=MAX_SEQUENCE_LENGTH)
+        self._tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        print(f"ONNX embedding model loaded from {model_path}.")
+
+    def _infer(self, texts: List[str]) -> np.ndarray:
+        encoded = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encoded], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encoded], dtype=np.int64)
+        feeds = {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "token_type_ids": np.zeros_like(input_ids),
+        }
+        hidden = self._session.run(None, {name: value for name, value in feeds.items() if name in self._input_names})[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def __call__(self, input: Sequence[str]) -> List[List[float]]:
+        texts = list(input)
+        if not texts:
+            return []
+        start = time.perf_counter()
+        # Similar lengths share a batch, so little compute goes to padding
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+        vectors = np.empty((len(texts), 0), dtype=np.float32)
+        for offset in range(0, len(order), INFERENCE_BATCH_SIZE):
+            rows = order[offset:offset + INFERENCE_BATCH_SIZE]
+            batch = self._infer([texts[row] for row in rows])
+            if not vectors.shape[1]:
+                vectors = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            vectors[rows] = batch
+        EMBEDDING_LATENCY.observe(time.perf_counter() - start, backend="onnx")
+        return vectors.tolist()
+
+
+# ============================
+# Micro-Batching
+# ============================
+class _Request:
+    __slots__ = ("texts", "result", "error", "done")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class EmbeddingBatcher:
+    """
+    An embedding function that merges concurrent calls: requests arriving
+    within max_wait_ms of the first waiting one are embedded together in one
+    inference call, up to max_batch texts. Calls with max_batch or more texts
+    (bulk ingestion) are already batched and run directly.
+
+    Args:
+        embedding_function: The underlying callable taking a list of texts.
+        max_batch (int): Maximum texts per merged call.
+        max_wait_ms (float): How long the first request waits for company.
+    """
+
+    def __init__(self, embedding_function: Callable, max_batch: int = 64, max_wait_ms: float = 5.0):
+        self.embedding_function = embedding_function
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending: List[_Request] = []
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    def __call__(self, input: Sequence[str]) -> List[List[float]]:
+        texts = list(input)
+        if not texts:
+            return []
+        if len(texts) >= self.max_batch:
+            EMBEDDING_BATCH_TEXTS.observe(len(texts))
+            return self.embedding_function(texts)
+        request = _Request(texts)
+        with self._condition:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+            self._pending.append(request)
+            self._condition.notify_all()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _take_batch(self) -> List[_Request]:
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            deadline = time.monotonic() + self.max_wait
+            while sum(len(request.texts) for request in self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch, total = [], 0
+            while self._pending and (not batch or total + len(self._pending[0].texts) <= self.max_batch):
+                request = self._pending.pop(0)
+                batch.append(request)
+                total += len(request.texts)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            texts = [text for request in batch for text in request.texts]
+            EMBEDDING_BATCH_TEXTS.observe(len(texts))
+            try:
+                vectors = self.embedding_function(texts)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+            offset = 0
+            for request in batch:
+                request.result = vectors[offset:offset + len(request.texts)]
+                offset += len(request.texts)
+                request.done.set()
+
+
+# ============================
+# Selecting a Backend
+# ============================
+_embedding_function = None
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_function():
+    """
+    Returns the process-wide embedding function for EMBEDDING_BACKEND, or None
+    for "default" (ChromaDB's own ONNX MiniLM, called once per request).
+    """
+    global _embedding_function
+    if EMBEDDING_BACKEND == "default":
+        return None
+    if EMBEDDING_BACKEND not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {EMBEDDING_BACKEND!r}; expected one of {', '.join(EMBEDDING_BACKENDS)}.")
+    with _embedding_lock:
+        if _embedding_function is None:
+            _embedding_function = EmbeddingBatcher(OnnxEmbeddingFunction(), EMBEDDING_MAX_BATCH, EMBEDDING_BATCH_WAIT_MS)
+        return _embedding_function
+
+
+def collection_options() -> Dict:
+    """
+    Keyword arguments for get_collection/create_collection that select the
+    configured embedding function.
+    """
+    embedding_function = get_embedding_function()
+    return {} if embedding_function is None else {"embedding_function": embedding_function}
@@ -0,0 +1,189 @@
+# faq_index.py
+
+import io
+import json
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from config import FAQ_MATCH_THRESHOLD
+
+FAQ_DIRNAME = "faq"  # Listed in compact_index.DERIVED_DIRNAMES for cleanup
+EMBED_BATCH_SIZE = 64
+ANSWER_PREFIX = "ANSWER:"
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """
+    Key for exact matches: case-folded, punctuation dropped and whitespace
+    collapsed, so "What is X?" and "what is x" are the same question.
+    """
+    return _WHITESPACE.sub(" ", _NON_WORD.sub(" ", text)).strip().casefold()
+
+
+def strip_answer_prefix(answer: str) -> str:
+    answer = answer.strip()
+    if answer.upper().startswith(ANSWER_PREFIX):
+        return answer[len(ANSWER_PREFIX):].strip()
+    return answer
+
+
+def faq_path(persist_directory: str, collection_name: str) -> str:
+    return os.path.join(persist_directory, FAQ_DIRNAME, f"{collection_name}.npz")
+
+
+class FAQMatch:
+    __slots__ = ("question", "answer", "date", "score", "kind")
+
+    def __init__(self, question: str, answer: str, date: str, score: float, kind: str):
+        self.question = question
+        self.answer = answer
+        self.date = date
+        self.score = score
+        self.kind = kind  # "exact" or "similar"
+
+
+class FAQIndex:
+    """
+    The curated question/answer pairs from qa_data.txt, indexed by question
+    only: a hash table of normalized questions for exact matches, plus
+    normalized question embeddings for near-verbatim rephrasings.
+
+    Entries are given newest first (the order of qa_data.txt), and the newest
+    answer to a repeated question wins. Until embed() has run only exact
+    matches are found.
+
+    Args:
+        entries (List[dict]): Parsed entries with "date", "question" and "answer" keys.
+        threshold (float): Minimum cosine similarity for an embedding match.
+    """
+
+    def __init__(self, entries: List[Dict], threshold: float = FAQ_MATCH_THRESHOLD):
+        self.threshold = threshold
+        self._entries: List[Dict] = []
+        self._row_of: Dict[str, int] = {}
+        self._vectors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        for entry in entries:
+            question = entry["question"]
+            key = normalize_question(question)
+            if key and key not in self._row_of:
+                self._row_of[key] = len(self._entries)
+                self._entries.append({"question": question, "answer": strip_answer_prefix(entry["answer"]), "date": entry["date"]})
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def has_vectors(self) -> bool:
+        return self._vectors is not None
+
+    # ============================
+    # Question Embeddings
+    # ============================
+    def embed(self, embedding_function: Callable, cache_path: Optional[str] = None):
+        """
+        Embeds every question, reusing vectors saved at cache_path for questions
+        that were embedded before and saving the result back there.
+        """
+        with self._lock:
+            entries = list(self._entries)
+        cached = self._load_vectors(cache_path) if cache_path else {}
+        keys = [normalize_question(entry["question"]) for entry in entries]
+        missing = [index for index, key in enumerate(keys) if key not in cached]
+        for start in range(0, len(missing), EMBED_BATCH_SIZE):
+            batch = missing[start:start + EMBED_BATCH_SIZE]
+            for index, vector in zip(batch, embedding_function([entries[index]["question"] for index in batch])):
+                cached[keys[index]] = _unit(vector)
+
+        vectors = np.stack([cached[key] for key in keys]).astype(np.float32) if keys else np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            # Entries added while embedding have no vector yet and only match exactly
+            self._vectors = vectors
+        if cache_path and missing:
+            self._save_vectors(cache_path, keys, vectors)
+        print(f"FAQ index ready: {len(keys)} questions ({len(missing)} newly embedded).")
+
+    def _load_vectors(self, path: str) -> Dict[str, np.ndarray]:
+        if not os.path.exists(path):
+            return {}
+        try:
+            with np.load(path) as store:
+                vectors = np.asarray(store["vectors"], dtype=np.float32)
+                keys = json.loads(store["questions"].tobytes().decode("utf-8"))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable FAQ vectors {path}: {e}")
+            return {}
+        return dict(zip(keys, vectors))
+
+    def _save_vectors(self, path: str, keys: List[str], vectors: np.ndarray):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        buffer = io.BytesIO()
+        np.savez(buffer, vectors=vectors, questions=np.frombuffer(json.dumps(keys).encode("utf-8"), dtype=np.uint8))
+        temp_path = f"{path}.tmp-{os.getpid()}"
+        with open(temp_path, "wb") as store_file:
+            store_file.write(buffer.getvalue())
+        os.replace(temp_path, path)
+
+    # ============================
+    # Updates and Lookups
+    # ============================
+    def add(self, question: str, answer: str, date: str, embedding_function: Optional[Callable] = None):
+        """
+        Adds or replaces the answer to a question, e.g. after a correction.
+        """
+        key = normalize_question(question)
+        if not key:
+            return
+        vector = _unit(embedding_function([question])[0]) if embedding_function is not None and self.has_vectors else None
+        with self._lock:
+            entries = list(self._entries)
+            entry = {"question": question, "answer": strip_answer_prefix(answer), "date": date}
+            row = self._row_of.get(key)
+            if row is None:
+                row = len(entries)
+                entries.append(entry)
+            else:
+                entries[row] = entry
+            vectors = self._vectors
+            if vector is not None and vectors is not None and row <= len(vectors):
+                vectors = np.vstack([vectors, vector[None, :]]) if row == len(vectors) else vectors.copy()
+                vectors[row] = vector
+            self._entries, self._vectors = entries, vectors
+            self._row_of = {**self._row_of, key: row}
+
+    def lookup_exact(self, question: str) -> Optional[FAQMatch]:
+        row = self._row_of.get(normalize_question(question))
+        if row is None:
+            return None
+        entry = self._entries[row]
+        return FAQMatch(entry["question"], entry["answer"], entry["date"], 1.0, "exact")
+
+    def lookup_similar(self, query_embedding) -> Optional[FAQMatch]:
+        """
+        Returns the stored question most similar to the query, if its cosine
+        similarity reaches the threshold.
+        """
+        with self._lock:
+            vectors, entries = self._vectors, self._entries
+        if vectors is None or not len(vectors) or query_embedding is None:
+            return None
+        scores = vectors @ _unit(query_embedding)
+        row = int(np.argmax(scores))
+        score = float(scores[row])
+        if score < self.threshold:
+            return None
+        entry = entries[row]
+        return FAQMatch(entry["question"], entry["answer"], entry["date"], score, "similar")
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
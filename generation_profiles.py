@@ -0,0 +1,90 @@
+# generation_profiles.py
+
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from config import GENERATION_PROFILES_PATH, LLM_CONTEXT_WINDOW
+
+# Subject indexes used by generate_ai_response, by name in the profiles file
+SUBJECT_NAMES = {1: "Tallman", 2: "Sales", 3: "Product", 4: "Tutorial", 5: "General", 6: "Correction"}
+# The model continuing into another QA pair from the context is never part of the answer
+DEFAULT_STOP = ["\nQuestion:", "\nUSER QUESTION:"]
+
+
+class GenerationProfile:
+    """
+    Generation settings for one subject.
+
+    Args:
+        subject (str): Subject name, for logs.
+        max_tokens (int): Tokens reserved for, and the cap on, the response.
+        temperature (float): Sampling temperature.
+        top_p (float): Nucleus sampling threshold.
+        stop (List[str]): Sequences that end the response early (at most 4).
+        context_window (int): The model's total context size in tokens.
+    """
+
+    def __init__(self, subject: str, max_tokens: int, temperature: float = 1.0, top_p: float = 1.0,
+                 stop: Optional[List[str]] = None, context_window: int = LLM_CONTEXT_WINDOW):
+        self.subject = subject
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.stop = list(DEFAULT_STOP if stop is None else stop)[:4]
+        self.context_window = context_window
+
+    def __repr__(self):
+        return f"GenerationProfile({self.subject!r}, max_tokens={self.max_tokens}, temperature={self.temperature})"
+
+
+# Short lookups get short budgets; tutorials and open questions keep the old 1500
+DEFAULT_PROFILES = {
+    1: {"max_tokens": 512, "temperature": 0.7},
+    2: {"max_tokens": 512, "temperature": 0.7},
+    3: {"max_tokens": 768, "temperature": 0.7},
+    4: {"max_tokens": 1500, "temperature": 1.0},
+    5: {"max_tokens": 1500, "temperature": 1.0},
+    6: {"max_tokens": 1000, "temperature": 0.7},
+}
+
+
+def load_generation_profiles(path: str = GENERATION_PROFILES_PATH) -> Dict[int, GenerationProfile]:
+    """
+    Builds the profile of every subject from DEFAULT_PROFILES, overridden by
+    an optional JSON file keyed by subject name:
+
+        {"Tallman": {"max_tokens": 384, "stop": ["\\nQuestion:"]},
+         "Tutorial": {"max_tokens": 2000, "context_window": 131072}}
+
+    A "default" entry applies to every subject before its own entry.
+    """
+    overrides = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as profiles_file:
+            overrides = {name.lower(): settings for name, settings in json.load(profiles_file).items()}
+    profiles = {}
+    for subject, name in SUBJECT_NAMES.items():
+        settings = dict(DEFAULT_PROFILES[subject])
+        settings.update(overrides.get("default", {}))
+        settings.update(overrides.get(name.lower(), {}))
+        profiles[subject] = GenerationProfile(name, **settings)
+    return profiles
+
+
+_profiles: Optional[Dict[int, GenerationProfile]] = None
+_profiles_lock = threading.Lock()
+
+
+def get_profile(subject: int) -> GenerationProfile:
+    """
+    Returns the generation profile for a subject index; unknown subjects get
+    the General profile.
+    """
+    global _profiles
+    if _profiles is None:
+        with _profiles_lock:
+            if _profiles is None:
+                _profiles = load_generation_profiles()
+    return _profiles.get(subject, _profiles[5])
@@ -0,0 +1,382 @@
+# index_manager.py
+
+import datetime
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from compact_index import gc_orphaned_segments
+from config import FAQ_DIRECT_ANSWERS, INDEX_MODE
+from embeddings import collection_options
+from faq_index import FAQIndex, faq_path
+from qa_module import load_qa_data, parse_qa_entries, populate_collection, strip_question_prefix
+from query_cache import invalidate
+from retrieval_backends import open_client, serve, store_directory
+
+# Seconds an old collection stays readable after a swap, so queries that
+# already resolved it can finish before it is dropped.
+RETIRE_DELAY_SECONDS = 10
+# How often a worker checks whether another worker swapped the active version
+POINTER_CHECK_SECONDS = 1.0
+
+
+class KnowledgeIndex:
+    """
+    The live knowledge collection, rebuilt in the background into versioned
+    collections (e.g. tallman_knowledge_v3) and swapped in atomically.
+
+    The active version is recorded in a pointer file next to the ChromaDB data.
+    Attribute access not defined here (query, count, get, ...) is forwarded to
+    the live collection at call time, so the index can be passed anywhere a
+    collection is expected and callers never hold a retired collection.
+    Workers serving the same data check the pointer file every
+    POINTER_CHECK_SECONDS and switch to a version another worker built. A swap
+    drops only versions older than the one it replaced, so the previous
+    version stays usable until every worker has switched.
+
+    With index_mode "compact" each version is served through a CompactCollection
+    (int8 codes with float re-scoring), and with "snapshot" through a
+    SnapshotCollection (a memory-mapped file shared by all workers), instead of
+    the HNSW index. With "numpy" versions are stored and searched by the NumPy
+    backend without ChromaDB. Segment
+    directories left behind by dropped collections are removed on open and
+    after each retirement.
+
+    Each version also gets a FAQIndex over the QA questions (the faq attribute),
+    built with the version so stored questions can be answered without the LLM.
+
+    Args:
+        base_name (str): Collection name prefix, e.g. "tallman_knowledge".
+        qa_data_path (str): Path to the QA data file to index.
+        persist_directory (str): ChromaDB persistence directory.
+        max_lines_per_chunk (int): Chunk size passed to load_qa_data.
+        index_mode (str): One of retrieval_backends.INDEX_MODES.
+    """
+
+    def __init__(self, base_name, qa_data_path, persist_directory="chroma_db", max_lines_per_chunk=100, index_mode=INDEX_MODE):
+        self.base_name = base_name
+        self.qa_data_path = qa_data_path
+        self.persist_directory = persist_directory
+        self.max_lines_per_chunk = max_lines_per_chunk
+        self.index_mode = index_mode
+        self.pointer_path = os.path.join(store_directory(persist_directory, index_mode), f"{base_name}.active.json")
+        self._client = None
+        self._collection = None
+        self._version = 0
+        self._pointer_identity = None
+        self._next_pointer_check = 0.0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self._pending_writes: Optional[List[Dict]] = None
+        self._pending_faq: Optional[List[Dict]] = None
+        self.faq: Optional[FAQIndex] = None
+        self._status = {"state": "idle", "done": 0, "total": 0, "error": None, "started_at": None, "finished_at": None}
+
+    # ============================
+    # Opening the Active Collection
+    # ============================
+    def open(self):
+        """
+        Opens the collection named by the pointer file, adopting a legacy
+        unversioned collection or building version 1 if there is none.
+        """
+        os.makedirs(os.path.dirname(self.pointer_path), exist_ok=True)
+        self._client = open_client(self.persist_directory, self.index_mode)
+        self._open_active()
+        if self.faq is None:
+            # Embedding the questions can take a while; exact matches work meanwhile
+            self.faq = self._open_faq(self._collection, background=True)
+        self._collect_garbage()
+        return self
+
+    def _open_active(self):
+        self._pointer_identity = self._stat_pointer()
+        pointer = self._read_pointer()
+        if pointer is not None:
+            try:
+                self._collection = self._serve(self._client.get_collection(name=pointer["collection"], **collection_options()))
+                self._version = pointer["version"]
+                print(f"Opened '{pointer['collection']}' (version {self._version}).")
+                return
+            except Exception as e:
+                print(f"Active collection '{pointer['collection']}' could not be opened: {e}")
+
+        try:
+            legacy = self._client.get_collection(name=self.base_name, **collection_options())
+            if legacy.count() > 0:
+                self._collection, self._version = self._serve(legacy), 0
+                self._write_pointer(self.base_name, 0)
+                print(f"Adopted existing collection '{self.base_name}' as version 0.")
+                return
+        except Exception:
+            pass
+
+        self._build_version(1)
+
+    def _serve(self, collection):
+        return serve(collection, self.index_mode, self.persist_directory)
+
+    def _follow_pointer(self):
+        """
+        Switches to the active version if another worker swapped the pointer.
+        """
+        now = time.monotonic()
+        if self._closed or now < self._next_pointer_check:
+            return
+        self._next_pointer_check = now + POINTER_CHECK_SECONDS
+        identity = self._stat_pointer()
+        if identity == self._pointer_identity:
+            return
+        self._pointer_identity = identity
+        pointer = self._read_pointer()
+        if pointer is None or pointer["version"] == self._version:
+            return
+        try:
+            serving = self._serve(self._client.get_collection(name=pointer["collection"], **collection_options()))
+        except Exception as e:
+            self._pointer_identity = None  # Retried at the next check
+            print(f"Failed to open '{pointer['collection']}' after another worker swapped it in: {e}")
+            return
+        faq = self._open_faq(serving, background=True)
+        with self._lock:
+            if self._pending_writes is not None:
+                return  # This worker's own rebuild decides the next version
+            self._collection, self._version, self.faq = serving, pointer["version"], faq
+        invalidate(f"'{pointer['collection']}' was swapped in by another worker")
+        print(f"Switched to '{pointer['collection']}' (version {pointer['version']}).")
+
+    def close(self):
+        """
+        Releases an index that is no longer served, e.g. one evicted by
+        KnowledgeBaseRegistry: pending snapshot exports are written out and the
+        pointer file is no longer followed. Requests already holding the index
+        can still finish with it. HNSW segments stay in ChromaDB's shared segment
+        cache until CHROMA_MEMORY_LIMIT_MB evicts them.
+        """
+        with self._lock:
+            self._closed = True
+            collection, self.faq = self._collection, None
+        close = getattr(collection, "close", None)
+        if close is not None:
+            close()
+
+    @property
+    def collection(self):
+        self._follow_pointer()
+        return self._collection
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def collection_name(self) -> str:
+        return self._collection.name
+
+    def __getattr__(self, name):
+        # Only reached for attributes not defined on the index itself
+        if name.startswith("__") or self.__dict__.get("_collection") is None:
+            raise AttributeError(name)
+        self._follow_pointer()
+        return getattr(self._collection, name)
+
+    def upsert(self, documents, ids, metadatas=None, **kwargs):
+        """
+        Upserts into the live collection and, while a rebuild is running,
+        remembers the write so it is replayed into the new version before the swap.
+        """
+        self._follow_pointer()
+        with self._lock:
+            collection = self._collection
+            if self._pending_writes is not None:
+                self._pending_writes.append({"documents": documents, "ids": ids, "metadatas": metadatas, **kwargs})
+        try:
+            return collection.upsert(documents=documents, ids=ids, metadatas=metadatas, **kwargs)
+        finally:
+            invalidate(f"upsert into '{collection.name}'")
+
+    def add_faq_entry(self, question: str, answer: str, date: str):
+        """
+        Adds a corrected answer to the live FAQ index, and to the one being
+        built if a rebuild is running.
+        """
+        with self._lock:
+            faq, collection = self.faq, self._collection
+            if self._pending_faq is not None:
+                self._pending_faq.append({"question": question, "answer": answer, "date": date})
+        if faq is not None:
+            faq.add(question, answer, date, embedding_function=getattr(collection, "_embedding_function", None))
+
+    # ============================
+    # FAQ Index
+    # ============================
+    def _open_faq(self, collection, background: bool = False) -> Optional[FAQIndex]:
+        if not FAQ_DIRECT_ANSWERS:
+            return None
+        try:
+            entries = parse_qa_entries(self.qa_data_path)
+            faq = FAQIndex([{**entry, "question": strip_question_prefix(entry["question"])} for entry in entries])
+        except Exception as e:
+            print(f"Failed to build the FAQ index: {e}")
+            return None
+        embedding_function = getattr(collection, "_embedding_function", None)
+        if embedding_function is None:
+            return faq  # Exact matches only
+        path = faq_path(self.persist_directory, collection.name)
+        if background:
+            threading.Thread(target=self._embed_faq, args=(faq, embedding_function, path), name=f"faq-{collection.name}", daemon=True).start()
+        else:
+            self._embed_faq(faq, embedding_function, path)
+        return faq
+
+    def _embed_faq(self, faq: FAQIndex, embedding_function, path: str):
+        try:
+            faq.embed(embedding_function, cache_path=path)
+        except Exception as e:
+            print(f"Failed to embed FAQ questions: {e}")
+
+    # ============================
+    # Background Rebuild
+    # ============================
+    def rebuild_async(self) -> bool:
+        """
+        Starts rebuilding the index from qa_data_path in a background thread.
+
+        Returns:
+            bool: False if a rebuild is already running.
+        """
+        with self._lock:
+            if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+                return False
+            self._pending_writes = []
+            self._pending_faq = []
+            self._status = {
+                "state": "running",
+                "done": 0,
+                "total": 0,
+                "error": None,
+                "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                "finished_at": None,
+            }
+            self._rebuild_thread = threading.Thread(target=self._rebuild, name=f"rebuild-{self.base_name}", daemon=True)
+            self._rebuild_thread.start()
+        return True
+
+    def status(self) -> Dict:
+        """
+        Returns the rebuild state, progress and active version for display.
+        """
+        with self._lock:
+            status = dict(self._status)
+        status["version"] = self._version
+        status["collection"] = self._collection.name if self._collection is not None else None
+        status["index_mode"] = self.index_mode
+        return status
+
+    def _rebuild(self):
+        new_version = self._version + 1
+        try:
+            self._build_version(new_version)
+            with self._lock:
+                self._status.update(state="succeeded", finished_at=datetime.datetime.now().isoformat(timespec="seconds"))
+            self._retire(new_version)
+        except Exception as e:
+            print(f"Rebuild of '{self.base_name}' failed: {e}")
+            with self._lock:
+                self._pending_writes = None
+                self._pending_faq = None
+                self._status.update(state="failed", error=str(e), finished_at=datetime.datetime.now().isoformat(timespec="seconds"))
+
+    def _build_version(self, version: int):
+        name = f"{self.base_name}_v{version}"
+        print(f"Building collection '{name}'.")
+        try:
+            self._client.delete_collection(name=name)  # Leftover from an interrupted rebuild
+        except Exception:
+            pass
+
+        chunks = load_qa_data(self.qa_data_path, self.max_lines_per_chunk)
+        with self._lock:
+            self._status["total"] = len(chunks)
+        collection = self._client.create_collection(name=name, **collection_options())
+        populate_collection(collection, chunks, progress_callback=self._on_progress)
+        serving = self._serve(collection)
+        faq = self._open_faq(serving)
+
+        with self._lock:
+            # Corrections written while the rebuild was running
+            for write in self._pending_writes or []:
+                serving.upsert(**write)
+            self._pending_writes = None
+            pending_faq, self._pending_faq = self._pending_faq or [], None
+            self._write_pointer(name, version)
+            self._pointer_identity = self._stat_pointer()
+            self._collection, self._version, self.faq = serving, version, faq
+        for entry in pending_faq if faq is not None else []:
+            faq.add(**entry, embedding_function=getattr(serving, "_embedding_function", None))
+        invalidate(f"'{name}' is now live")
+        print(f"Collection '{name}' is now live.")
+
+    def _retire(self, live_version: int):
+        """
+        Drops the version before the one just replaced. The replaced version is
+        kept, since other workers may still be serving it until their next
+        pointer check; it is dropped by the following rebuild.
+        """
+        retired_version = live_version - 2
+        if retired_version < 0:
+            return
+        # Version 0 is an adopted legacy collection without a version suffix
+        name = self.base_name if retired_version == 0 else f"{self.base_name}_v{retired_version}"
+        time.sleep(RETIRE_DELAY_SECONDS)
+        try:
+            self._client.get_collection(name=name, **collection_options())
+        except Exception:
+            return  # Already dropped, or there never was a legacy collection
+        try:
+            self._client.delete_collection(name=name)
+            print(f"Dropped retired collection '{name}'.")
+        except Exception as e:
+            print(f"Failed to drop retired collection '{name}': {e}")
+        self._collect_garbage()
+
+    def _collect_garbage(self):
+        try:
+            # The numpy backend's collections are not in chroma.sqlite3, so name them
+            other_collections = self._client.list_collections() if self.index_mode == "numpy" else ()
+            gc_orphaned_segments(self.persist_directory, other_collections=other_collections)
+        except Exception as e:
+            print(f"Failed to remove orphaned segments in {self.persist_directory}: {e}")
+
+    def _on_progress(self, done: int, total: int):
+        with self._lock:
+            self._status.update(done=done, total=total)
+
+    # ============================
+    # Pointer File
+    # ============================
+    def _stat_pointer(self):
+        try:
+            stat = os.stat(self.pointer_path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _read_pointer(self) -> Optional[Dict]:
+        if not os.path.exists(self.pointer_path):
+            return None
+        try:
+            with open(self.pointer_path, "r", encoding="utf-8") as pointer_file:
+                return json.load(pointer_file)
+        except (OSError, ValueError) as e:
+            print(f"Failed to read index pointer {self.pointer_path}: {e}")
+            return None
+
+    def _write_pointer(self, collection_name: str, version: int):
+        temp_path = f"{self.pointer_path}.tmp-{os.getpid()}"
+        with open(temp_path, "w", encoding="utf-8") as pointer_file:
+            json.dump({"collection": collection_name, "version": version}, pointer_file)
+        os.replace(temp_path, self.pointer_path)
@@ -0,0 +1,383 @@
+# index_snapshot.py
+#
+# A read-only, memory-mapped snapshot of a knowledge collection
+# (INDEX_MODE=snapshot). Every worker process maps the same file, so the vectors
+# and documents live once in the OS page cache instead of once per process.
+#
+#     python index_snapshot.py chroma_db/snapshots/tallman_knowledge_v2.snap
+
+import datetime
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from compact_index import export_records
+from query_cache import invalidate
+from retrieval_backends import RetrievalBackend
+
+SNAPSHOT_DIRNAME = "snapshots"  # Listed in compact_index.DERIVED_DIRNAMES for cleanup
+SNAPSHOT_SUFFIX = ".snap"
+MAGIC = b"TALLSNP1"
+HEADER_BYTES = 4096
+ALIGNMENT = 64
+
+# How often a reader checks whether the snapshot file was replaced
+RELOAD_CHECK_SECONDS = 1.0
+# Delay before re-exporting after a write, so a burst of corrections is exported once
+EXPORT_DELAY_SECONDS = 2.0
+
+
+def snapshot_path(persist_directory: str, collection_name: str) -> str:
+    return os.path.join(persist_directory, SNAPSHOT_DIRNAME, f"{collection_name}{SNAPSHOT_SUFFIX}")
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _string_section(values: List[str]):
+    """
+    Encodes strings as one UTF-8 blob plus uint64 offsets (N + 1 entries).
+    """
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return offsets, b"".join(encoded)
+
+
+# ============================
+# Writing
+# ============================
+def write_snapshot(collection, path: str) -> Dict:
+    """
+    Exports a collection into a single snapshot file.
+
+    Layout: an 8-byte magic and a JSON header padded to HEADER_BYTES, followed
+    by 64-byte aligned sections: the float32 vector matrix, squared norms, and
+    offsets plus UTF-8 blobs for ids, documents and metadata (as JSON). The file
+    is written under a temporary name and moved into place, so readers only ever
+    see a complete snapshot.
+
+    Returns:
+        Dict: The header.
+    """
+    ids, documents, metadatas, vectors, space = export_records(collection)
+    id_offsets, id_blob = _string_section(ids)
+    document_offsets, document_blob = _string_section([document or "" for document in documents])
+    metadata_offsets, metadata_blob = _string_section([json.dumps(metadata) for metadata in metadatas])
+    sections = [
+        ("vectors", np.ascontiguousarray(vectors, dtype=np.float32).tobytes()),
+        ("norms", np.einsum("ij,ij->i", vectors, vectors).astype(np.float32).tobytes()),
+        ("id_offsets", id_offsets.tobytes()),
+        ("ids", id_blob),
+        ("document_offsets", document_offsets.tobytes()),
+        ("documents", document_blob),
+        ("metadata_offsets", metadata_offsets.tobytes()),
+        ("metadatas", metadata_blob),
+    ]
+
+    header = {
+        "collection": collection.name,
+        "count": len(ids),
+        "dimension": int(vectors.shape[1]),
+        "space": space,
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "sections": {},
+    }
+    offset = HEADER_BYTES
+    for name, data in sections:
+        offset = _align(offset)
+        header["sections"][name] = [offset, len(data)]
+        offset += len(data)
+    header_bytes = json.dumps(header).encode("utf-8")
+    if len(MAGIC) + 4 + len(header_bytes) > HEADER_BYTES:
+        raise ValueError("Snapshot header does not fit in HEADER_BYTES.")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{os.path.splitext(path)[0]}.tmp-{os.getpid()}"
+    with open(temp_path, "wb") as snapshot_file:
+        snapshot_file.write(MAGIC)
+        snapshot_file.write(len(header_bytes).to_bytes(4, "little"))
+        snapshot_file.write(header_bytes)
+        for name, data in sections:
+            snapshot_file.seek(header["sections"][name][0])
+            snapshot_file.write(data)
+        snapshot_file.truncate(offset)  # Pads the file when trailing sections are empty
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temp_path, path)
+    print(f"Wrote snapshot of '{collection.name}': {len(ids)} vectors, {offset / 1e6:.1f} MB, {path}")
+    return header
+
+
+# ============================
+# Reading
+# ============================
+class Snapshot:
+    """
+    A memory-mapped snapshot file. Arrays are zero-copy views of the mapping.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as snapshot_file:
+            stat = os.fstat(snapshot_file.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an index snapshot.")
+        header_length = int.from_bytes(self._map[len(MAGIC):len(MAGIC) + 4], "little")
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._map[start:start + header_length].decode("utf-8"))
+        self.count = self.header["count"]
+        self.dimension = self.header["dimension"]
+        self.space = self.header["space"]
+        self.vectors = self._array("vectors", np.float32).reshape(self.count, self.dimension)
+        self.norms = self._array("norms", np.float32)
+        self._id_offsets = self._array("id_offsets", np.uint64)
+        self._document_offsets = self._array("document_offsets", np.uint64)
+        self._metadata_offsets = self._array("metadata_offsets", np.uint64)
+        self.ids = [self._string("ids", self._id_offsets, row) for row in range(self.count)]
+        self.row_of = {record_id: row for row, record_id in enumerate(self.ids)}
+
+    def _array(self, name: str, dtype) -> np.ndarray:
+        offset, length = self.header["sections"][name]
+        return np.frombuffer(self._map, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset)
+
+    def _string(self, name: str, offsets: np.ndarray, row: int) -> str:
+        base = self.header["sections"][name][0]
+        return self._map[base + int(offsets[row]):base + int(offsets[row + 1])].decode("utf-8")
+
+    def document(self, row: int) -> str:
+        return self._string("documents", self._document_offsets, row)
+
+    def metadata(self, row: int) -> Optional[dict]:
+        return json.loads(self._string("metadatas", self._metadata_offsets, row))
+
+    def changed_on_disk(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size) != self.identity
+
+
+class SnapshotCollection(RetrievalBackend):
+    """
+    Serves exact nearest-neighbour queries for a collection from a shared snapshot.
+
+    Each query is one matrix-vector product over the mapped float32 matrix and an
+    argpartition for the top results; distances match the collection's space
+    (squared L2 by default). Readers notice when the snapshot file is replaced
+    and map the new one.
+
+    Writes go to the ChromaDB collection and to a small in-memory overlay, so
+    they are searchable immediately in this process. The writer then re-exports
+    the snapshot in the background, which is how other workers pick them up.
+    Anything else (get, delete, ...) is forwarded to the ChromaDB collection.
+
+    Args:
+        collection: The ChromaDB collection the snapshot was exported from.
+        path (str): The snapshot file.
+    """
+
+    def __init__(self, collection, path: str):
+        self._source = collection
+        self.path = path
+        self._snapshot = Snapshot(path)
+        self._lock = threading.Lock()
+        self._overlay: Dict[str, tuple] = {}
+        self._write_seq = 0
+        self._next_check = time.monotonic() + RELOAD_CHECK_SECONDS
+        self._export_timer: Optional[threading.Timer] = None
+
+    @classmethod
+    def open(cls, collection, persist_directory: str):
+        """
+        Opens the snapshot for a collection, exporting it first if missing.
+        """
+        path = snapshot_path(persist_directory, collection.name)
+        if not os.path.exists(path):
+            write_snapshot(collection, path)
+        return cls(collection, path)
+
+    @property
+    def name(self) -> str:
+        return self._source.name
+
+    @property
+    def source(self):
+        return self._source
+
+    def __getattr__(self, name):
+        # Only reached for attributes not defined here (get, delete, _embedding_function, ...)
+        if name.startswith("__") or "_source" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self._source, name)
+
+    def count(self) -> int:
+        with self._lock:
+            snapshot, overlay = self._snapshot, self._overlay
+            return snapshot.count + sum(1 for record_id in overlay if record_id not in snapshot.row_of)
+
+    # ============================
+    # Queries
+    # ============================
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, include=("documents", "distances"), where=None, where_document=None, **kwargs):
+        """
+        Chroma-compatible query over the snapshot.
+
+        Metadata and document filters are answered by the ChromaDB collection.
+        """
+        if where or where_document or kwargs:
+            return self._source.query(
+                query_embeddings=query_embeddings, query_texts=query_texts, n_results=n_results,
+                include=list(include), where=where, where_document=where_document, **kwargs
+            )
+        if query_embeddings is None:
+            query_embeddings = self._source._embedding_function(list(query_texts))
+        self._maybe_reload()
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query_embedding in query_embeddings:
+            hits = self._search(np.asarray(query_embedding, dtype=np.float32), n_results, "metadatas" in include)
+            results["ids"].append([hit[0] for hit in hits])
+            results["documents"].append([hit[1] for hit in hits])
+            results["metadatas"].append([hit[2] for hit in hits])
+            results["distances"].append([hit[3] for hit in hits])
+        for key in ("documents", "metadatas", "distances"):
+            if key not in include:
+                results[key] = None
+        results["embeddings"] = None
+        return results
+
+    def _search(self, query: np.ndarray, n_results: int, with_metadata: bool) -> List[tuple]:
+        with self._lock:
+            snapshot = self._snapshot
+            overlay = list(self._overlay.items())
+        space = snapshot.space
+        if space == "cosine":
+            query = query / (np.linalg.norm(query) or 1.0)
+        query_norm = float(query @ query)
+
+        def distances(dots, norms):
+            if space == "l2":
+                return norms - 2.0 * dots + query_norm
+            return 1.0 - dots
+
+        hits = []
+        if snapshot.count and n_results > 0:
+            scores = distances(snapshot.vectors @ query, snapshot.norms)
+            # Rows replaced by a newer write are answered from the overlay
+            for record_id, _ in overlay:
+                row = snapshot.row_of.get(record_id)
+                if row is not None:
+                    scores[row] = np.inf
+            top = min(snapshot.count, n_results)
+            rows = np.argpartition(scores, top - 1)[:top]
+            hits.extend(
+                (snapshot.ids[row], snapshot.document(row), snapshot.metadata(row) if with_metadata else None, float(scores[row]))
+                for row in rows.tolist()
+                if np.isfinite(scores[row])
+            )
+
+        for record_id, (vector, document, metadata, norm, _) in overlay:
+            hits.append((record_id, document, metadata, float(distances(np.float32(vector @ query), norm))))
+
+        hits.sort(key=lambda hit: hit[3])
+        return hits[:n_results]
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + RELOAD_CHECK_SECONDS
+        if self._snapshot.changed_on_disk():
+            self.reload()
+
+    def reload(self, exported_seq: Optional[int] = None):
+        """
+        Maps the current snapshot file and drops overlay entries it now contains.
+        """
+        try:
+            snapshot = Snapshot(self.path)
+        except (OSError, ValueError) as e:
+            print(f"Failed to map snapshot {self.path}: {e}")
+            return
+        with self._lock:
+            # Old arrays stay valid until the last query using them finishes
+            self._snapshot = snapshot
+            if exported_seq is not None:
+                self._overlay = {key: value for key, value in self._overlay.items() if value[4] > exported_seq}
+        invalidate(f"snapshot {os.path.basename(self.path)} reloaded")
+
+    # ============================
+    # Writes
+    # ============================
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None, **kwargs):
+        """
+        Upserts into the ChromaDB collection and the overlay, then schedules a re-export.
+        """
+        result = self._source.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings, **kwargs)
+        if embeddings is None:
+            embeddings = self._source._embedding_function(list(documents))
+        with self._lock:
+            for i, record_id in enumerate(ids):
+                self._write_seq += 1
+                vector = np.asarray(embeddings[i], dtype=np.float32)
+                if self._snapshot.space == "cosine":
+                    vector = vector / (np.linalg.norm(vector) or 1.0)
+                self._overlay[record_id] = (
+                    vector,
+                    documents[i] if documents is not None else None,
+                    metadatas[i] if metadatas is not None else None,
+                    float(vector @ vector),
+                    self._write_seq,
+                )
+            if self._export_timer is None:
+                self._export_timer = threading.Timer(EXPORT_DELAY_SECONDS, self._export)
+                self._export_timer.daemon = True
+                self._export_timer.start()
+        return result
+
+    def close(self):
+        """
+        Writes out pending writes now instead of on the re-export timer.
+        """
+        with self._lock:
+            timer = self._export_timer
+        if timer is not None:
+            timer.cancel()
+            self._export()
+
+    def _export(self):
+        with self._lock:
+            self._export_timer = None
+            exported_seq = self._write_seq
+        try:
+            write_snapshot(self._source, self.path)
+            self.reload(exported_seq)
+        except Exception as e:
+            # The overlay keeps serving the writes; the next write retries the export
+            print(f"Failed to re-export snapshot {self.path}: {e}")
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python index_snapshot.py <snapshot file>")
+        sys.exit(1)
+    snapshot = Snapshot(sys.argv[1])
+    print(json.dumps(snapshot.header, indent=2))
+    for row in range(min(3, snapshot.count)):
+        print(f"{snapshot.ids[row]}: {snapshot.document(row)[:80]!r}")
+
+
+if __name__ == "__main__":
+    main()
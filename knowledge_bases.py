@@ -0,0 +1,190 @@
+# knowledge_bases.py
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from config import CORRECTION_QUEUE_PATH, KNOWLEDGE_BASES_MAX_OPEN, KNOWLEDGE_BASES_PATH, script_dir
+from metrics import KNOWLEDGE_BASE_EVICTIONS, KNOWLEDGE_BASE_OPENS, KNOWLEDGE_BASES_OPEN
+
+DEFAULT_KNOWLEDGE_BASE = "tallman"
+
+
+class KnowledgeBase:
+    """
+    One configured knowledge base: a QA source file indexed into its own collection.
+
+    Args:
+        name (str): Identifier used in session state and file names.
+        title (str): Label shown to users.
+        qa_data_path (str): The QA data file; relative paths are resolved against the app directory.
+        collection (str): Collection base name for KnowledgeIndex.
+        roles (List[str]): Roles that may use it; empty means every role.
+        users (List[str]): Usernames that may use it regardless of role.
+        correction_queue_path (str): Base path of the correction queue journals;
+            knowledge bases other than the default get "<base>_<name>.sqlite3".
+    """
+
+    def __init__(self, name: str, title: str, qa_data_path: str, collection: str, roles: Optional[List[str]] = None,
+                 users: Optional[List[str]] = None, correction_queue_path: str = CORRECTION_QUEUE_PATH):
+        self.name = name
+        self.title = title
+        self.qa_data_path = qa_data_path if os.path.isabs(qa_data_path) else os.path.join(script_dir, qa_data_path)
+        self.collection = collection
+        self.roles = [role.strip().lower() for role in roles or []]
+        self.users = [user.strip().lower() for user in users or []]
+        if name == DEFAULT_KNOWLEDGE_BASE:
+            self.correction_queue_path = correction_queue_path  # The original queue file
+        else:
+            root, extension = os.path.splitext(correction_queue_path)
+            self.correction_queue_path = f"{root}_{name}{extension}"
+
+    def allows(self, username: Optional[str], role: Optional[str]) -> bool:
+        if role == "admin" or (username or "").lower() in self.users:
+            return True
+        return not self.roles or (role or "").lower() in self.roles
+
+
+def load_knowledge_bases(path: str = KNOWLEDGE_BASES_PATH, default_qa_data_path: Optional[str] = None,
+                         correction_queue_path: str = CORRECTION_QUEUE_PATH) -> List[KnowledgeBase]:
+    """
+    Reads the knowledge base list from a JSON file:
+
+        {"knowledge_bases": [{"name": "tallman", "title": "Tallman Equipment",
+          "qa_data": "QA_data/qa_data.txt", "collection": "tallman_knowledge",
+          "roles": ["user"], "users": []}]}
+
+    Without the file, the single original knowledge base is served from
+    default_qa_data_path (QA_data/qa_data.txt by default).
+    """
+    if not os.path.exists(path):
+        qa_data_path = default_qa_data_path or os.path.join("QA_data", "qa_data.txt")
+        return [KnowledgeBase(DEFAULT_KNOWLEDGE_BASE, "Tallman Equipment", qa_data_path, "tallman_knowledge", correction_queue_path=correction_queue_path)]
+    with open(path, "r", encoding="utf-8") as config_file:
+        entries = json.load(config_file)["knowledge_bases"]
+    knowledge_bases = []
+    for entry in entries:
+        name = entry["name"].strip().lower()
+        knowledge_bases.append(KnowledgeBase(
+            name,
+            entry.get("title", name),
+            entry.get("qa_data", os.path.join("QA_data", f"{name}.txt")),
+            entry.get("collection", f"{name}_knowledge"),
+            roles=entry.get("roles"),
+            users=entry.get("users"),
+            correction_queue_path=correction_queue_path,
+        ))
+    if not knowledge_bases:
+        raise ValueError(f"No knowledge bases configured in {path}")
+    return knowledge_bases
+
+
+class KnowledgeBaseRegistry:
+    """
+    Opens knowledge bases on first use and keeps at most max_open of them
+    loaded, dropping the least recently used one when another is opened.
+
+    Callers hold a KnowledgeBaseHandle rather than the index, so an evicted
+    knowledge base is closed (KnowledgeIndex.close), released once in-flight
+    requests finish with it and reopened transparently on its next use. A knowledge base that is
+    rebuilding is never evicted.
+
+    Args:
+        knowledge_bases (List[KnowledgeBase]): The configured knowledge bases.
+        max_open (int): Maximum loaded knowledge bases; 0 means unlimited.
+        persist_directory (str): ChromaDB persistence directory shared by all of them.
+    """
+
+    def __init__(self, knowledge_bases: List[KnowledgeBase], max_open: int = KNOWLEDGE_BASES_MAX_OPEN, persist_directory: str = "chroma_db"):
+        self.knowledge_bases: Dict[str, KnowledgeBase] = {kb.name: kb for kb in knowledge_bases}
+        self.max_open = max_open
+        self.persist_directory = persist_directory
+        self._open: "OrderedDict[str, object]" = OrderedDict()
+        self._opening: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def default(self) -> str:
+        return DEFAULT_KNOWLEDGE_BASE if DEFAULT_KNOWLEDGE_BASE in self.knowledge_bases else next(iter(self.knowledge_bases))
+
+    def allowed(self, username: Optional[str], role: Optional[str]) -> List[KnowledgeBase]:
+        return [kb for kb in self.knowledge_bases.values() if kb.allows(username, role)]
+
+    def is_open(self, name: str) -> bool:
+        with self._lock:
+            return name in self._open
+
+    def handle(self, name: str) -> "KnowledgeBaseHandle":
+        if name not in self.knowledge_bases:
+            raise KeyError(f"Unknown knowledge base {name!r}")
+        return KnowledgeBaseHandle(self, name)
+
+    def get(self, name: str):
+        """
+        Returns the open KnowledgeIndex for a knowledge base, opening it if needed.
+        """
+        with self._lock:
+            index = self._open.get(name)
+            if index is not None:
+                self._open.move_to_end(name)
+                return index
+            opening = self._opening.setdefault(name, threading.Lock())
+
+        # One opener per knowledge base; others wait for it instead of opening twice
+        with opening:
+            with self._lock:
+                index = self._open.get(name)
+                if index is not None:
+                    self._open.move_to_end(name)
+                    return index
+            from index_manager import KnowledgeIndex
+
+            kb = self.knowledge_bases[name]
+            index = KnowledgeIndex(kb.collection, kb.qa_data_path, self.persist_directory).open()
+            KNOWLEDGE_BASE_OPENS.inc(knowledge_base=name)
+            with self._lock:
+                self._open[name] = index
+                evicted = self._evict()
+                KNOWLEDGE_BASES_OPEN.set(len(self._open))
+            for evicted_name, evicted_index in evicted:
+                try:
+                    evicted_index.close()
+                except Exception as e:
+                    print(f"Failed to close knowledge base '{evicted_name}': {e}")
+            return index
+
+    def _evict(self) -> List[tuple]:
+        # Called with the lock held; the caller closes the returned (name, index) pairs
+        evicted = []
+        if not self.max_open:
+            return evicted
+        for name in list(self._open):
+            if len(self._open) <= self.max_open:
+                break
+            if name == next(reversed(self._open)):
+                break
+            if self._open[name].status()["state"] == "running":
+                continue
+            evicted.append((name, self._open.pop(name)))
+            KNOWLEDGE_BASE_EVICTIONS.inc(knowledge_base=name)
+            print(f"Knowledge base '{name}' evicted (least recently used).")
+        return evicted
+
+
+class KnowledgeBaseHandle:
+    """
+    A stable reference to a knowledge base that resolves to its open
+    KnowledgeIndex on every attribute access, so it can be stored and used
+    anywhere a collection is expected.
+    """
+
+    def __init__(self, registry: KnowledgeBaseRegistry, name: str):
+        self.registry = registry
+        self.knowledge_base = name
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.registry.get(self.knowledge_base), name)
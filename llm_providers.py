@@ -0,0 +1,390 @@
+# llm_providers.py
+
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterator, List, Optional
+
+from config import (
+    GROQ_MODEL,
+    LLAMACPP_BASE_URL,
+    LLAMACPP_MODEL,
+    LLM_HEDGE,
+    LLM_HEDGE_MIN_MS,
+    LLM_PROVIDERS,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    OPENAI_MODEL,
+)
+from metrics import LLM_FALLBACKS, LLM_HEDGES, LLM_PROVIDER_REQUESTS, LLM_PROVIDER_TTFT
+
+# A provider is skipped for COOLDOWN_SECONDS after this many failures in a row
+FAILURES_BEFORE_COOLDOWN = 3
+COOLDOWN_SECONDS = 30.0
+# Assumed time-to-first-token before a provider has been measured
+DEFAULT_TTFT_SECONDS = 1.0
+# TTFT samples needed before the p95 is trusted as the hedge delay
+MIN_HEDGE_SAMPLES = 20
+
+
+class ProviderError(RuntimeError):
+    """
+    A failed provider call. status_code and response.headers mirror the Groq SDK
+    errors, so the LLM scheduler recognizes 429s from any provider.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = SimpleNamespace(
+            status_code=status_code,
+            headers={key.lower(): value for key, value in (headers or {}).items()},
+        )
+
+
+# ============================
+# Providers
+# ============================
+class LLMProvider:
+    """
+    A chat model endpoint. stream_chat yields the response text in chunks and
+    raises before the first chunk if the request fails.
+    """
+
+    def __init__(self, name: str, model: str):
+        self.name = name
+        self.model = model
+
+    def stream_chat(self, messages: List[Dict], max_tokens: int, temperature: float = 1.0, top_p: float = 1.0,
+                    stop: Optional[List[str]] = None) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class GroqProvider(LLMProvider):
+    def __init__(self, name: str, api_key: str, model: str, base_url: Optional[str] = None):
+        super().__init__(name, model)
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+
+    def stream_chat(self, messages, max_tokens, temperature=1.0, top_p=1.0, stop=None):
+        if self._client is None:
+            from groq import Groq
+
+            self._client = Groq(api_key=self.api_key, base_url=self.base_url)
+        completion = self._client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            top_p=top_p,
+            stream=True,
+            stop=stop or None,
+        )
+        for chunk in completion:
+            # Access the content attribute safely
+            content = getattr(chunk.choices[0].delta, "content", "")
+            if content:
+                yield content
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    Any server implementing the OpenAI chat completions API with streaming
+    (OpenAI, vLLM, Together, the Groq /openai/v1 endpoint, benchmarks/fake_llm.py).
+
+    Args:
+        base_url (str): API root including the version, e.g. https://api.openai.com/v1.
+    """
+
+    def __init__(self, name: str, base_url: str, model: str, api_key: Optional[str] = None, timeout: float = 60.0):
+        super().__init__(name, model)
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def stream_chat(self, messages, max_tokens, temperature=1.0, top_p=1.0, stop=None):
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": top_p,
+            "stream": True,
+        }
+        if stop:
+            payload["stop"] = stop
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Accept": "text/event-stream"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(f"{self.base_url}/chat/completions", data=body, headers=headers, method="POST")
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            detail = e.read()[:200].decode("utf-8", "replace")
+            raise ProviderError(f"{self.name} returned HTTP {e.code}: {detail}", status_code=e.code, headers=dict(e.headers))
+        except (urllib.error.URLError, OSError) as e:
+            raise ProviderError(f"{self.name} is unreachable: {e}")
+
+        with response:
+            for raw_line in response:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                choices = json.loads(data).get("choices") or []
+                content = (choices[0].get("delta") or {}).get("content") if choices else None
+                if content:
+                    yield content
+
+
+class LlamaCppProvider(OpenAICompatibleProvider):
+    """
+    A local llama.cpp `llama-server`, which serves the OpenAI chat API under /v1.
+    """
+
+    def __init__(self, name: str = "llamacpp", base_url: str = "http://127.0.0.1:8080/v1", model: str = "local", timeout: float = 120.0):
+        super().__init__(name, base_url, model, timeout=timeout)
+
+
+# ============================
+# Routing
+# ============================
+class ProviderStats:
+    """
+    EWMA time-to-first-token and error rate for one provider, plus recent TTFT
+    samples for the hedge delay and a cooldown after repeated failures.
+    """
+
+    def __init__(self, alpha: float = 0.2, window: int = 200):
+        self.alpha = alpha
+        self.ttft_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self._ttfts = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record_success(self, ttft_seconds: float):
+        with self._lock:
+            self.ttft_ewma = ttft_seconds if self.ttft_ewma is None else self.alpha * ttft_seconds + (1 - self.alpha) * self.ttft_ewma
+            self.error_ewma *= 1 - self.alpha
+            self.consecutive_failures = 0
+            self._ttfts.append(ttft_seconds)
+
+    def record_failure(self):
+        with self._lock:
+            self.error_ewma = self.alpha + (1 - self.alpha) * self.error_ewma
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= FAILURES_BEFORE_COOLDOWN:
+                self.cooldown_until = time.monotonic() + COOLDOWN_SECONDS
+
+    def p95_ttft(self) -> Optional[float]:
+        with self._lock:
+            if len(self._ttfts) < MIN_HEDGE_SAMPLES:
+                return None
+            ordered = sorted(self._ttfts)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def score(self) -> float:
+        # Expected wait, inflated by the recent error rate
+        return (self.ttft_ewma if self.ttft_ewma is not None else DEFAULT_TTFT_SECONDS) * (1.0 + 4.0 * self.error_ewma)
+
+    def available(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+
+class LLMRouter:
+    """
+    Sends each chat request to the provider with the lowest expected
+    time-to-first-token, falling back to the next one if it fails before the
+    first chunk (a response is never spliced across providers).
+
+    With hedge=True, if the first provider has not produced a chunk after its
+    p95 time-to-first-token (at least hedge_min_seconds), the request is also
+    sent to the next provider; whichever streams first wins and the other is
+    abandoned. Hedging trades extra provider load for tail latency.
+
+    Args:
+        providers (List[LLMProvider]): In preference order for ties.
+        hedge (bool): Enable hedged requests.
+        hedge_min_seconds (float): Lower bound for the hedge delay.
+    """
+
+    def __init__(self, providers: List[LLMProvider], hedge: bool = False, hedge_min_seconds: float = 0.8):
+        if not providers:
+            raise ValueError("LLMRouter needs at least one provider.")
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.hedge_min_seconds = hedge_min_seconds
+        self.stats = {provider.name: ProviderStats() for provider in self.providers}
+
+    def ranked(self) -> List[LLMProvider]:
+        now = time.monotonic()
+        available = [provider for provider in self.providers if self.stats[provider.name].available(now)]
+        if not available:
+            # Everything is cooling down; try the one that recovers first
+            return sorted(self.providers, key=lambda provider: self.stats[provider.name].cooldown_until)
+        return sorted(available, key=lambda provider: self.stats[provider.name].score())
+
+    def _hedge_delay(self, provider: LLMProvider) -> float:
+        return max(self.hedge_min_seconds, self.stats[provider.name].p95_ttft() or 0.0)
+
+    def _attempt(self, provider: LLMProvider, messages, params) -> Iterator[str]:
+        stats = self.stats[provider.name]
+        start = time.perf_counter()
+        first_chunk = True
+        try:
+            for chunk in provider.stream_chat(messages, **params):
+                if first_chunk:
+                    first_chunk = False
+                    ttft = time.perf_counter() - start
+                    stats.record_success(ttft)
+                    LLM_PROVIDER_TTFT.observe(ttft, provider=provider.name)
+                yield chunk
+        except Exception:
+            stats.record_failure()
+            LLM_PROVIDER_REQUESTS.inc(provider=provider.name, outcome="error")
+            raise
+        if first_chunk:
+            stats.record_success(time.perf_counter() - start)
+        LLM_PROVIDER_REQUESTS.inc(provider=provider.name, outcome="ok")
+
+    def stream_chat(self, messages: List[Dict], max_tokens: int, temperature: float = 1.0, top_p: float = 1.0,
+                    stop: Optional[List[str]] = None) -> Iterator[str]:
+        params = {"max_tokens": max_tokens, "temperature": temperature, "top_p": top_p, "stop": stop}
+        candidates = self.ranked()
+        if self.hedge and len(candidates) > 1:
+            yield from self._hedged(candidates, messages, params)
+            return
+
+        last_error = None
+        for provider in candidates:
+            started = False
+            try:
+                for chunk in self._attempt(provider, messages, params):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise
+                last_error = e
+                LLM_FALLBACKS.inc(provider=provider.name)
+                print(f"LLM provider '{provider.name}' failed, trying the next one: {e}")
+        raise last_error
+
+    def _hedged(self, candidates: List[LLMProvider], messages, params) -> Iterator[str]:
+        events = queue.Queue()
+        cancels: Dict[str, threading.Event] = {}
+        pending = list(candidates)
+
+        def launch(provider):
+            cancel = cancels[provider.name] = threading.Event()
+
+            def run():
+                stream = self._attempt(provider, messages, params)
+                try:
+                    for chunk in stream:
+                        if cancel.is_set():
+                            stream.close()  # Closes the HTTP response
+                            return
+                        events.put((provider.name, "chunk", chunk))
+                    events.put((provider.name, "done", None))
+                except Exception as e:
+                    events.put((provider.name, "error", e))
+
+            threading.Thread(target=run, name=f"llm-{provider.name}", daemon=True).start()
+            return time.monotonic() + self._hedge_delay(provider)
+
+        hedge_at = launch(pending.pop(0))
+        running, winner, last_error = 1, None, None
+        try:
+            while True:
+                timeout = None if winner is not None or not pending else max(0.0, hedge_at - time.monotonic())
+                try:
+                    name, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    # No chunk yet from anyone: hedge with the next provider
+                    LLM_HEDGES.inc()
+                    hedge_at = launch(pending.pop(0))
+                    running += 1
+                    continue
+
+                if winner is None:
+                    if kind == "error":
+                        last_error, running = payload, running - 1
+                        LLM_FALLBACKS.inc(provider=name)
+                        if running == 0:
+                            if not pending:
+                                raise last_error
+                            hedge_at = launch(pending.pop(0))
+                            running += 1
+                        continue
+                    winner = name
+                    for other, cancel in cancels.items():
+                        if other != winner:
+                            cancel.set()
+                if name != winner:
+                    continue  # Late events from an abandoned request
+                if kind == "chunk":
+                    yield payload
+                elif kind == "done":
+                    return
+                else:
+                    raise payload
+        finally:
+            for cancel in cancels.values():
+                cancel.set()
+
+
+# ============================
+# Provider Registry
+# ============================
+def _groq(groq_api_key, groq_base_url):
+    return GroqProvider("groq", groq_api_key, GROQ_MODEL, base_url=groq_base_url)
+
+
+def _openai(groq_api_key, groq_base_url):
+    if not OPENAI_BASE_URL:
+        raise ValueError("OPENAI_BASE_URL is not set.")
+    return OpenAICompatibleProvider("openai", OPENAI_BASE_URL, OPENAI_MODEL, api_key=OPENAI_API_KEY)
+
+
+def _llamacpp(groq_api_key, groq_base_url):
+    return LlamaCppProvider("llamacpp", LLAMACPP_BASE_URL, LLAMACPP_MODEL)
+
+
+# Provider names accepted in LLM_PROVIDERS
+PROVIDER_FACTORIES: Dict[str, Callable] = {
+    "groq": _groq,
+    "openai": _openai,
+    "llamacpp": _llamacpp,
+}
+
+
+def build_router(groq_api_key: str, groq_base_url: Optional[str] = None) -> LLMRouter:
+    """
+    Builds the router for the providers named in LLM_PROVIDERS, in order.
+    """
+    providers = []
+    for name in LLM_PROVIDERS:
+        factory = PROVIDER_FACTORIES.get(name)
+        if factory is None:
+            print(f"Unknown LLM provider '{name}' in LLM_PROVIDERS; expected one of {', '.join(PROVIDER_FACTORIES)}.")
+            continue
+        try:
+            providers.append(factory(groq_api_key, groq_base_url))
+        except ValueError as e:
+            print(f"Skipping LLM provider '{name}': {e}")
+    if not providers:
+        providers.append(_groq(groq_api_key, groq_base_url))
+    return LLMRouter(providers, hedge=LLM_HEDGE, hedge_min_seconds=LLM_HEDGE_MIN_MS / 1000.0)
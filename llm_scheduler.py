@@ -0,0 +1,264 @@
+# llm_scheduler.py
+
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+from config import (
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_QUEUE,
+    LLM_MAX_RETRIES,
+    LLM_QUEUE_TIMEOUT_SECONDS,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+)
+from metrics import LLM_ADMISSIONS, LLM_IN_FLIGHT, LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT, LLM_RATE_LIMITED
+from tracing import record_span
+
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_CAP_SECONDS = 30.0
+# How often a request at the head of the queue re-checks the rate limits
+RATE_POLL_SECONDS = 0.25
+
+
+class LLMQueueFull(RuntimeError):
+    """
+    Raised when a request cannot be admitted: the queue is full or the wait timed out.
+    """
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        value = headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Refills at per_minute / 60 per second up to one minute's worth.
+    A per_minute of 0 means unlimited.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(float(self.per_minute), self.level + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
+
+    def available(self, amount: float, now: float) -> bool:
+        if not self.per_minute:
+            return True
+        self._refill(now)
+        # A request larger than the whole bucket waits for a full bucket, then overdraws it
+        return self.level >= min(amount, self.per_minute)
+
+    def take(self, amount: float):
+        if self.per_minute:
+            self.level -= amount
+
+    def give_back(self, amount: float):
+        if self.per_minute and amount > 0:
+            self.level = min(float(self.per_minute), self.level + amount)
+
+
+class _Ticket:
+    __slots__ = ("user", "tokens", "enqueued_at")
+
+    def __init__(self, user: str, tokens: int):
+        self.user = user
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+
+
+class LLMScheduler:
+    """
+    Admission control for LLM calls: at most max_concurrency calls run at once,
+    within requests-per-minute and tokens-per-minute budgets.
+
+    Waiting requests are queued per user and dispatched round-robin across
+    users, so one user's burst cannot starve everyone else. A call that fails
+    with HTTP 429 is retried with jittered exponential backoff (or the
+    provider's Retry-After), and every other request pauses for the same
+    interval instead of hitting the limit again.
+
+    Calls run on the caller's thread; submit() blocks until the call finishes.
+    """
+
+    def __init__(self, max_concurrency: int = 4, requests_per_minute: int = 0, tokens_per_minute: int = 0,
+                 max_queue: int = 100, queue_timeout: float = 120.0, max_retries: int = 4):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._queued = 0
+        self._active = 0
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+
+    # ============================
+    # Queue State
+    # ============================
+    def queue_depth(self) -> int:
+        with self._condition:
+            return self._queued
+
+    def in_flight(self) -> int:
+        with self._condition:
+            return self._active
+
+    def _position(self, ticket: _Ticket) -> int:
+        """
+        1-based dispatch position under round-robin: in round r each user, in
+        queue order, sends its r-th waiting request.
+        """
+        users = list(self._queues)
+        own_index = users.index(ticket.user)
+        own_round = self._queues[ticket.user].index(ticket)
+        ahead = own_round
+        for index, user in enumerate(users):
+            if user != ticket.user:
+                ahead += min(len(self._queues[user]), own_round + (1 if index < own_index else 0))
+        return ahead + 1
+
+    def _update_gauges(self):
+        LLM_QUEUE_DEPTH.set(self._queued)
+        LLM_IN_FLIGHT.set(self._active)
+
+    def _remove(self, ticket: _Ticket):
+        queue = self._queues.get(ticket.user)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            self._queued -= 1
+            if not queue:
+                del self._queues[ticket.user]
+
+    def _try_dispatch(self, ticket: _Ticket) -> bool:
+        first_user = next(iter(self._queues))
+        if self._queues[first_user][0] is not ticket or self._active >= self.max_concurrency:
+            return False
+        now = time.monotonic()
+        if now < self._paused_until:
+            return False
+        if not (self._requests.available(1, now) and self._tokens.available(ticket.tokens, now)):
+            return False
+        self._requests.take(1)
+        self._tokens.take(ticket.tokens)
+        self._remove(ticket)
+        if ticket.user in self._queues:
+            self._queues.move_to_end(ticket.user)  # Next round-robin turn goes to the next user
+        self._active += 1
+        return True
+
+    # ============================
+    # Submitting Calls
+    # ============================
+    def submit(self, fn: Callable[[], object], user: Optional[str] = None, tokens: int = 0, on_wait: Optional[Callable[[int], None]] = None):
+        """
+        Waits for a slot and rate budget, then runs fn().
+
+        Args:
+            fn: The LLM call. It is retried on HTTP 429, so it must not have
+                produced output before raising.
+            user (str): Fairness key, e.g. the username.
+            tokens (int): Estimated prompt + completion tokens.
+            on_wait: Optional callable receiving the 1-based queue position
+                whenever it changes while waiting.
+
+        Raises:
+            LLMQueueFull: If the queue is full or the wait exceeds queue_timeout.
+        """
+        ticket = _Ticket(user or "anonymous", tokens)
+        deadline = ticket.enqueued_at + self.queue_timeout
+        with self._condition:
+            if self._queued >= self.max_queue:
+                LLM_ADMISSIONS.inc(outcome="queue_full")
+                raise LLMQueueFull("Too many requests are waiting for the assistant. Please try again shortly.")
+            self._queues.setdefault(ticket.user, deque()).append(ticket)
+            self._queued += 1
+            self._update_gauges()
+            self._condition.notify_all()  # Round-robin positions of other waiters may change
+
+        last_position = None
+        while True:
+            with self._condition:
+                if self._try_dispatch(ticket):
+                    self._update_gauges()
+                    self._condition.notify_all()
+                    break
+                position = self._position(ticket)
+                if position == last_position:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._remove(ticket)
+                        self._update_gauges()
+                        self._condition.notify_all()
+                        LLM_ADMISSIONS.inc(outcome="timeout")
+                        raise LLMQueueFull("The assistant is busy. Please try again shortly.")
+                    # At the head, only the rate limits are left to wait for and nobody notifies
+                    self._condition.wait(min(remaining, RATE_POLL_SECONDS) if position == 1 else remaining)
+                    continue
+            last_position = position
+            if on_wait is not None:
+                on_wait(position)
+
+        waited = time.monotonic() - ticket.enqueued_at
+        LLM_ADMISSIONS.inc(outcome="admitted")
+        LLM_QUEUE_WAIT.observe(waited)
+        record_span("llm_queue_wait", waited * 1000.0, position=last_position or 1)
+
+        attempt = 0
+        try:
+            while True:
+                try:
+                    return fn()
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt >= self.max_retries:
+                        raise
+                    delay = retry_after_seconds(e)
+                    if delay is None:
+                        delay = min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.5)
+                    attempt += 1
+                    LLM_RATE_LIMITED.inc()
+                    print(f"LLM rate limited; retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                    with self._condition:
+                        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    time.sleep(delay)
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._update_gauges()
+                self._condition.notify_all()
+
+    def refund(self, tokens: int):
+        """
+        Returns unused estimated tokens, e.g. when the completion was shorter than reserved.
+        """
+        with self._condition:
+            self._tokens.give_back(tokens)
+            self._condition.notify_all()
+
+
+LLM_SCHEDULER = LLMScheduler(
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+    max_queue=LLM_MAX_QUEUE,
+    queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS,
+    max_retries=LLM_MAX_RETRIES,
+)
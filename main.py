@@ -3,21 +3,20 @@
 import os
 import streamlit as st
 from dotenv import load_dotenv
-import datetime
-import chromadb
-import pandas as pd
+import importlib
+import threading
+import time
+from contextlib import nullcontext
 from user_management import add_user, verify_pin, load_users, reset_password, save_users
-from qa_module import (
-    query_chroma,
-    generate_ai_response,
-    ensure_database,
-    handle_answer,
-    close_chroma_client,
-    reload_database,
-)
+from tracing import start_trace
+from metrics import CORRECTIONS, LOGINS, CACHE_REQUESTS, CACHE_MISSES, start_metrics_server
+from config import METRICS_HOST, METRICS_PORT, PRELOAD_QA_STACK, CORRECTION_QUEUE_PATH
 # Import sys for encoding settings if needed
 import sys
 
+# The retrieval and LLM stack (chromadb, groq, tiktoken via qa_module) and pandas
+# are imported on first use so the login screens render without them.
+
 # ============================
 # Load Environment Variables
 # ============================
@@ -28,26 +27,81 @@ load_dotenv()
 # ============================
 script_dir = os.path.dirname(os.path.abspath(__file__))
 qa_data_path = os.path.join(script_dir, "QA_data", "qa_data.txt")
+logo_path = os.path.join(script_dir, "images", "tallmanlogo.png")
 
 # ============================
-# Apply Custom CSS for Styling
+# Static Assets
 # ============================
+CUSTOM_CSS = """
+<style>
+/* Custom styling here */
+</style>
+"""
+
 def load_custom_css():
-    st.markdown(
-        """
-        <style>
-        /* Custom styling here */
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
+    # Emitted on every rerun, since Streamlit drops elements a run does not send
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+
+@st.cache_resource(show_spinner=False)
+def load_logo() -> bytes:
+    """
+    Reads the logo once per process instead of on every rerun.
+    """
+    with open(logo_path, "rb") as logo_file:
+        return logo_file.read()
+
+def display_logo():
+    st.image(load_logo(), use_column_width=True)
+
+# ============================
+# Metrics Endpoint
+# ============================
+start_metrics_server(METRICS_PORT, METRICS_HOST)
+
+# ============================
+# Deferred Imports
+# ============================
+def qa():
+    """
+    Returns qa_module, importing the retrieval and LLM stack on first use.
+    """
+    return importlib.import_module("qa_module")
 
-load_custom_css()
+def _preload_qa_module():
+    try:
+        importlib.import_module("qa_module")
+        print("QA stack preloaded.")
+    except Exception as e:
+        print(f"Failed to preload QA stack: {e}")
+
+@st.cache_resource(show_spinner=False)
+def start_qa_preload():
+    """
+    Imports qa_module in a background thread once per process, while the user is
+    still on the login screen. A later qa() call waits on Python's import lock if
+    the preload has not finished.
+    """
+    thread = threading.Thread(target=_preload_qa_module, name="qa-preload", daemon=True)
+    thread.start()
+    return thread
 
 # ============================
 # User Authentication
 # ============================
+LOGIN_OUTCOMES = {
+    "Login successful": "success",
+    "Your account is pending admin approval.": "pending",
+    "Your account is on hold. Please contact support.": "hold",
+    "Invalid PIN": "invalid_pin",
+    "No matching user found": "unknown_user",
+}
+
 def authenticate_user(username, pin):
+    result = _authenticate_user(username, pin)
+    LOGINS.inc(outcome=LOGIN_OUTCOMES.get(result["message"], "other"))
+    return result
+
+def _authenticate_user(username, pin):
     users = load_users()
     username = username.strip().lower()  # Normalize input username
     if username in users:
@@ -80,8 +134,13 @@ def handle_login(username, pin):
     else:
         auth_result = authenticate_user(username, pin)
         if auth_result["authenticated"]:
+            allowed = load_knowledge_base_registry().allowed(username, auth_result["role"])
+            if not allowed:
+                st.error("No knowledge base is available to your account. Please contact an administrator.")
+                return
             st.session_state.user = username
             st.session_state.user_role = auth_result["role"]
+            st.session_state.knowledge_base = allowed[0].name
             st.session_state.screen = "qa"
             st.success("Login successful!")
         else:
@@ -93,7 +152,7 @@ def handle_login_callback():
     handle_login(username, pin)
 
 def display_login_screen():
-    st.image("images/tallmanlogo.png", use_column_width=True)
+    display_logo()
     st.title("🔐 Login")
     st.write("---")
 
@@ -113,6 +172,9 @@ def display_login_screen():
     with col3:
         st.button("Reset Password", key="reset_password_button", on_click=set_screen, args=("reset_password",))
 
+    if PRELOAD_QA_STACK:
+        start_qa_preload()
+
 def handle_new_account(username, pin, email):
     if not username or not pin or not email:
         st.error("Please fill out all fields.")
@@ -139,7 +201,7 @@ def handle_new_account_callback():
     handle_new_account(username, pin, email)
 
 def display_new_account_screen():
-    st.image("images/tallmanlogo.png", use_column_width=True)
+    display_logo()
     st.title("🆕 Create New Account")
     st.write("---")
 
@@ -179,7 +241,7 @@ def handle_reset_password_callback():
     handle_reset_password(username, email, new_pin)
 
 def display_reset_password_screen():
-    st.image("images/tallmanlogo.png", use_column_width=True)
+    display_logo()
     st.title("🔒 Reset Password")
     st.write("---")
 
@@ -206,14 +268,47 @@ def display_reset_password_screen():
 def handle_answer_callback(collection):
     user_question = st.session_state.qa_user_question_input
     query_type = st.session_state.qa_query_type
-    handle_answer(user_question, query_type, collection)
+    qa().handle_answer(user_question, query_type, collection)
     st.session_state.user_question = user_question
 
+def handle_ask_ai_callback(collection):
+    # Generate an answer even though the question matched a stored one
+    qa().handle_answer(st.session_state.user_question, st.session_state.qa_query_type, collection, ask_ai=True)
+
+def handle_knowledge_base_callback():
+    st.session_state.knowledge_base = st.session_state.qa_knowledge_base
+    # An answer from the previous knowledge base cannot be corrected into this one
+    st.session_state.pop("last_response", None)
+    st.session_state.pop("last_faq_match", None)
+    st.session_state.pop("last_sources", None)
+
+def display_knowledge_base_selector():
+    allowed = load_knowledge_base_registry().allowed(st.session_state.get("user"), st.session_state.get("user_role"))
+    if len(allowed) < 2:
+        return
+    names = [kb.name for kb in allowed]
+    titles = {kb.name: kb.title for kb in allowed}
+    current = current_knowledge_base()
+    st.selectbox(
+        "Knowledge base",
+        names,
+        index=names.index(current) if current in names else 0,
+        format_func=titles.get,
+        key="qa_knowledge_base",
+        on_change=handle_knowledge_base_callback,
+    )
+
 def display_qa_screen(collection, handle_answer):
-    st.image("images/tallmanlogo.png", use_column_width=True)
+    display_logo()
     st.title("🤖 QA Assistant")
     st.write("---")
 
+    display_knowledge_base_selector()
+
+    correction_notice = st.session_state.pop("correction_notice", None)
+    if correction_notice:
+        st.success(correction_notice)
+
     # Radio button to select query type
     query_type = st.radio(
         "Select the subject for the prompt:",
@@ -232,16 +327,33 @@ def display_qa_screen(collection, handle_answer):
     st.button("Answer", key="qa_answer_button", on_click=handle_answer_callback, args=(collection,))
 
     if "last_response" in st.session_state:
-        last_response = st.session_state.last_response
-        if last_response.startswith("Error generating AI response:"):
-            st.error(last_response)
-        else:
-            st.text_area(
-                "Your Answer",
-                value=last_response,
-                height=200,
-                key="qa_last_response",
-            )
+        # Only the first render of an answer belongs to its request trace
+        request_id = st.session_state.get("last_request_id")
+        trace_render = request_id is not None and st.session_state.get("rendered_request_id") != request_id
+        st.session_state.rendered_request_id = request_id
+        with start_trace("ui_render", request_id=request_id) if trace_render else nullcontext():
+            last_response = st.session_state.last_response
+            if last_response.startswith("Error generating AI response:"):
+                st.error(last_response)
+            else:
+                st.text_area(
+                    "Your Answer",
+                    value=last_response,
+                    height=200,
+                    key="qa_last_response",
+                )
+                faq_match = st.session_state.get("last_faq_match")
+                if faq_match is not None:
+                    st.caption(f"Answered from the knowledge base ({faq_match.date.strip()}): \"{faq_match.question}\"")
+                    st.button("Ask the AI anyway", key="qa_ask_ai_button", on_click=handle_ask_ai_callback, args=(collection,))
+                sources = st.session_state.get("last_sources")
+                if sources:
+                    with st.expander("Sources"):
+                        for source in sources:
+                            dates = source["date_from"] if source["date_from"] == source["date_to"] else f"{source['date_from']} to {source['date_to']}"
+                            st.markdown(f"**{source['source']}** ({dates})" if dates else f"**{source['source']}**")
+                            for question in source["questions"]:
+                                st.caption(question)
 
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -254,56 +366,81 @@ def display_qa_screen(collection, handle_answer):
 
 def logout():
     st.session_state.user = None
+    st.session_state.pop("knowledge_base", None)
     st.session_state.screen = "login"
 
 # ============================
 # Correct Answer Screen
 # ============================
-def handle_correction_callback(collection):
+def handle_correction_callback():
     correction = st.session_state.correct_correction_input
-    handle_correction(correction, collection)
+    handle_correction(correction)
 
-def handle_correction(correction, collection):
+def handle_correction(correction):
     if not correction:
+        CORRECTIONS.inc(outcome="empty")
         st.error("Please provide a correction before submitting.")
     else:
         user_question = st.session_state.get("user_question", "Unknown Question")
         last_response = st.session_state.get("last_response", "")
-        
-        # 1. Collect the current date
-        current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-        
-        # 2. Generate a reformulated answer by combining the previous answer with the correction
-        new_answer = generate_ai_response(
-            user_question=user_question,
-            snippets=[last_response, correction],
-            subject=6  # Subject index for corrections
-        )
-        
-        # 3. Append the new QA entry to the qa_data.txt file
-        try:
-            append_qa_entry(current_date, user_question, new_answer, qa_data_path)
-            st.success("Your correction has been applied and added to the QA data.")
-        except Exception as e:
-            st.error(f"Failed to append QA entry: {e}")
-            return
-        
-        # 4. Upsert the new QA entry into the ChromaDB collection
-        new_qa_entry = f"{current_date}\nQUESTION: {user_question}\nANSWER: {new_answer}\n\n"
+
+        # Reformulation, journaling and indexing run on the correction worker
         try:
-            collection.upsert(
-                documents=[new_qa_entry],
-                ids=[f"{user_question}_correction_{current_date}"],
-                metadatas=[{"source": f"QA_data_correction_{current_date}"}],
+            job_id = load_correction_queue(current_knowledge_base()).submit(
+                user_question, last_response, correction, submitted_by=st.session_state.get("user")
             )
-            st.success("Correction saved to the database.")
         except Exception as e:
-            st.error(f"Failed to save correction to the database: {e}")
+            CORRECTIONS.inc(outcome="submit_failed")
+            st.error(f"Failed to record correction: {e}")
+            return
+        CORRECTIONS.inc(outcome="queued")
+        # Shown by the QA screen, since leaving the fragment clears callback output
+        st.session_state.correction_notice = f"Correction #{job_id} recorded. It will be applied to the QA data and database shortly."
 
         st.session_state.screen = "qa"
 
+@st.cache_resource(show_spinner=False)
+def load_correction_queue(knowledge_base):
+    """
+    Starts one correction worker per knowledge base, writing to that knowledge
+    base's QA file and journal.
+    """
+    from correction_queue import CorrectionQueue
+    registry = load_knowledge_base_registry()
+    kb = registry.knowledge_bases[knowledge_base]
+    return CorrectionQueue(
+        kb.correction_queue_path, kb.qa_data_path, registry.handle(knowledge_base), replication=load_replication(knowledge_base)
+    ).start()
+
+@st.cache_resource(show_spinner=False)
+def load_replication(knowledge_base):
+    """
+    Starts applying corrections from the shared replication log to this
+    node's copy of a knowledge base, or returns None without replication.
+    """
+    from config import REPLICATION_LOG_PATH
+    if not REPLICATION_LOG_PATH:
+        return None
+    from replication import ReplicationLog, ReplicationTailer
+    registry = load_knowledge_base_registry()
+    kb = registry.knowledge_bases[knowledge_base]
+    return ReplicationTailer(
+        ReplicationLog(REPLICATION_LOG_PATH), knowledge_base, kb.qa_data_path, registry.handle(knowledge_base), kb.correction_queue_path
+    ).start()
+
+def display_correction_jobs():
+    jobs = load_correction_queue(current_knowledge_base()).recent(limit=10)
+    if not jobs:
+        return
+    st.write("Recent corrections")
+    for job in jobs:
+        line = f"#{job['id']} · {job['status']} · {job['user_question'][:80]}"
+        if job["error"]:
+            line += f" · attempt {job['attempts']}: {job['error'][:120]}"
+        st.caption(line)
+
 def display_correct_screen(collection):
-    st.image("images/tallmanlogo.png", use_column_width=True)
+    display_logo()
     st.title("✏️ Correct Answer")
     st.write("---")
 
@@ -319,10 +456,14 @@ def display_correct_screen(collection):
 
     col1, col2 = st.columns(2)
     with col1:
-        st.button("Submit Correction", key="submit_correction_button", on_click=handle_correction_callback, args=(collection,))
+        st.button("Submit Correction", key="submit_correction_button", on_click=handle_correction_callback)
     with col2:
         st.button("Done", key="done_button", on_click=set_screen, args=("qa",))
 
+    st.write("---")
+    st.button("Refresh Status", key="refresh_corrections_button")
+    display_correction_jobs()
+
 # ============================
 # User Management Screen
 # ============================
@@ -338,7 +479,7 @@ def save_user_changes(edited_df, users):
         st.error(f"Failed to save changes: {e}")
 
 def display_user_management_screen():
-    st.image("images/tallmanlogo.png", use_column_width=True)
+    display_logo()
     st.title("👥 User Management")
     st.write("---")
 
@@ -350,6 +491,8 @@ def display_user_management_screen():
         "Edit user roles below. Change the role of a user by selecting from 'admin', 'user', 'hold', or 'new'."
     )
 
+    import pandas as pd
+
     users = load_users()
 
     users_df = pd.DataFrame.from_dict(users, orient="index")
@@ -382,99 +525,221 @@ def display_user_management_screen():
         st.button("Back to QA", key="back_to_qa_button", on_click=set_screen, args=("qa",))
 
     st.write("---")
-    st.button("ReLoad DB", key="reload_db_button", on_click=reload_db)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button("ReLoad DB", key="reload_db_button", on_click=reload_db)
+    with col2:
+        st.button("Refresh Status", key="refresh_reload_status_button")
+    display_reload_status()
+
+    st.write("---")
+    display_prewarm_controls()
+
+    st.write("---")
+    display_profiling_controls()
 
 def reload_db():
-    with st.spinner("Reloading the database, please wait..."):
-        try:
-            if "chroma_client" in st.session_state:
-                close_chroma_client(st.session_state.chroma_client)
-                del st.session_state.chroma_client
-            st.cache_resource.clear()
-            collection, client = reload_database("tallman_knowledge", qa_data_path)
-            st.session_state.chroma_client = client
-            st.success("Database reloaded successfully!")
-        except Exception as e:
-            st.error(f"Failed to reload database: {e}")
+    try:
+        if get_collection().rebuild_async():
+            st.success("Database rebuild started. Users keep the current data until it finishes.")
+        else:
+            st.warning("A database rebuild is already running.")
+    except Exception as e:
+        st.error(f"Failed to start database rebuild: {e}")
+
+def display_reload_status():
+    status = get_collection().status()
+    kb = load_knowledge_base_registry().knowledge_bases[current_knowledge_base()]
+    st.caption(f"{kb.title} · live collection: {status['collection']} (version {status['version']})")
+    if status["state"] == "running":
+        total = status["total"] or 1
+        st.progress(min(status["done"] / total, 1.0), text=f"Rebuilding: {status['done']}/{status['total']} chunks indexed")
+    elif status["state"] == "succeeded":
+        st.info(f"Last rebuild finished at {status['finished_at']}.")
+    elif status["state"] == "failed":
+        st.error(f"Last rebuild failed at {status['finished_at']}: {status['error']}")
+    replication = load_replication(current_knowledge_base())
+    if replication is not None:
+        replication_status = replication.status()
+        st.caption(f"Replication: applied through #{replication_status['applied_seq']}, {replication_status['behind']} behind")
+        if replication_status["error"]:
+            st.error(f"Replication failed: {replication_status['error']}")
 
 # ============================
-# Caching the Database Collection
+# Pre-Warming Frequent Questions
 # ============================
 @st.cache_resource(show_spinner=False)
-def load_collection():
-    collection, client = ensure_database("tallman_knowledge", qa_data_path)
-    st.session_state.chroma_client = client
-    return collection
+def load_prewarm_scheduler():
+    """
+    Starts the daily pre-warming of frequently asked questions once per process.
+    """
+    from query_log import PrewarmScheduler
+    registry = load_knowledge_base_registry()
+
+    def prewarm(questions):
+        # Questions of knowledge bases that are no longer configured are skipped
+        known = [row for row in questions if (row["kb"] or registry.default) in registry.knowledge_bases]
+        return qa().prewarm_answers(known, lambda name: registry.handle(name or registry.default))
+
+    return PrewarmScheduler(prewarm).start()
+
+def prewarm_now_callback():
+    if load_prewarm_scheduler().run_now():
+        st.success("Pre-warming started for the most frequent questions.")
+    else:
+        st.warning("Pre-warming is already running.")
+
+def display_prewarm_controls():
+    from config import PREWARM_HOUR, PREWARM_LOOKBACK_DAYS, PREWARM_TOP_N
+    from query_log import top_questions
+
+    scheduler = load_prewarm_scheduler()
+    st.write("Frequent questions")
+    schedule = f"daily at {PREWARM_HOUR:02d}:00" if PREWARM_HOUR >= 0 else "not scheduled"
+    st.caption(f"The top {PREWARM_TOP_N} questions of the last {PREWARM_LOOKBACK_DAYS} days are answered ahead of time ({schedule}).")
+    rows = top_questions(top_n=10)
+    if rows:
+        st.dataframe(
+            [{"Asked": row["count"], "Subject": row["subject"], "Question": row["q"], "Mean ms": round(row["mean_ms"])} for row in rows],
+            use_container_width=True,
+            hide_index=True,
+        )
+    st.button("Pre-warm Now", key="prewarm_now_button", on_click=prewarm_now_callback)
+    status = scheduler.status()
+    if status["state"] == "running":
+        st.info("Pre-warming is running.")
+    elif status["state"] == "succeeded":
+        st.info(f"Last pre-warming finished at {status['finished_at']}: {status['summary']}")
+    elif status["state"] == "failed":
+        st.error(f"Last pre-warming failed at {status['finished_at']}: {status['error']}")
 
 # ============================
-# Helper Functions for Database
+# On-Demand Profiling
 # ============================
-def append_qa_entry(date: str, user_question: str, answer: str, qa_data_path: str):
-    """
-    Appends a new QA entry to the beginning of the qa_data.txt file in the specified format.
-    """
-    entry = f"{date}\nUSER QUESTION: {user_question}\nANSWER: {answer}\n\n"
-    
-    try:
-        os.makedirs(os.path.dirname(qa_data_path), exist_ok=True)
+def start_profiling_callback():
+    from profiling import start_profiling
+    if start_profiling(st.session_state.profile_seconds, trace_allocations=st.session_state.profile_allocations):
+        st.success("Profiling started.")
+    else:
+        st.warning("A profiling session is already running.")
 
-        if os.path.exists(qa_data_path):
-            with open(qa_data_path, 'r', encoding='utf-8') as f:
-                existing_content = f.read()
-        else:
-            existing_content = ""
+def stop_profiling_callback():
+    from profiling import stop_profiling
+    if not stop_profiling():
+        st.warning("No profiling session is running.")
 
-        new_content = entry + existing_content
+def display_profiling_controls():
+    from config import PROFILE_MAX_SECONDS
+    from profiling import profiling_status
 
-        with open(qa_data_path, 'w', encoding='utf-8') as f:
-            f.write(new_content)
+    st.write("Profiling")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.number_input("Seconds", min_value=1, max_value=PROFILE_MAX_SECONDS, value=min(30, PROFILE_MAX_SECONDS), key="profile_seconds")
+    with col2:
+        st.checkbox("Trace allocations", value=True, key="profile_allocations")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button("Start Profiling", key="start_profiling_button", on_click=start_profiling_callback)
+    with col2:
+        st.button("Stop Profiling", key="stop_profiling_button", on_click=stop_profiling_callback)
+
+    status = profiling_status()
+    if status is None:
+        return
+    if status["running"]:
+        elapsed = time.time() - status["started_at"]
+        st.progress(min(elapsed / status["seconds"], 1.0), text=f"Profiling: {elapsed:.0f}/{status['seconds']:.0f} s, {status['samples']} samples")
+    elif status["error"]:
+        st.error(f"Profiling failed: {status['error']}")
+    else:
+        for path in status["files"]:
+            st.caption(f"Saved {path}")
 
-        print("New QA entry prepended successfully.")
-    except Exception as e:
-        print(f"Failed to prepend QA entry: {e}")
-        raise e
+# ============================
+# Caching the Database Collections
+# ============================
+@st.cache_resource(show_spinner=False)
+def load_knowledge_base_registry():
+    """
+    Reads the knowledge base list once per process. Without a knowledge base
+    file, the single original knowledge base is served from qa_data_path.
+    """
+    from knowledge_bases import KnowledgeBaseRegistry, load_knowledge_bases
+    return KnowledgeBaseRegistry(load_knowledge_bases(default_qa_data_path=qa_data_path, correction_queue_path=CORRECTION_QUEUE_PATH))
 
-def reload_database(collection_name, qa_data_path, persist_directory="chroma_db", max_lines_per_chunk=100):
-    print(f"Reloading database for collection: {collection_name}")
-    chroma_client = get_chroma_client(persist_directory=persist_directory)
-    
-    try:
-        chroma_client.delete_collection(name=collection_name)
-        print(f"Collection '{collection_name}' deleted successfully.")
-    except Exception as e:
-        print(f"Failed to delete collection '{collection_name}': {e}")
-        raise e
-    
-    collection, chroma_client = ensure_database(collection_name, qa_data_path, persist_directory, max_lines_per_chunk)
-    print(f"Collection '{collection_name}' reloaded successfully.")
-    return collection, chroma_client
-
-def get_chroma_client(persist_directory="chroma_db"):
-    print("Initializing ChromaDB client...")
-    try:
-        chroma_client = chromadb.PersistentClient(path=persist_directory)
-        print("ChromaDB client initialized successfully.")
-        return chroma_client
-    except Exception as e:
-        print(f"Failed to initialize ChromaDB client: {e}")
-        raise e
+def current_knowledge_base():
+    return st.session_state.get("knowledge_base") or load_knowledge_base_registry().default
 
-def close_chroma_client(chroma_client):
+def get_collection(knowledge_base=None):
+    """
+    Returns a handle to a knowledge base's index, the session's by default,
+    opening the index if it is not loaded. The handle behaves like a ChromaDB
+    collection that always points at the live version.
+    """
+    registry = load_knowledge_base_registry()
+    name = knowledge_base or current_knowledge_base()
+    # Every lookup is a request; only one that has to open the index is a miss
+    CACHE_REQUESTS.inc(cache="collection")
+    if not registry.is_open(name):
+        CACHE_MISSES.inc(cache="collection")
+    registry.get(name)
+    return registry.handle(name)
+
+def resolve_collection():
     """
-    Closes the ChromaDB client to release file locks.
+    Returns the session's live collection, showing a spinner only while this
+    process opens the knowledge base.
     """
+    name = current_knowledge_base()
     try:
-        chroma_client.close()
-        print("ChromaDB client closed successfully.")
-    except AttributeError:
-        print("ChromaDB client does not have a close method.")
+        if load_knowledge_base_registry().is_open(name):
+            collection = get_collection(name)
+        else:
+            with st.spinner("Initializing the database, please wait..."):
+                collection = get_collection(name)
     except Exception as e:
-        print(f"Failed to close ChromaDB client: {e}")
-        raise e
+        st.error(f"Error loading database: {e}")
+        return None
+    if not collection:
+        st.error("Database failed to load.")
+        return None
+    return collection
 
+# ============================
+# Navigation Helpers
+# ============================
 def set_screen(screen_name):
     st.session_state.screen = screen_name
 
+def leave_fragment_if_moved(screen_name, knowledge_base):
+    """
+    Starts a full rerun when a widget in a screen fragment moved the session to
+    another screen or knowledge base, which a fragment rerun cannot render.
+    """
+    if st.session_state.screen != screen_name or current_knowledge_base() != knowledge_base:
+        st.rerun()
+
+# ============================
+# Screen Fragments
+# ============================
+# A widget inside a fragment reruns only that fragment, so interactions on these
+# screens skip the dispatch, CSS and collection lookup of a full rerun.
+@st.fragment
+def qa_screen_fragment(collection, knowledge_base):
+    leave_fragment_if_moved("qa", knowledge_base)
+    display_qa_screen(collection, qa().handle_answer)
+
+@st.fragment
+def correct_screen_fragment(collection, knowledge_base):
+    leave_fragment_if_moved("correct", knowledge_base)
+    display_correct_screen(collection)
+
+@st.fragment
+def user_management_screen_fragment(knowledge_base):
+    leave_fragment_if_moved("user_management", knowledge_base)
+    display_user_management_screen()
+
 # ============================
 # Main Function to Control Navigation
 # ============================
@@ -485,46 +750,29 @@ def main():
     if "screen" not in st.session_state:
         st.session_state.screen = "login"
 
+    load_custom_css()
+
     # Navigation logic
-    if st.session_state.screen == "login":
+    screen = st.session_state.screen
+    if screen == "login":
         display_login_screen()
-    elif st.session_state.screen == "new_account":
+    elif screen == "new_account":
         display_new_account_screen()
-    elif st.session_state.screen == "reset_password":
+    elif screen == "reset_password":
         display_reset_password_screen()
-    elif st.session_state.screen == "qa":
-        with st.spinner("Initializing the database, please wait..."):
-            try:
-                collection = load_collection()
-                if not collection:
-                    st.error("Database failed to load.")
-                    return
-            except Exception as e:
-                st.error(f"Error loading database: {e}")
-                return
-        display_qa_screen(collection, handle_answer)
-    elif st.session_state.screen == "correct":
-        with st.spinner("Initializing the database, please wait..."):
-            try:
-                collection = load_collection()
-                if not collection:
-                    st.error("Database failed to load.")
-                    return
-            except Exception as e:
-                st.error(f"Error loading database: {e}")
-                return
-        display_correct_screen(collection)
-    elif st.session_state.screen == "user_management":
-        with st.spinner("Initializing the database, please wait..."):
-            try:
-                collection = load_collection()
-                if not collection:
-                    st.error("Database failed to load.")
-                    return
-            except Exception as e:
-                st.error(f"Error loading database: {e}")
-                return
-        display_user_management_screen()
+    elif screen in ("qa", "correct", "user_management"):
+        collection = resolve_collection()
+        if collection is None:
+            return
+        knowledge_base = current_knowledge_base()
+        load_prewarm_scheduler()
+        load_replication(knowledge_base)
+        if screen == "qa":
+            qa_screen_fragment(collection, knowledge_base)
+        elif screen == "correct":
+            correct_screen_fragment(collection, knowledge_base)
+        else:
+            user_management_screen_fragment(knowledge_base)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,276 @@
+# metrics.py
+
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# ============================
+# Metric Types
+# ============================
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names: Sequence[str], label_values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing count, optionally split by labels.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """
+    A value that can go up and down, such as a queue depth.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """
+    Observations counted into fixed cumulative buckets, as Prometheus expects.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0])
+                self._values[key] = series
+            series[0][index] += 1
+            series[1][0] += value
+
+    def count(self, **labels) -> int:
+        series = self._values.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[-1]
+            labels = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+# ============================
+# Registry
+# ============================
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ============================
+# Application Metrics
+# ============================
+ANSWER_REQUESTS = REGISTRY.counter("tallman_answer_requests_total", "Questions submitted to handle_answer.", ["query_type", "outcome"])
+ANSWER_LATENCY = REGISTRY.histogram("tallman_answer_latency_seconds", "End-to-end handle_answer latency.", ["query_type"])
+RETRIEVAL_LATENCY = REGISTRY.histogram("tallman_retrieval_latency_seconds", "query_chroma latency including query embedding.")
+RETRIEVAL_ERRORS = REGISTRY.counter("tallman_retrieval_errors_total", "query_chroma calls that raised.")
+LLM_REQUESTS = REGISTRY.counter("tallman_llm_requests_total", "LLM generations by subject and outcome.", ["subject", "outcome"])
+LLM_LATENCY = REGISTRY.histogram("tallman_llm_latency_seconds", "Total LLM generation time.", ["subject"])
+LLM_TOKENS = REGISTRY.counter("tallman_llm_tokens_total", "LLM tokens by direction.", ["kind"])
+LLM_OUTPUT_TOKENS = REGISTRY.histogram("tallman_llm_output_tokens", "Response length in tokens by subject.", ["subject"], buckets=(32, 64, 128, 256, 384, 512, 768, 1024, 1500, 2048))
+LLM_LENGTH_STOPS = REGISTRY.counter("tallman_llm_length_stops_total", "Responses cut off at their profile's max_tokens.", ["subject"])
+CORRECTIONS = REGISTRY.counter("tallman_corrections_total", "Corrections by outcome (queued, ok, retry, failed).", ["outcome"])
+CORRECTION_QUEUE_DEPTH = REGISTRY.gauge("tallman_correction_queue_depth", "Corrections waiting to be applied.")
+LOGINS = REGISTRY.counter("tallman_logins_total", "Login attempts by outcome.", ["outcome"])
+CACHE_REQUESTS = REGISTRY.counter("tallman_cache_requests_total", "Cache lookups by cache name.", ["cache"])
+CACHE_MISSES = REGISTRY.counter("tallman_cache_misses_total", "Cache lookups that had to compute the value.", ["cache"])
+LLM_ADMISSIONS = REGISTRY.counter("tallman_llm_admissions_total", "LLM scheduler admissions by outcome (admitted, queue_full, timeout).", ["outcome"])
+LLM_QUEUE_DEPTH = REGISTRY.gauge("tallman_llm_queue_depth", "LLM calls waiting for admission.")
+LLM_IN_FLIGHT = REGISTRY.gauge("tallman_llm_in_flight", "LLM calls currently running.")
+LLM_QUEUE_WAIT = REGISTRY.histogram("tallman_llm_queue_wait_seconds", "Time LLM calls waited for admission.")
+LLM_RATE_LIMITED = REGISTRY.counter("tallman_llm_rate_limited_total", "LLM calls retried after HTTP 429.")
+COALESCED_REQUESTS = REGISTRY.counter("tallman_coalesced_requests_total", "Requests that shared an identical in-flight call.", ["group"])
+EMBEDDING_LATENCY = REGISTRY.histogram("tallman_embedding_latency_seconds", "Embedding inference time per call.", ["backend"])
+EMBEDDING_BATCH_TEXTS = REGISTRY.histogram("tallman_embedding_batch_texts", "Texts per embedding inference call after micro-batching.", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+KNOWLEDGE_BASE_OPENS = REGISTRY.counter("tallman_knowledge_base_opens_total", "Knowledge bases opened on demand.", ["knowledge_base"])
+KNOWLEDGE_BASE_EVICTIONS = REGISTRY.counter("tallman_knowledge_base_evictions_total", "Knowledge bases released by the LRU.", ["knowledge_base"])
+KNOWLEDGE_BASES_OPEN = REGISTRY.gauge("tallman_knowledge_bases_open", "Knowledge bases currently open.")
+REPLICATION_APPLIED = REGISTRY.counter("tallman_replication_applied_total", "Corrections applied from the shared replication log.", ["knowledge_base"])
+REPLICATION_LAG = REGISTRY.gauge("tallman_replication_lag_entries", "Shared log entries not yet applied on this node.", ["knowledge_base"])
+PREWARM_QUESTIONS = REGISTRY.counter("tallman_prewarm_questions_total", "Frequent questions pre-warmed by outcome (warmed, faq, skipped, failed).", ["outcome"])
+FAQ_LOOKUPS = REGISTRY.counter("tallman_faq_lookups_total", "FAQ direct-answer lookups by outcome (exact, similar, miss).", ["outcome"])
+LLM_PROVIDER_REQUESTS = REGISTRY.counter("tallman_llm_provider_requests_total", "LLM provider calls by provider and outcome.", ["provider", "outcome"])
+LLM_PROVIDER_TTFT = REGISTRY.histogram("tallman_llm_provider_ttft_seconds", "Time to first streamed chunk per LLM provider.", ["provider"])
+LLM_FALLBACKS = REGISTRY.counter("tallman_llm_fallbacks_total", "LLM provider failures before the first chunk that moved to another provider.", ["provider"])
+LLM_HEDGES = REGISTRY.counter("tallman_llm_hedges_total", "Hedged LLM requests sent to a second provider.")
+
+
+# ============================
+# HTTP Endpoint
+# ============================
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """
+    Serves the registry in Prometheus text format from a daemon thread.
+
+    Safe to call on every Streamlit rerun; only the first call starts a server.
+    A port of 0 disables the endpoint.
+
+    Args:
+        port (int): The local port to listen on.
+        host (str): The interface to bind.
+
+    Returns:
+        ThreadingHTTPServer: The running server, or None if disabled or the port is taken.
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is not None:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            print(f"Failed to start metrics endpoint on {host}:{port}: {e}")
+            return None
+        thread = threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True)
+        thread.start()
+        print(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+        return _server
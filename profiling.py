@@ -0,0 +1,201 @@
+# profiling.py
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+from config import PROFILE_DIR, PROFILE_INTERVAL_MS, PROFILE_MAX_SECONDS, PROFILE_TOP_ALLOCATIONS, PROFILE_TRACEMALLOC_FRAMES
+
+# Deepest stack kept per sample; deeper frames are folded into the outermost ones
+MAX_STACK_DEPTH = 128
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _fold_stack(frame, thread_name: str) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(f"thread {thread_name}")
+    labels.reverse()
+    # Folded stacks are ";"-separated, root first
+    return ";".join(label.replace(";", ":") for label in labels)
+
+
+# ============================
+# Profiling Session
+# ============================
+class ProfilingSession:
+    """
+    Samples every thread's Python stack at a fixed interval and traces
+    allocations with tracemalloc for a bounded time, then writes:
+
+    - <name>.folded: one "frame;frame;... count" line per distinct stack,
+      the input format of flamegraph.pl, speedscope and inferno.
+    - <name>_allocations.txt: the allocation sites that grew most between
+      the start and the end of the session.
+
+    Nothing runs outside a session: no sampler thread and no allocation hooks.
+
+    Args:
+        seconds (float): Session length; the session stops itself afterwards.
+        interval_ms (float): Time between stack samples.
+        output_dir (str): Directory for the output files.
+        trace_allocations (bool): Also take tracemalloc snapshots.
+    """
+
+    def __init__(self, seconds: float, interval_ms: float = PROFILE_INTERVAL_MS, output_dir: str = PROFILE_DIR, trace_allocations: bool = True):
+        self.seconds = seconds
+        self.interval = max(interval_ms, 1) / 1000.0
+        self.output_dir = output_dir
+        self.trace_allocations = trace_allocations
+        self.name = time.strftime("profile_%Y%m%d_%H%M%S")
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.files: List[str] = []
+        self.error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_tracemalloc = False
+        self._baseline = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "ProfilingSession":
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            self._baseline = tracemalloc.take_snapshot()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        print(f"Profiling for {self.seconds:.0f} s (sampling every {self.interval * 1000:.0f} ms).")
+        return self
+
+    def stop(self, wait: bool = True):
+        self._stop.set()
+        if wait and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own_id:
+                        self.stacks[_fold_stack(frame, names.get(thread_id, str(thread_id)))] += 1
+                self.samples += 1
+                self._stop.wait(self.interval)
+            self._write()
+        except Exception as e:
+            self.error = str(e)
+            print(f"Profiling failed: {e}")
+        finally:
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            self._baseline = None
+            self.finished_at = time.time()
+
+    def _write(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        folded_path = os.path.join(self.output_dir, f"{self.name}.folded")
+        with open(folded_path, "w", encoding="utf-8") as folded_file:
+            for stack, count in self.stacks.most_common():
+                folded_file.write(f"{stack} {count}\n")
+        self.files.append(folded_path)
+
+        if self._baseline is not None:
+            allocations_path = os.path.join(self.output_dir, f"{self.name}_allocations.txt")
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ))
+            current, peak = tracemalloc.get_traced_memory()
+            with open(allocations_path, "w", encoding="utf-8") as allocations_file:
+                allocations_file.write(f"Traced memory: {current / 1e6:.1f} MB current, {peak / 1e6:.1f} MB peak\n")
+                allocations_file.write(f"Top {PROFILE_TOP_ALLOCATIONS} allocation sites by growth during the session:\n\n")
+                for stat in snapshot.compare_to(self._baseline, "traceback")[:PROFILE_TOP_ALLOCATIONS]:
+                    allocations_file.write(
+                        f"{stat.size_diff / 1024:+.1f} KiB ({stat.size / 1024:.1f} KiB total), "
+                        f"{stat.count_diff:+d} blocks\n"
+                    )
+                    for line in stat.traceback.format(most_recent_first=True):
+                        allocations_file.write(f"  {line}\n")
+                    allocations_file.write("\n")
+            self.files.append(allocations_path)
+        print(f"Profile written: {', '.join(self.files)} ({self.samples} samples).")
+
+    def status(self) -> Dict:
+        return {
+            "running": self.running,
+            "seconds": self.seconds,
+            "samples": self.samples,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "files": list(self.files),
+            "error": self.error,
+        }
+
+
+# ============================
+# Process-Wide Profiler
+# ============================
+_session: Optional[ProfilingSession] = None
+_session_lock = threading.Lock()
+
+
+def start_profiling(seconds: float, trace_allocations: bool = True) -> bool:
+    """
+    Starts a profiling session unless one is already running.
+
+    Args:
+        seconds (float): Session length, capped at PROFILE_MAX_SECONDS.
+        trace_allocations (bool): Also record allocation sites with tracemalloc.
+
+    Returns:
+        bool: True if a session was started.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None and _session.running:
+            return False
+        _session = ProfilingSession(min(seconds, PROFILE_MAX_SECONDS), trace_allocations=trace_allocations).start()
+        return True
+
+
+def stop_profiling() -> bool:
+    """
+    Ends the running session early and writes its output.
+
+    Returns:
+        bool: True if a session was running.
+    """
+    with _session_lock:
+        session = _session
+    if session is None or not session.running:
+        return False
+    session.stop()
+    return True
+
+
+def profiling_status() -> Optional[Dict]:
+    """
+    Returns the status of the running or most recent session, or None.
+    """
+    with _session_lock:
+        return _session.status() if _session is not None else None
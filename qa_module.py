@@ -2,15 +2,42 @@
 
 import chromadb
 import os
-from typing import List
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 import streamlit as st
 import pysqlite3
 import sys
 sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
-from groq import Groq
 import datetime
+import threading
 from dotenv import load_dotenv
 import tiktoken
+import time
+from tracing import span, record_span, start_trace
+from config import CHROMA_MEMORY_LIMIT_MB, GROQ_BASE_URL, INDEX_MODE
+from query_cache import PREWARMED_ANSWERS, QUERY_VECTOR_CACHE, RETRIEVAL_CACHE, collection_version, normalize_query
+from query_log import log_query, note_retrieval
+from retrieval_backends import open_client, serve
+from singleflight import SingleFlight
+from llm_scheduler import LLM_SCHEDULER
+from llm_providers import build_router
+from context_compression import compress_context
+from embeddings import collection_options
+from generation_profiles import get_profile
+from chunk_metadata import SNIPPET_MAX_CHARS, cite_sources, describe_chunks, snippet_tokens
+from metrics import (
+    ANSWER_REQUESTS,
+    ANSWER_LATENCY,
+    RETRIEVAL_LATENCY,
+    RETRIEVAL_ERRORS,
+    LLM_REQUESTS,
+    LLM_LATENCY,
+    LLM_TOKENS,
+    LLM_OUTPUT_TOKENS,
+    LLM_LENGTH_STOPS,
+    FAQ_LOOKUPS,
+    PREWARM_QUESTIONS,
+)
 
 # ============================
 # Load Environment Variables
@@ -24,7 +51,13 @@ GROQ_API_KEY = st.secrets["groq"]["api_key"]
 def get_chroma_client(persist_directory="chroma_db"):
     print("Initializing ChromaDB client...")
     try:
-        chroma_client = chromadb.PersistentClient(path=persist_directory)
+        settings = chromadb.config.Settings()
+        if CHROMA_MEMORY_LIMIT_MB:
+            # Bounds the HNSW segments held in memory across every knowledge base
+            settings = chromadb.config.Settings(
+                chroma_segment_cache_policy="LRU", chroma_memory_limit_bytes=CHROMA_MEMORY_LIMIT_MB * 1024 * 1024
+            )
+        chroma_client = chromadb.PersistentClient(path=persist_directory, settings=settings)
         print("ChromaDB client initialized successfully.")
         return chroma_client
     except Exception as e:
@@ -34,7 +67,28 @@ def get_chroma_client(persist_directory="chroma_db"):
 # ============================
 # Load QA Data with Dynamic Chunking
 # ============================
-def load_qa_data(qa_data_path="QA_data/qa_data.txt", max_lines_per_chunk=25):
+QUESTION_PREFIXES = ("USER QUESTION:", "QUESTION:")
+
+def strip_question_prefix(question: str) -> str:
+    """
+    Removes the QUESTION:/USER QUESTION: label from a question line.
+    """
+    question = question.strip()
+    for prefix in QUESTION_PREFIXES:
+        if question.upper().startswith(prefix):
+            return question[len(prefix):].strip()
+    return question
+
+def parse_qa_entries(qa_data_path="QA_data/qa_data.txt") -> List[dict]:
+    """
+    Parses qa_data.txt into its date/question/answer entries.
+
+    Args:
+        qa_data_path (str): Path to the QA data file.
+
+    Returns:
+        List[dict]: One dict per complete entry with "date", "question" and "answer" keys.
+    """
     print(f"Loading QA data from: {qa_data_path}")
     if not os.path.exists(qa_data_path):
         error_msg = f"QA data file not found: {qa_data_path}"
@@ -46,17 +100,25 @@ def load_qa_data(qa_data_path="QA_data/qa_data.txt", max_lines_per_chunk=25):
 
     entries = data.strip().split('\n\n')
     qa_entries = [entry.strip() for entry in entries if entry.strip()]
-    
-    processed_entries = []
+
+    parsed_entries = []
     for entry in qa_entries:
         lines = entry.split('\n')
         if len(lines) < 3:
             print(f"Skipping incomplete entry: {entry}")
             continue
-        date = lines[0].strip()
-        user_question = lines[1].strip()
-        answer = '\n'.join(lines[2:]).strip()
-        processed_entries.append(f"{date}\nUSER QUESTION: {user_question}\nANSWER: {answer}")
+        parsed_entries.append({
+            "date": lines[0].strip(),
+            "question": lines[1].strip(),
+            "answer": '\n'.join(lines[2:]).strip(),
+        })
+    return parsed_entries
+
+def load_qa_data(qa_data_path="QA_data/qa_data.txt", max_lines_per_chunk=25):
+    processed_entries = [
+        f"{entry['date']}\nUSER QUESTION: {entry['question']}\nANSWER: {entry['answer']}"
+        for entry in parse_qa_entries(qa_data_path)
+    ]
     print(f"Total QA entries processed: {len(processed_entries)}")
 
     chunks = []
@@ -84,15 +146,25 @@ def load_qa_data(qa_data_path="QA_data/qa_data.txt", max_lines_per_chunk=25):
 # ============================
 # Ensure Database
 # ============================
-def ensure_database(collection_name, qa_data_path, persist_directory="chroma_db", max_lines_per_chunk=100):
-    print(f"Ensuring database for collection: {collection_name}")
+def ensure_database(collection_name, qa_data_path, persist_directory="chroma_db", max_lines_per_chunk=100, backend=None):
+    """
+    Opens a collection, populating it from the QA data if it is empty.
+
+    Args:
+        backend (str): One of retrieval_backends.INDEX_MODES; defaults to INDEX_MODE.
+
+    Returns:
+        tuple: (collection served by the backend, client).
+    """
+    backend = backend or INDEX_MODE
+    print(f"Ensuring database for collection: {collection_name} ({backend} backend)")
     chunks = load_qa_data(qa_data_path, max_lines_per_chunk)
     
-    chroma_client = get_chroma_client(persist_directory=persist_directory)
+    chroma_client = open_client(persist_directory, backend)
     
     print(f"Retrieving or creating collection '{collection_name}'.")
     try:
-        collection = chroma_client.get_or_create_collection(name=collection_name)
+        collection = chroma_client.get_or_create_collection(name=collection_name, **collection_options())
         print(f"Collection '{collection_name}' retrieved/created successfully.")
     except Exception as e:
         print(f"Failed to retrieve/create collection '{collection_name}': {e}")
@@ -101,19 +173,43 @@ def ensure_database(collection_name, qa_data_path, persist_directory="chroma_db"
     count = collection.count()
     print(f"Collection '{collection_name}' has {count} entries.")
     if count == 0:
-        print(f"Upserting {len(chunks)} chunks into the collection.")
-        try:
+        populate_collection(collection, chunks)
+
+    return serve(collection, backend, persist_directory), chroma_client
+
+def populate_collection(collection, chunks: List[str], batch_size=64, progress_callback=None):
+    """
+    Upserts QA chunks into a collection in batches, with each chunk's token
+    count, entry dates, questions and entry offsets in its metadata
+    (chunk_metadata.describe_chunks).
+
+    Args:
+        collection: The ChromaDB collection instance.
+        chunks (List[str]): The chunks produced by load_qa_data.
+        batch_size (int): Chunks embedded and upserted per call.
+        progress_callback: Optional callable receiving (chunks_done, chunks_total) after each batch.
+    """
+    print(f"Upserting {len(chunks)} chunks into the collection.")
+    # Backends that persist on every write (NumPy) save once at the end instead
+    flush = getattr(collection, "flush", None)
+    upsert_options = {"persist": False} if flush is not None else {}
+    try:
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
             collection.upsert(
-                documents=chunks,
-                ids=[f"id_{i}" for i in range(len(chunks))],
-                metadatas=[{"source": f"QA_data_chunk_{i}"} for i in range(len(chunks))]
+                documents=batch,
+                ids=[f"id_{i}" for i in range(start, start + len(batch))],
+                metadatas=describe_chunks(batch, [f"QA_data_chunk_{i}" for i in range(start, start + len(batch))]),
+                **upsert_options
             )
-            print("Chunks upserted successfully.")
-        except Exception as e:
-            print(f"Failed to upsert chunks into the collection: {e}")
-            raise e
-
-    return collection, chroma_client
+            if progress_callback is not None:
+                progress_callback(start + len(batch), len(chunks))
+        if flush is not None:
+            flush()
+        print("Chunks upserted successfully.")
+    except Exception as e:
+        print(f"Failed to upsert chunks into the collection: {e}")
+        raise e
 
 # ============================
 # Reload Database
@@ -157,8 +253,126 @@ def reload_database(collection_name, qa_data_path, persist_directory="chroma_db"
 
     return collection, chroma_client
 # ============================
+# Append QA Entry
+# ============================
+# Serializes rewrites of qa_data.txt between sessions and the correction worker
+_qa_data_lock = threading.Lock()
+
+def format_qa_entry(date: str, user_question: str, answer: str) -> str:
+    return f"{date}\nUSER QUESTION: {user_question}\nANSWER: {answer}\n\n"
+
+def append_qa_entry(date: str, user_question: str, answer: str, qa_data_path: str, skip_if_present=False):
+    """
+    Appends a new QA entry to the beginning of the qa_data.txt file in the specified format.
+
+    The file is rewritten through a temporary file and os.replace so readers never
+    see a half-written file. With skip_if_present, an identical entry already at
+    the top of the file is not written again (used when retrying a correction).
+
+    Returns:
+        bool: True if the entry was written, False if it was already present.
+    """
+    entry = format_qa_entry(date, user_question, answer)
+
+    with _qa_data_lock:
+        try:
+            os.makedirs(os.path.dirname(qa_data_path), exist_ok=True)
+
+            if os.path.exists(qa_data_path):
+                with open(qa_data_path, 'r', encoding='utf-8') as f:
+                    existing_content = f.read()
+            else:
+                existing_content = ""
+
+            if skip_if_present and entry.strip() in existing_content:
+                print("QA entry already present; skipping.")
+                return False
+
+            new_content = entry + existing_content
+
+            temp_path = f"{qa_data_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(new_content)
+            os.replace(temp_path, qa_data_path)
+
+            print("New QA entry prepended successfully.")
+            return True
+        except Exception as e:
+            print(f"Failed to prepend QA entry: {e}")
+            raise e
+
+# ============================
 # Query ChromaDB with Focused Search
 # ============================
+def embed_query(query_text: str, collection):
+    """
+    Returns the query embedding for a collection, reusing cached vectors.
+
+    Returns None if the collection has no client-side embedding function.
+    """
+    embedding_function = getattr(collection, "_embedding_function", None)
+    if embedding_function is None:
+        return None
+    cache_key = (normalize_query(query_text), type(embedding_function).__name__)
+    query_embedding = QUERY_VECTOR_CACHE.get(cache_key)
+    if query_embedding is None:
+        with span("embedding"):
+            query_embedding = embedding_function([query_text])[0]
+        QUERY_VECTOR_CACHE.put(cache_key, query_embedding)
+    return query_embedding
+
+def retrieve_chunks(query_text: str, collection, n_results=10) -> List[Tuple[str, str, float, Optional[Dict]]]:
+    """
+    Returns the closest chunks to a question, most relevant first, with the
+    metadata stored at ingestion.
+
+    Results are cached per (normalized question, n_results, collection version),
+    so a repeated question skips both the embedding model and the index.
+
+    Args:
+        query_text (str): The user's question.
+        collection: The ChromaDB collection instance.
+        n_results (int): The number of results to retrieve.
+
+    Returns:
+        List[Tuple[str, str, float, dict]]: (chunk id, document, distance, metadata) tuples.
+    """
+    cache_key = (normalize_query(query_text), n_results, collection_version(collection))
+    cached = RETRIEVAL_CACHE.get(cache_key)
+    if cached is not None:
+        note_retrieval([chunk[0] for chunk in cached], cache_hit=True)
+        return cached
+
+    # Embed the question separately so embedding and index search are timed apart
+    query_embedding = embed_query(query_text, collection)
+    with span("vector_search", n_results=n_results):
+        if query_embedding is not None:
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                include=['documents', 'metadatas', 'distances']  # Include distances/scores
+            )
+        else:
+            results = collection.query(
+                query_texts=[query_text],
+                n_results=n_results,
+                include=['documents', 'metadatas', 'distances']  # Include distances/scores
+            )
+
+    if not results or not results['documents']:
+        return []
+
+    # Pair ids, documents and metadata with their distances (single query_text)
+    metadatas = (results.get('metadatas') or [None])[0] or [None] * len(results['ids'][0])
+    chunks = list(zip(results['ids'][0], results['documents'][0], results['distances'][0], metadatas))
+
+    # Sort documents by increasing distance (assuming lower distance = higher relevance)
+    chunks.sort(key=lambda x: x[2])
+
+    RETRIEVAL_CACHE.put(cache_key, chunks)
+    note_retrieval([chunk[0] for chunk in chunks], cache_hit=False)
+    return chunks
+
 def query_chroma(query_text: str, collection, n_results=10) -> List[str]:
     """
     Queries the ChromaDB collection with a search prompt.
@@ -171,54 +385,78 @@ def query_chroma(query_text: str, collection, n_results=10) -> List[str]:
     Returns:
         List[str]: A list of relevant snippets.
     """
+    return query_chroma_with_metadata(query_text, collection, n_results)[0]
+
+def query_chroma_with_metadata(query_text: str, collection, n_results=10) -> Tuple[List[str], List[Optional[Dict]]]:
+    """
+    Like query_chroma, also returning each snippet's ingestion metadata
+    (None for chunks indexed without it).
+    """
+    retrieval_start = time.perf_counter()
     try:
         print(f"Querying ChromaDB with prompt: '{query_text}'")
-        
-        # Query ChromaDB using the user's question
-        results = collection.query(
-            query_texts=[query_text],
-            n_results=n_results,
-            include=['documents', 'distances']  # Include distances/scores
-        )
-        
-        if not results or not results['documents']:
-            print("No documents found in the query results.")
-            return []
-        
-        # Extract documents and distances
-        documents = results['documents'][0]  # Assuming single query_text
-        distances = results['distances'][0]
 
-        # Pair documents with their distances
-        doc_distance_pairs = list(zip(documents, distances))
-        
-        # Sort documents by increasing distance (assuming lower distance = higher relevance)
-        doc_distance_pairs.sort(key=lambda x: x[1])
-
-        # Extract the sorted documents
-        sorted_documents = [doc for doc, _ in doc_distance_pairs]
+        chunks = retrieve_chunks(query_text, collection, n_results)
+        if not chunks:
+            print("No documents found in the query results.")
+            return [], []
 
         # Limit each snippet to 2,000 characters, considering context boundaries
-        truncated_snippets = [snippet[:2000] for snippet in sorted_documents]
+        truncated_snippets = [document[:SNIPPET_MAX_CHARS] for _, document, _, _ in chunks]
+        metadatas = [metadata for _, _, _, metadata in chunks]
 
-        return truncated_snippets
+        RETRIEVAL_LATENCY.observe(time.perf_counter() - retrieval_start)
+        return truncated_snippets, metadatas
 
     except Exception as e:
         print(f"Error querying ChromaDB: {e}")
+        RETRIEVAL_ERRORS.inc()
         # Optionally, use traceback.print_exc() for full stack trace
-        return []
+        return [], []
 
 # ============================
 # Generate AI Response
 # ============================
-def generate_ai_response(user_question: str, snippets: List[str], subject: int) -> str:
+_LLM_ROUTERS = {}
+
+
+def get_llm_router():
+    """
+    Returns the process-wide LLM router, so provider latency statistics are
+    shared by every session. Keyed on the Groq settings so benchmarks can
+    repoint GROQ_BASE_URL at runtime.
+    """
+    key = (GROQ_API_KEY, GROQ_BASE_URL)
+    router = _LLM_ROUTERS.get(key)
+    if router is None:
+        router = _LLM_ROUTERS.setdefault(key, build_router(GROQ_API_KEY, GROQ_BASE_URL))
+    return router
+
+@lru_cache(maxsize=16)
+def _system_prompt_tokens(system_prompt: str) -> int:
+    # The system prompts are fixed, so each is tokenized once per process
+    return len(tiktoken.get_encoding("cl100k_base").encode(system_prompt))
+
+def generate_ai_response(user_question: str, snippets: List[str], subject: int, on_token=None, user=None, on_wait=None, compress=True,
+                         metadatas: Optional[List[Optional[Dict]]] = None) -> str:
     """
     Generates a single AI response using the user question and merged snippets.
 
+    The subject's generation profile (generation_profiles.py) sets the response
+    budget, sampling, stop sequences and the model's context size.
+
     Args:
         user_question (str): The question entered by the user.
         snippets (List[str]): The merged context snippets from ChromaDB.
         subject (int): The index for the type of query (e.g., Tallman, Sales, etc.).
+        on_token: Optional callable receiving each streamed chunk of the response.
+        user (str): Fair-queuing key for the LLM scheduler, e.g. the username.
+        on_wait: Optional callable receiving the queue position while waiting for the LLM.
+        compress (bool): Reduce retrieved snippets to the spans that match the
+            question, within CONTEXT_TOKEN_BUDGET.
+        metadatas (List[Dict]): The snippets' ingestion metadata. With it the
+            context is compressed and the prompt budgeted by adding stored
+            token counts, and the context is only tokenized when it must be cut.
 
     Returns:
         str: The generated AI response.
@@ -235,6 +473,20 @@ def generate_ai_response(user_question: str, snippets: List[str], subject: int)
 
     # Select the system prompt based on the subject
     system_prompt = subject_prompts.get(subject, "You are a helpful assistant.")
+    profile = get_profile(subject)
+
+    if compress:
+        compression_start = time.perf_counter()
+        snippets, tokens_before, tokens_after = compress_context(user_question, snippets, metadatas=metadatas)
+        record_span(
+            "context_compression", (time.perf_counter() - compression_start) * 1000.0,
+            tokens_before=tokens_before, tokens_after=tokens_after,
+        )
+        context_token_count = tokens_after
+    else:
+        context_token_count = sum(snippet_tokens(snippets, metadatas)) if metadatas is not None else None
+
+    prompt_start = time.perf_counter()
 
     # Combine the snippets into context
     context = " ".join(snippets)  # Convert list of snippets into a single string
@@ -246,12 +498,16 @@ def generate_ai_response(user_question: str, snippets: List[str], subject: int)
     encoding = tiktoken.get_encoding("cl100k_base")
 
     # Calculate token counts
-    max_total_tokens = 8192  # Adjust based on the model's actual limit
-    max_response_tokens = 1500  # Reserve tokens for the response
+    max_total_tokens = profile.context_window
+    max_response_tokens = profile.max_tokens  # Reserve tokens for the response
 
     # Token counts for prompts
-    system_prompt_tokens = len(encoding.encode(system_prompt))
-    user_prompt_tokens = len(encoding.encode(user_prompt))
+    system_prompt_tokens = _system_prompt_tokens(system_prompt)
+    if context_token_count is None:
+        user_prompt_tokens = len(encoding.encode(user_prompt))
+    else:
+        # Only the question is tokenized; one token is allowed per joining space
+        user_prompt_tokens = context_token_count + len(snippets) + len(encoding.encode(f"Context: \n\nQuestion: {user_question}"))
 
     total_prompt_tokens = system_prompt_tokens + user_prompt_tokens
 
@@ -268,14 +524,27 @@ def generate_ai_response(user_question: str, snippets: List[str], subject: int)
         context = encoding.decode(truncated_context_tokens)
         # Rebuild the user prompt
         user_prompt = f"Context: {context}\n\nQuestion: {user_question}"
-
-    # Initialize the Groq client with the API key from the .env file
-    client = Groq(api_key=GROQ_API_KEY)
-
-    try:
-        completion = client.chat.completions.create(
-            model="llama-3.2-90b-text-preview",
-            messages=[
+        total_prompt_tokens = max_allowed_prompt_tokens
+
+    record_span("prompt_assembly", (time.perf_counter() - prompt_start) * 1000.0, prompt_tokens=total_prompt_tokens)
+
+    # Providers are chosen per request by the router
+    router = get_llm_router()
+
+    generation_start = time.perf_counter()
+    completion_chunks = 0
+    admitted = False
+    scheduler = LLM_SCHEDULER
+
+    def stream_completion():
+        # Runs once admitted by the scheduler, and again after a 429
+        nonlocal generation_start, completion_chunks, admitted
+        admitted = True
+        generation_start = time.perf_counter()
+        first_token_at = None
+        completion_chunks = 0
+        completion = router.stream_chat(
+            [
                 {
                     "role": "system",
                     "content": system_prompt
@@ -285,42 +554,180 @@ def generate_ai_response(user_question: str, snippets: List[str], subject: int)
                     "content": user_prompt
                 }
             ],
-            temperature=1,
             max_tokens=max_response_tokens,
-            top_p=1,
-            stream=True,
-            stop=None,
+            temperature=profile.temperature,
+            top_p=profile.top_p,
+            stop=profile.stop,
         )
 
         # Collect the response
         response = ""
-        for chunk in completion:
-            # Access the content attribute safely
-            content = getattr(chunk.choices[0].delta, 'content', '')
-            if content is None:
-                content = ''
+        for content in completion:
+            if content and first_token_at is None:
+                first_token_at = time.perf_counter()
+                record_span("time_to_first_token", (first_token_at - generation_start) * 1000.0)
+            if content:
+                completion_chunks += 1  # Providers stream roughly one token per chunk
+                if on_token is not None:
+                    on_token(content)
             response += content
+        return response
 
+    try:
+        # Waits for a concurrency slot and rate budget; retries on 429
+        try:
+            response = scheduler.submit(
+                stream_completion, user=user, tokens=total_prompt_tokens + max_response_tokens, on_wait=on_wait
+            )
+        finally:
+            # Response tokens that were reserved but not generated, also when the call failed
+            if admitted:
+                scheduler.refund(max_response_tokens - completion_chunks)
+
+        generation_seconds = time.perf_counter() - generation_start
+        # Output lengths against the budget show whether a profile's max_tokens fits its subject
+        output_tokens = len(encoding.encode(response))
+        hit_limit = max(output_tokens, completion_chunks) >= max_response_tokens
+        record_span(
+            "generation", generation_seconds * 1000.0, subject=subject, response_chars=len(response),
+            output_tokens=output_tokens, max_tokens=max_response_tokens, hit_limit=hit_limit,
+        )
+        LLM_REQUESTS.inc(subject=subject, outcome="ok")
+        LLM_LATENCY.observe(generation_seconds, subject=subject)
+        LLM_TOKENS.inc(total_prompt_tokens, kind="prompt")
+        LLM_TOKENS.inc(completion_chunks, kind="completion")
+        LLM_OUTPUT_TOKENS.observe(output_tokens, subject=subject)
+        if hit_limit:
+            LLM_LENGTH_STOPS.inc(subject=subject)
         return response
 
     except Exception as e:
         error_message = f"Error generating AI response: {e}"
         print(error_message)
+        record_span("generation", (time.perf_counter() - generation_start) * 1000.0, subject=subject, error=str(e))
+        LLM_REQUESTS.inc(subject=subject, outcome="error")
         return error_message  # Return the error message to be displayed
 
+# ============================
+# Direct FAQ Answers
+# ============================
+def lookup_faq(user_question: str, collection):
+    """
+    Finds a stored QA question matching the user's question, exactly after
+    normalization or by question-embedding similarity.
+
+    Returns:
+        FAQMatch or None: None if nothing matches or the collection has no FAQ index.
+    """
+    faq = getattr(collection, "faq", None)
+    if faq is None:
+        return None
+    with span("faq_lookup"):
+        match = faq.lookup_exact(user_question)
+        if match is None and faq.has_vectors:
+            match = faq.lookup_similar(embed_query(user_question, collection))
+    FAQ_LOOKUPS.inc(outcome=match.kind if match is not None else "miss")
+    return match
+
 # ============================
 # Handle Answer Function
 # ============================
-def handle_answer(user_question, query_type, collection):
+# Identical questions asked while an answer is being generated share it
+ANSWER_FLIGHTS = SingleFlight("answer")
+
+def handle_answer(user_question, query_type, collection, ask_ai=False):
+    """
+    Answers a question into st.session_state.last_response.
+
+    A question matching a stored QA question is answered from qa_data.txt
+    without calling the LLM, unless ask_ai is set.
+    """
     if not user_question:
         st.error("Please enter a question.")
         return
 
+    answer_start = time.perf_counter()
+    knowledge_base = getattr(collection, "knowledge_base", None)
+    with start_trace("handle_answer", query_type=query_type) as trace, log_query(user_question, query_type, knowledge_base) as logged:
+        st.session_state.last_request_id = trace.request_id
+        match = None if ask_ai else lookup_faq(user_question, collection)
+        st.session_state.last_faq_match = match
+        if match is not None:
+            st.session_state.last_response = match.answer
+            st.session_state.last_sources = []
+            outcome = logged["cache"] = "faq"
+        else:
+            outcome = _handle_answer(user_question, query_type, collection)
+            if outcome == "prewarmed":
+                logged["cache"] = "prewarmed"
+        logged["outcome"] = outcome
+    ANSWER_REQUESTS.inc(query_type=query_type, outcome=outcome)
+    ANSWER_LATENCY.observe(time.perf_counter() - answer_start, query_type=query_type)
+
+def _handle_answer(user_question, query_type, collection):
+    # Concurrent identical questions share one retrieval and generation
+    key = (normalize_query(user_question), query_type, collection_version(collection))
+    prewarmed = PREWARMED_ANSWERS.get(key)
+    if prewarmed is not None:
+        st.session_state.last_response, st.session_state.last_sources = prewarmed
+        return "prewarmed"
+    user = st.session_state.get("user")
+    queue_status = st.empty()
+    answer_preview = st.empty()
+    streamed = []
+
+    def show_progress(kind, value):
+        # Runs in this session's thread; the shared call itself never touches st
+        if kind == "status":
+            queue_status.info(f"The assistant is busy. You are number {value} in line...")
+        elif kind == "chunk":
+            queue_status.empty()
+            streamed.append(value)
+            answer_preview.markdown("".join(streamed))
+        elif kind == "reset":
+            streamed.clear()
+            answer_preview.empty()
+
+    wait_start = time.perf_counter()
+    try:
+        (outcome, response, sources), shared = ANSWER_FLIGHTS.do(
+            key,
+            lambda flight: answer_question(
+                user_question, query_type, collection, on_token=flight.publish, user=user, on_wait=flight.set_status
+            ),
+            on_event=show_progress,
+        )
+    finally:
+        queue_status.empty()
+        answer_preview.empty()
+    if shared:
+        record_span("coalesced_wait", (time.perf_counter() - wait_start) * 1000.0)
+
+    if outcome == "no_context":
+        st.error("No relevant context found for this question.")
+        return outcome
+    st.session_state.last_response = response
+    st.session_state.last_sources = sources
+    return outcome
+
+def answer_question(user_question, query_type, collection, on_token=None, user=None, on_wait=None) -> Tuple[str, str, List[Dict]]:
+    """
+    Retrieves context and generates an answer, without touching session state.
+
+    Args:
+        on_token: Optional callable receiving each streamed chunk of the answer.
+        user (str): Fair-queuing key for the LLM scheduler.
+        on_wait: Optional callable receiving the LLM queue position while waiting.
+
+    Returns:
+        Tuple[str, str, List[Dict]]: (outcome, response, sources) where outcome is
+        "ok", "error" or "no_context" (response is None), and sources are the
+        chunk_metadata.cite_sources() citations of the retrieved chunks.
+    """
     # Query ChromaDB with the user's question directly
-    snippets = query_chroma(user_question, collection, n_results=3)
+    snippets, metadatas = query_chroma_with_metadata(user_question, collection, n_results=3)
     if not snippets:
-        st.error("No relevant context found for this question.")
-        return
+        return "no_context", None, []
 
     # Determine which prompt to use based on the query type
     query_type_options = {
@@ -331,9 +738,55 @@ def handle_answer(user_question, query_type, collection):
     }
     prompt_index = query_type_options.get(query_type, 5)  # Default to 5 if not found
 
-    # Generate the AI response using the Groq model and snippets
-    response = generate_ai_response(user_question, snippets, prompt_index)
-    st.session_state.last_response = response
+    # Generate the AI response using the routed LLM and snippets
+    response = generate_ai_response(
+        user_question, snippets, prompt_index, on_token=on_token, user=user, on_wait=on_wait,
+        metadatas=metadatas,
+    )
+    return ("error" if response.startswith("Error generating AI response:") else "ok"), response, cite_sources(metadatas)
+
+# ============================
+# Pre-Warming Frequent Questions
+# ============================
+def prewarm_answers(questions, get_collection) -> dict:
+    """
+    Answers frequent questions ahead of time so their next asker gets the
+    answer without waiting for retrieval or the LLM. Answers are kept until
+    the collection changes, like cached retrieval results.
+
+    Args:
+        questions (List[Dict]): query_log.top_questions() rows.
+        get_collection: Callable returning the collection for a knowledge base name.
+
+    Returns:
+        dict: Number of questions per outcome (warmed, faq, skipped, failed).
+    """
+    summary = {"warmed": 0, "faq": 0, "skipped": 0, "failed": 0}
+    for row in questions:
+        try:
+            collection = get_collection(row["kb"])
+            question, query_type = row["q"], row["subject"]
+            faq = getattr(collection, "faq", None)
+            if faq is not None and faq.lookup_exact(question) is not None:
+                outcome = "faq"  # Already answered without the LLM
+            else:
+                key = (normalize_query(question), query_type, collection_version(collection))
+                if PREWARMED_ANSWERS.get(key) is not None:
+                    outcome = "skipped"
+                else:
+                    with start_trace("prewarm", query_type=query_type):
+                        answer_outcome, response, sources = answer_question(question, query_type, collection, user="prewarm")
+                    if answer_outcome == "ok":
+                        PREWARMED_ANSWERS.put(key, (response, sources))
+                        outcome = "warmed"
+                    else:
+                        outcome = "skipped" if answer_outcome == "no_context" else "failed"
+        except Exception as e:
+            print(f"Failed to pre-warm '{row['q'][:80]}': {e}")
+            outcome = "failed"
+        summary[outcome] += 1
+        PREWARM_QUESTIONS.inc(outcome=outcome)
+    return summary
 
 # ============================
 # Close ChromaDB Client
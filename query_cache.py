@@ -0,0 +1,99 @@
+# query_cache.py
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from config import PREWARM_TOP_N, QUERY_CACHE_SIZE
+from metrics import CACHE_MISSES, CACHE_REQUESTS
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalizes a question for cache keys: case-folded with whitespace collapsed.
+    """
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+class LRUCache:
+    """
+    A thread-safe least-recently-used cache with hit/miss metrics.
+
+    Args:
+        name (str): Label used for the cache metrics.
+        maxsize (int): Maximum number of entries; 0 disables the cache.
+    """
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        if not self.maxsize:
+            return None
+        CACHE_REQUESTS.inc(cache=self.name)
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                return value
+        CACHE_MISSES.inc(cache=self.name)
+        return None
+
+    def put(self, key: Hashable, value):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# ============================
+# Retrieval Caches
+# ============================
+# Query vectors depend only on the text and the embedding model
+QUERY_VECTOR_CACHE = LRUCache("query_embedding", QUERY_CACHE_SIZE)
+# Ranked (id, document, distance) results depend on the collection contents too
+RETRIEVAL_CACHE = LRUCache("retrieval", QUERY_CACHE_SIZE)
+# Answers generated ahead of time for frequent questions (query_log.py)
+PREWARMED_ANSWERS = LRUCache("prewarmed_answer", PREWARM_TOP_N)
+
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def collection_version(collection) -> tuple:
+    """
+    Identifies the current contents of a collection for cache keys.
+
+    The collection name changes with every rebuild (tallman_knowledge_v{n});
+    the generation changes whenever invalidate() is called after a write.
+    """
+    return (getattr(collection, "name", None) or id(collection), _generation)
+
+
+def invalidate(reason: Optional[str] = None):
+    """
+    Drops cached retrieval results after the collection was modified.
+    """
+    global _generation
+    with _generation_lock:
+        _generation += 1
+    RETRIEVAL_CACHE.clear()
+    PREWARMED_ANSWERS.clear()
+    if reason:
+        print(f"Retrieval cache invalidated: {reason}")
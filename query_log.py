@@ -0,0 +1,232 @@
+# query_log.py
+
+import argparse
+import contextvars
+import datetime
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from config import PREWARM_HOUR, PREWARM_LOOKBACK_DAYS, PREWARM_TOP_N, QUERY_LOG, QUERY_LOG_PATH
+from query_cache import normalize_query
+
+_current_entry = contextvars.ContextVar("current_query_entry", default=None)
+
+
+# ============================
+# Query Log
+# ============================
+class QueryLog:
+    """
+    An append-only JSON-lines log with one short record per answered question:
+
+        {"ts": 1718000000.1, "kb": "tallman", "q": "...", "subject": "Sales",
+         "ms": 2310.4, "outcome": "ok", "cache": "miss", "chunks": ["id1", "id2"]}
+
+    "cache" is "faq" or "prewarmed" for answers served without the LLM,
+    "retrieval" when the retrieval results were cached, and "miss" otherwise.
+    """
+
+    def __init__(self, path: str = QUERY_LOG_PATH, enabled: bool = QUERY_LOG):
+        self.path = path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def append(self, entry: Dict):
+        if not self.enabled:
+            return
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        try:
+            with self._lock:
+                with open(self.path, "a", encoding="utf-8") as log_file:
+                    log_file.write(line)
+        except OSError as e:
+            print(f"Failed to write query log: {e}")
+
+    def read(self, since: Optional[float] = None) -> List[Dict]:
+        entries = []
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, "r", encoding="utf-8") as log_file:
+            for line in log_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by a crash
+                if isinstance(entry, dict) and "q" in entry and (since is None or entry.get("ts", 0) >= since):
+                    entries.append(entry)
+        return entries
+
+
+QUERY_LOG_WRITER = QueryLog()
+
+
+@contextmanager
+def log_query(question: str, subject: str, knowledge_base: Optional[str] = None):
+    """
+    Times one answered question and appends it to the query log on exit.
+
+    Retrieval inside the block reports its chunk IDs and cache use through
+    note_retrieval; the caller sets "outcome" (and "cache" for answers served
+    without retrieval) on the yielded entry.
+    """
+    entry = {"ts": round(time.time(), 3), "kb": knowledge_base, "q": question.strip(), "subject": subject, "cache": "miss"}
+    token = _current_entry.set(entry)
+    start = time.perf_counter()
+    try:
+        yield entry
+    finally:
+        _current_entry.reset(token)
+        entry["ms"] = round((time.perf_counter() - start) * 1000.0, 1)
+        QUERY_LOG_WRITER.append(entry)
+
+
+def note_retrieval(chunk_ids: List[str], cache_hit: bool):
+    """
+    Records the chunks retrieved for the question being logged, if any.
+    Only the first retrieval of a question is kept.
+    """
+    entry = _current_entry.get()
+    if entry is not None and "chunks" not in entry:
+        entry["chunks"] = list(chunk_ids)
+        if cache_hit:
+            entry["cache"] = "retrieval"
+
+
+# ============================
+# Rollup
+# ============================
+def top_questions(top_n: int = PREWARM_TOP_N, lookback_days: float = PREWARM_LOOKBACK_DAYS, log: Optional[QueryLog] = None) -> List[Dict]:
+    """
+    Finds the most frequently asked questions in the log.
+
+    Questions are grouped by knowledge base, subject and normalized text.
+    Questions that found no context are left out, since there is nothing to
+    prepare for them.
+
+    Args:
+        top_n (int): Number of questions to return.
+        lookback_days (float): Only entries this recent are counted; 0 counts all.
+        log (QueryLog): The log to read; the app's query log by default.
+
+    Returns:
+        List[Dict]: {"kb", "q", "subject", "count", "mean_ms", "cache_hits"}, most frequent first;
+        "q" is the most recent wording.
+    """
+    log = log or QUERY_LOG_WRITER
+    since = time.time() - lookback_days * 86400 if lookback_days else None
+    counts: Counter = Counter()
+    latest: Dict[tuple, Dict] = {}
+    total_ms: Dict[tuple, float] = {}
+    cache_hits: Counter = Counter()
+    for entry in log.read(since):
+        if entry.get("outcome") == "no_context":
+            continue
+        key = (entry.get("kb"), entry.get("subject"), normalize_query(entry["q"]))
+        counts[key] += 1
+        latest[key] = entry
+        total_ms[key] = total_ms.get(key, 0.0) + float(entry.get("ms", 0.0))
+        if entry.get("cache") != "miss":
+            cache_hits[key] += 1
+    return [
+        {
+            "kb": key[0],
+            "q": latest[key]["q"],
+            "subject": key[1],
+            "count": count,
+            "mean_ms": total_ms[key] / count,
+            "cache_hits": cache_hits[key],
+        }
+        for key, count in counts.most_common(top_n)
+    ]
+
+
+# ============================
+# Scheduled Pre-Warming
+# ============================
+class PrewarmScheduler:
+    """
+    Calls a pre-warming function once a day at a fixed local hour, on a
+    daemon thread, and on demand through run_now.
+
+    Args:
+        prewarm (Callable): Called with the top_questions() list; returns a summary dict.
+        hour (int): Local hour (0-23) of the daily run; negative disables the schedule.
+    """
+
+    def __init__(self, prewarm: Callable[[List[Dict]], Dict], hour: int = PREWARM_HOUR):
+        self.prewarm = prewarm
+        self.hour = hour
+        self._run_lock = threading.Lock()
+        self._status: Dict = {"state": "idle", "finished_at": None, "summary": None, "error": None}
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "PrewarmScheduler":
+        if self.hour >= 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="prewarm-scheduler", daemon=True)
+            self._thread.start()
+            print(f"Answer pre-warming scheduled daily at {self.hour:02d}:00.")
+        return self
+
+    def _seconds_until_next_run(self) -> float:
+        now = datetime.datetime.now()
+        next_run = now.replace(hour=self.hour % 24, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += datetime.timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+    def _loop(self):
+        while True:
+            time.sleep(self._seconds_until_next_run())
+            self.run()
+
+    def run_now(self) -> bool:
+        """
+        Starts a pre-warming run in the background unless one is running.
+        """
+        if self._run_lock.locked():
+            return False
+        threading.Thread(target=self.run, name="prewarm", daemon=True).start()
+        return True
+
+    def run(self):
+        if not self._run_lock.acquire(blocking=False):
+            return
+        try:
+            self._status.update(state="running", error=None)
+            summary = self.prewarm(top_questions())
+            self._status.update(state="succeeded", summary=summary)
+            print(f"Answer pre-warming finished: {summary}")
+        except Exception as e:
+            self._status.update(state="failed", error=str(e))
+            print(f"Answer pre-warming failed: {e}")
+        finally:
+            self._status["finished_at"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self._run_lock.release()
+
+    def status(self) -> Dict:
+        return dict(self._status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Most frequently asked questions in the query log.")
+    parser.add_argument("--top", type=int, default=PREWARM_TOP_N)
+    parser.add_argument("--days", type=float, default=PREWARM_LOOKBACK_DAYS, help="Look back this many days (0 = whole log).")
+    parser.add_argument("--log", default=QUERY_LOG_PATH)
+    args = parser.parse_args()
+
+    rows = top_questions(args.top, args.days, QueryLog(args.log))
+    if not rows:
+        print(f"No questions found in {args.log}")
+        return
+    print(f"{'count':>6}{'cached':>8}{'mean ms':>10}  {'kb':<12}{'subject':<10}question")
+    for row in rows:
+        print(f"{row['count']:>6}{row['cache_hits']:>8}{row['mean_ms']:>10.0f}  {str(row['kb']):<12}{str(row['subject']):<10}{row['q'][:80]}")
+
+
+if __name__ == "__main__":
+    main()
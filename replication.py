@@ -0,0 +1,220 @@
+# replication.py
+
+import datetime
+import os
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from config import REPLICATION_NODE_ID, REPLICATION_POLL_SECONDS
+from metrics import REPLICATION_APPLIED, REPLICATION_LAG
+
+# Entries applied per read while catching up
+BATCH_SIZE = 100
+
+LOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS correction_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    published_at TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    origin_job_id INTEGER NOT NULL,
+    knowledge_base TEXT NOT NULL,
+    entry_date TEXT NOT NULL,
+    user_question TEXT NOT NULL,
+    new_answer TEXT NOT NULL,
+    UNIQUE (origin, knowledge_base, origin_job_id)
+)
+"""
+
+CURSOR_SCHEMA = """
+CREATE TABLE IF NOT EXISTS replication_cursor (
+    knowledge_base TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL
+)
+"""
+
+
+def node_id() -> str:
+    return REPLICATION_NODE_ID or socket.gethostname()
+
+
+@contextmanager
+def _connect(path: str):
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+# ============================
+# Shared Correction Log
+# ============================
+class ReplicationLog:
+    """
+    The ordered log of applied corrections shared by every app node, as a
+    SQLite file on storage all nodes can reach. Each entry gets the next
+    sequence number, so nodes apply corrections in the same order.
+
+    Publishing is idempotent per (origin node, knowledge base, job ID), so a
+    correction worker that crashes after publishing can safely publish again.
+
+    Args:
+        path (str): Path of the shared SQLite file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with _connect(path) as conn:
+            conn.execute(LOG_SCHEMA)
+
+    def publish(self, knowledge_base: str, job_id: int, entry_date: str, user_question: str, new_answer: str, origin: Optional[str] = None) -> int:
+        """
+        Appends a reformulated correction to the log.
+
+        Returns:
+            int: The entry's sequence number.
+        """
+        origin = origin or node_id()
+        with _connect(self.path) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO correction_log "
+                "(published_at, origin, origin_job_id, knowledge_base, entry_date, user_question, new_answer) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (datetime.datetime.now().isoformat(timespec="seconds"), origin, job_id, knowledge_base, entry_date, user_question, new_answer),
+            )
+            return conn.execute(
+                "SELECT seq FROM correction_log WHERE origin = ? AND knowledge_base = ? AND origin_job_id = ?",
+                (origin, knowledge_base, job_id),
+            ).fetchone()[0]
+
+    def read_after(self, seq: int, knowledge_base: str, limit: int = BATCH_SIZE) -> List[Dict]:
+        with _connect(self.path) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                "SELECT * FROM correction_log WHERE seq > ? AND knowledge_base = ? ORDER BY seq LIMIT ?",
+                (seq, knowledge_base, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count_after(self, seq: int, knowledge_base: str) -> int:
+        with _connect(self.path) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM correction_log WHERE seq > ? AND knowledge_base = ?", (seq, knowledge_base)
+            ).fetchone()[0]
+
+
+# ============================
+# Tailing the Log
+# ============================
+class ReplicationTailer:
+    """
+    Applies new entries of the shared log to this node's QA file and index,
+    in sequence order, including the ones this node published.
+
+    The last applied sequence number is kept in the node's local correction
+    journal, so a node that was down applies only what it missed. Applying an
+    entry is idempotent (the QA entry is skipped if present and the index
+    write is an upsert), so a crash between applying and saving the cursor
+    only repeats that entry.
+
+    Args:
+        log (ReplicationLog): The shared log.
+        knowledge_base (str): The knowledge base whose entries are applied.
+        qa_data_path (str): This node's QA data file.
+        collection: This node's collection (or KnowledgeIndex handle).
+        state_path (str): This node's SQLite correction journal, which holds the cursor.
+        poll_seconds (float): Time between checks for new entries.
+    """
+
+    def __init__(self, log: ReplicationLog, knowledge_base: str, qa_data_path: str, collection, state_path: str, poll_seconds: float = REPLICATION_POLL_SECONDS):
+        self.log = log
+        self.knowledge_base = knowledge_base
+        self.qa_data_path = qa_data_path
+        self.collection = collection
+        self.state_path = state_path
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._behind = 0
+        self._error: Optional[str] = None
+        os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+        with _connect(state_path) as conn:
+            conn.execute(CURSOR_SCHEMA)
+
+    def applied_seq(self) -> int:
+        with _connect(self.state_path) as conn:
+            row = conn.execute("SELECT seq FROM replication_cursor WHERE knowledge_base = ?", (self.knowledge_base,)).fetchone()
+        return row[0] if row else 0
+
+    def _save_cursor(self, seq: int):
+        with _connect(self.state_path) as conn:
+            conn.execute(
+                "INSERT INTO replication_cursor (knowledge_base, seq) VALUES (?, ?) "
+                "ON CONFLICT(knowledge_base) DO UPDATE SET seq = excluded.seq",
+                (self.knowledge_base, seq),
+            )
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=f"replication-{self.knowledge_base}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wake(self):
+        """
+        Checks for new entries right away, e.g. after this node published one.
+        """
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.catch_up()
+                self._error = None
+            except Exception as e:
+                self._error = str(e)
+                print(f"Replication of '{self.knowledge_base}' failed: {e}")
+            self._wake.wait(timeout=self.poll_seconds)
+            self._wake.clear()
+
+    def catch_up(self) -> int:
+        """
+        Applies every entry after the cursor.
+
+        Returns:
+            int: The number of entries applied.
+        """
+        from correction_queue import apply_correction
+
+        applied = 0
+        seq = self.applied_seq()
+        while True:
+            entries = self.log.read_after(seq, self.knowledge_base)
+            for entry in entries:
+                apply_correction(self.qa_data_path, self.collection, entry["entry_date"], entry["user_question"], entry["new_answer"])
+                seq = entry["seq"]
+                self._save_cursor(seq)
+                applied += 1
+                REPLICATION_APPLIED.inc(knowledge_base=self.knowledge_base)
+            if len(entries) < BATCH_SIZE:
+                break
+        self._behind = self.log.count_after(seq, self.knowledge_base)
+        REPLICATION_LAG.set(self._behind, knowledge_base=self.knowledge_base)
+        if applied:
+            print(f"Replication applied {applied} correction(s) to '{self.knowledge_base}' (now at #{seq}).")
+        return applied
+
+    def status(self) -> Dict:
+        return {"applied_seq": self.applied_seq(), "behind": self._behind, "error": self._error}
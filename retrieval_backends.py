@@ -0,0 +1,320 @@
+# retrieval_backends.py
+
+import io
+import json
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Values accepted for INDEX_MODE
+INDEX_MODES = ("chroma", "compact", "snapshot", "numpy")
+NUMPY_DIRNAME = "numpy"
+NUMPY_STORE_FILE = "store.npz"
+
+
+class RetrievalBackend:
+    """
+    The part of the ChromaDB collection API the app relies on.
+
+    query_chroma, populate_collection, KnowledgeIndex and the correction queue
+    only call these methods (plus _embedding_function for query embeddings), so
+    a chromadb Collection or any subclass of this can be used interchangeably.
+    Subclasses also provide a `name` that changes when the contents are rebuilt.
+    """
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, include=("documents", "distances"), **kwargs) -> Dict:
+        """
+        Returns chroma-shaped results: {"ids": [[...]], "documents": [[...]], ...},
+        one inner list per query, closest first.
+        """
+        raise NotImplementedError
+
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None, **kwargs):
+        raise NotImplementedError
+
+    def add(self, ids, documents=None, metadatas=None, embeddings=None, **kwargs):
+        return self.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings, **kwargs)
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+# ============================
+# NumPy Backend
+# ============================
+class NumpyCollection(RetrievalBackend):
+    """
+    Exact search over a contiguous, L2-normalized float32 matrix held in memory.
+
+    A query (or a batch of queries) is one matrix product plus an argpartition
+    per row. Distances are squared L2 between the normalized vectors
+    (2 - 2 * cosine), which matches ChromaDB's default space for the
+    normalized MiniLM embeddings, so thresholds and ordering carry over.
+
+    Each write copies the arrays, swaps them in and rewrites the store file, so
+    queries never see a half-applied batch. That is cheap for a corpus of a few
+    thousand chunks and is not meant for large ones. Bulk loads pass
+    persist=False to every upsert and call flush() once at the end, so the
+    store file is written once instead of once per batch.
+
+    Args:
+        name (str): The collection name.
+        directory (str): Directory holding store.npz.
+        embedding_function: Callable turning a list of texts into vectors.
+    """
+
+    def __init__(self, name: str, directory: str, embedding_function):
+        self.name = name
+        self.directory = directory
+        self._embedding_function = embedding_function
+        self.metadata = {"hnsw:space": "l2"}
+        self._lock = threading.Lock()        # Guards swapping the arrays
+        self._write_lock = threading.Lock()  # Serializes writers
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._ids: List[str] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Optional[dict]] = []
+        self._row_of: Dict[str, int] = {}
+        self._unsaved = False
+        self._load()
+
+    @property
+    def store_path(self) -> str:
+        return os.path.join(self.directory, NUMPY_STORE_FILE)
+
+    def _load(self):
+        if not os.path.exists(self.store_path):
+            return
+        with np.load(self.store_path) as store:
+            self._matrix = np.ascontiguousarray(store["vectors"], dtype=np.float32)
+            records = json.loads(store["records"].tobytes().decode("utf-8"))
+        self._ids = records["ids"]
+        self._documents = records["documents"]
+        self._metadatas = records["metadatas"]
+        self._row_of = {record_id: row for row, record_id in enumerate(self._ids)}
+
+    def _save(self, matrix, ids, documents, metadatas):
+        os.makedirs(self.directory, exist_ok=True)
+        records = json.dumps({"ids": ids, "documents": documents, "metadatas": metadatas}).encode("utf-8")
+        buffer = io.BytesIO()
+        np.savez(buffer, vectors=matrix, records=np.frombuffer(records, dtype=np.uint8))
+        temp_path = f"{self.store_path}.tmp-{os.getpid()}"
+        with open(temp_path, "wb") as store_file:
+            store_file.write(buffer.getvalue())
+        os.replace(temp_path, self.store_path)
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, include=("documents", "distances"), where=None, where_document=None, **kwargs):
+        if where or where_document or kwargs:
+            raise ValueError("The NumPy backend does not support metadata or document filters.")
+        if query_embeddings is None:
+            query_embeddings = self._embedding_function(list(query_texts))
+        queries = _normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        with self._lock:
+            matrix, ids, documents, metadatas = self._matrix, self._ids, self._documents, self._metadatas
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        top = min(n_results, len(ids))
+        if top > 0:
+            similarities = queries @ matrix.T
+            candidates = np.argpartition(-similarities, top - 1, axis=1)[:, :top]
+            for row_scores, row_candidates in zip(similarities, candidates):
+                ranked = row_candidates[np.argsort(-row_scores[row_candidates])].tolist()
+                results["ids"].append([ids[i] for i in ranked])
+                results["documents"].append([documents[i] for i in ranked])
+                results["metadatas"].append([metadatas[i] for i in ranked])
+                results["distances"].append((2.0 - 2.0 * row_scores[ranked]).tolist())
+        else:
+            for key in results:
+                results[key] = [[] for _ in range(len(queries))]
+        for key in ("documents", "metadatas", "distances"):
+            if key not in include:
+                results[key] = None
+        results["embeddings"] = None
+        return results
+
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None, persist=True, **kwargs):
+        """
+        Inserts or replaces records. With persist=False the store file is only
+        written by the next persisting upsert or flush().
+        """
+        if embeddings is None:
+            embeddings = self._embedding_function(list(documents))
+        vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        with self._write_lock:
+            matrix = self._matrix if len(self._ids) else np.zeros((0, vectors.shape[1]), dtype=np.float32)
+            new_ids, new_documents, new_metadatas = list(self._ids), list(self._documents), list(self._metadatas)
+            row_of = dict(self._row_of)
+            appended = []
+            matrix = matrix.copy()
+            for i, record_id in enumerate(ids):
+                document = documents[i] if documents is not None else None
+                metadata = metadatas[i] if metadatas is not None else None
+                row = row_of.get(record_id)
+                if row is None:
+                    row_of[record_id] = len(new_ids)
+                    new_ids.append(record_id)
+                    new_documents.append(document)
+                    new_metadatas.append(metadata)
+                    appended.append(vectors[i])
+                else:
+                    if row < len(matrix):
+                        matrix[row] = vectors[i]
+                    else:  # Repeated within this batch
+                        appended[row - len(matrix)] = vectors[i]
+                    new_documents[row] = document
+                    new_metadatas[row] = metadata
+            if appended:
+                matrix = np.ascontiguousarray(np.vstack([matrix, np.stack(appended)]))
+            if persist:
+                self._save(matrix, new_ids, new_documents, new_metadatas)
+            self._unsaved = not persist
+            with self._lock:
+                self._matrix, self._ids, self._documents, self._metadatas, self._row_of = (
+                    matrix, new_ids, new_documents, new_metadatas, row_of
+                )
+
+    def flush(self):
+        """
+        Writes the store file if upserts with persist=False left it behind.
+        """
+        with self._write_lock:
+            if self._unsaved:
+                self._save(self._matrix, self._ids, self._documents, self._metadatas)
+                self._unsaved = False
+
+    def get(self, ids=None, include=("documents", "metadatas"), limit=None, offset=None, **kwargs):
+        with self._lock:
+            matrix, all_ids, documents, metadatas, row_of = self._matrix, self._ids, self._documents, self._metadatas, self._row_of
+        rows = [row_of[record_id] for record_id in ids if record_id in row_of] if ids is not None else list(range(len(all_ids)))
+        rows = rows[offset or 0:]
+        if limit is not None:
+            rows = rows[:limit]
+        return {
+            "ids": [all_ids[row] for row in rows],
+            "documents": [documents[row] for row in rows] if "documents" in include else None,
+            "metadatas": [metadatas[row] for row in rows] if "metadatas" in include else None,
+            "embeddings": [matrix[row] for row in rows] if "embeddings" in include else None,
+        }
+
+
+class NumpyClient:
+    """
+    Creates and opens NumpyCollections under <persist_directory>/numpy, with the
+    subset of the chromadb client API that ensure_database and KnowledgeIndex use.
+    Query and document embeddings use ChromaDB's default embedding model, so
+    vectors are interchangeable with the chroma backend.
+    """
+
+    def __init__(self, persist_directory: str = "chroma_db"):
+        self.persist_directory = store_directory(persist_directory, "numpy")
+        self._embedding_function = None
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+
+    def _embedder(self, embedding_function=None):
+        if embedding_function is not None:
+            return embedding_function
+        if self._embedding_function is None:
+            from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+            self._embedding_function = DefaultEmbeddingFunction()
+        return self._embedding_function
+
+    def _directory(self, name: str) -> str:
+        return os.path.join(self.persist_directory, name)
+
+    def _exists(self, name: str) -> bool:
+        return os.path.exists(os.path.join(self._directory(name), NUMPY_STORE_FILE))
+
+    def get_collection(self, name: str, embedding_function=None) -> NumpyCollection:
+        with self._lock:
+            if name not in self._collections:
+                if not self._exists(name):
+                    raise ValueError(f"Collection {name} does not exist.")
+                self._collections[name] = NumpyCollection(name, self._directory(name), self._embedder(embedding_function))
+            return self._collections[name]
+
+    def create_collection(self, name: str, embedding_function=None) -> NumpyCollection:
+        with self._lock:
+            if self._exists(name):
+                raise ValueError(f"Collection {name} already exists.")
+            collection = NumpyCollection(name, self._directory(name), self._embedder(embedding_function))
+            collection._save(collection._matrix, [], [], [])
+            self._collections[name] = collection
+            return collection
+
+    def get_or_create_collection(self, name: str, embedding_function=None) -> NumpyCollection:
+        try:
+            return self.get_collection(name, embedding_function)
+        except ValueError:
+            return self.create_collection(name, embedding_function)
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            if not os.path.isdir(self._directory(name)):
+                raise ValueError(f"Collection {name} does not exist.")
+            self._collections.pop(name, None)
+            shutil.rmtree(self._directory(name))
+
+    def list_collections(self) -> List[str]:
+        if not os.path.isdir(self.persist_directory):
+            return []
+        return sorted(entry for entry in os.listdir(self.persist_directory) if self._exists(entry))
+
+    def close(self):
+        with self._lock:
+            self._collections.clear()
+
+
+# ============================
+# Selecting a Backend
+# ============================
+def store_directory(persist_directory: str, mode: str) -> str:
+    """
+    Returns the directory a mode keeps its collections (and index pointer) in.
+    """
+    if mode == "numpy":
+        return os.path.join(persist_directory, NUMPY_DIRNAME)
+    return persist_directory
+
+
+def open_client(persist_directory: str, mode: str):
+    """
+    Returns the client that stores collections for an INDEX_MODE: NumpyClient for
+    "numpy", otherwise a ChromaDB client (compact and snapshot serve from ChromaDB
+    collections).
+    """
+    if mode not in INDEX_MODES:
+        raise ValueError(f"Unknown INDEX_MODE {mode!r}; expected one of {', '.join(INDEX_MODES)}.")
+    if mode == "numpy":
+        return NumpyClient(persist_directory)
+    from qa_module import get_chroma_client
+
+    return get_chroma_client(persist_directory=persist_directory)
+
+
+def serve(collection, mode: str, persist_directory: str):
+    """
+    Wraps a stored collection in the serving layer for an INDEX_MODE.
+    """
+    if mode == "compact":
+        from compact_index import CompactCollection
+        from config import COMPACT_OVERSAMPLE
+
+        return CompactCollection.open(collection, persist_directory, COMPACT_OVERSAMPLE)
+    if mode == "snapshot":
+        from index_snapshot import SnapshotCollection
+
+        return SnapshotCollection.open(collection, persist_directory)
+    return collection
@@ -0,0 +1,173 @@
+# singleflight.py
+
+import contextvars
+import threading
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from metrics import COALESCED_REQUESTS
+
+
+class FlightAbandoned(Exception):
+    """
+    Raised to callers waiting on a flight whose call died without a result
+    (e.g. of SystemExit), so one of them can run it again.
+    """
+
+
+class Flight:
+    """
+    One in-progress call shared by every caller with the same key.
+
+    The call publishes stream chunks and status updates (such as its LLM queue
+    position) as events; every caller replays and follows them with stream()
+    and then takes the final result from wait().
+    """
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.followers = 0
+        self._events: List[Tuple[str, object]] = []
+        self._done = False
+        self._abandoned = False
+        self._result = None
+        self._error: Optional[Exception] = None
+        self._condition = threading.Condition()
+
+    @property
+    def abandoned(self) -> bool:
+        return self._abandoned
+
+    def _append(self, kind: str, value):
+        with self._condition:
+            self._events.append((kind, value))
+            self._condition.notify_all()
+
+    def publish(self, chunk: str):
+        self._append("chunk", chunk)
+
+    def set_status(self, status):
+        self._append("status", status)
+
+    def finish(self, result=None, error: Optional[Exception] = None):
+        with self._condition:
+            self._result, self._error, self._done = result, error, True
+            self._condition.notify_all()
+
+    def abandon(self):
+        with self._condition:
+            self._abandoned = self._done = True
+            self._condition.notify_all()
+
+    def stream(self, timeout: Optional[float] = None) -> Iterator[Tuple[str, object]]:
+        """
+        Yields every (kind, value) event published so far, then new ones until
+        the call finishes. kind is "chunk" or "status".
+        """
+        position = 0
+        while True:
+            with self._condition:
+                if position == len(self._events) and not self._done:
+                    if not self._condition.wait(timeout):
+                        raise TimeoutError(f"No progress on shared request {self.key!r}")
+                events = self._events[position:]
+                done = self._done
+            for event in events:
+                yield event
+            position += len(events)
+            if done and not events:
+                return
+
+    def wait(self, timeout: Optional[float] = None):
+        """
+        Returns the call's result, re-raising its exception if it failed.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._done, timeout):
+                raise TimeoutError(f"Shared request {self.key!r} did not finish")
+        if self._abandoned:
+            raise FlightAbandoned(f"Shared request {self.key!r} was abandoned")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls: while a call for a key is running, further
+    calls with the same key wait for it and share its result instead of
+    running again. Nothing is kept after the call finishes.
+
+    The call runs on its own thread, so an exception raised in one caller's
+    thread while it waits (such as Streamlit stopping or rerunning that
+    caller's script) never reaches the call or the other callers. Only
+    Exception results are shared; a call that dies of any other BaseException
+    is abandoned and its waiting callers run it again.
+
+    Args:
+        name (str): Label for the coalescing metric.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[Flight], object], timeout: Optional[float] = None,
+           on_event: Optional[Callable[[str, object], None]] = None) -> Tuple[object, bool]:
+        """
+        Runs fn(flight) unless a call for key is already in progress.
+
+        fn must not touch per-caller state (e.g. Streamlit elements); it reports
+        progress through flight.publish and flight.set_status instead, and each
+        caller renders it in its own thread through on_event.
+
+        Args:
+            on_event: Optional callable receiving (kind, value) for each event
+                of the call, and ("reset", None) when an abandoned call is
+                started over.
+
+        Returns:
+            tuple: (result, shared) where shared is True if another caller's result was reused.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None or flight.abandoned
+                if leader:
+                    flight = self._flights[key] = Flight(key)
+                else:
+                    flight.followers += 1
+            if leader:
+                context = contextvars.copy_context()  # Keeps the caller's trace and query log entry
+                threading.Thread(
+                    target=context.run, args=(self._run, key, flight, fn), name=f"{self.name}-flight", daemon=True
+                ).start()
+            else:
+                COALESCED_REQUESTS.inc(group=self.name)
+            try:
+                if on_event is not None:
+                    for kind, value in flight.stream(timeout):
+                        on_event(kind, value)
+                return flight.wait(timeout), not leader
+            except FlightAbandoned:
+                if on_event is not None:
+                    on_event("reset", None)
+
+    def _run(self, key: Hashable, flight: Flight, fn: Callable[[Flight], object]):
+        try:
+            result = fn(flight)
+        except Exception as e:
+            flight.finish(error=e)
+        except BaseException:
+            flight.abandon()
+            raise
+        else:
+            flight.finish(result)
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def in_flight(self, key: Hashable) -> Optional[Flight]:
+        with self._lock:
+            return self._flights.get(key)
@@ -0,0 +1,194 @@
+# tracing.py
+
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# ============================
+# Trace Log Configuration
+# ============================
+script_dir = os.path.dirname(os.path.abspath(__file__))
+TRACE_LOG_PATH = os.path.join(script_dir, "app.log")
+
+_logger = logging.getLogger("tallman.trace")
+_logger_lock = threading.Lock()
+_logger_configured = False
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def _get_logger() -> logging.Logger:
+    """
+    Attaches a JSON-lines file handler for app.log the first time a span is written.
+    """
+    global _logger_configured
+    if not _logger_configured:
+        with _logger_lock:
+            if not _logger_configured:
+                handler = logging.FileHandler(TRACE_LOG_PATH, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                _logger.addHandler(handler)
+                _logger.setLevel(logging.INFO)
+                _logger.propagate = False
+                _logger_configured = True
+    return _logger
+
+
+class Trace:
+    """
+    A single request flowing through the answer pipeline.
+
+    Every span recorded while the trace is active is written to app.log as one
+    JSON object carrying the trace's request ID.
+    """
+
+    def __init__(self, name: str, request_id: Optional[str] = None, **attributes):
+        self.name = name
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.attributes = attributes
+
+    def record(self, span_name: str, duration_ms: float, **attributes):
+        record = {
+            "ts": round(time.time(), 3),
+            "request_id": self.request_id,
+            "trace": self.name,
+            "span": span_name,
+            "duration_ms": round(duration_ms, 3),
+        }
+        record.update(self.attributes)
+        record.update(attributes)
+        try:
+            _get_logger().info(json.dumps(record, default=str))
+        except Exception as e:
+            print(f"Failed to write trace record: {e}")
+
+
+# ============================
+# Trace and Span Helpers
+# ============================
+@contextmanager
+def start_trace(name: str, request_id: Optional[str] = None, **attributes):
+    """
+    Starts a request trace and makes it current for nested spans.
+
+    Args:
+        name (str): The name of the root span (e.g. "handle_answer").
+        request_id (str): An existing request ID to continue, or None for a new one.
+        **attributes: Extra fields written with every span of this trace.
+
+    Yields:
+        Trace: The active trace.
+    """
+    trace = Trace(name, request_id=request_id, **attributes)
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.record(name, (time.perf_counter() - start) * 1000.0)
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times a block of work as a span of the current trace.
+
+    Outside of a trace this only costs two clock reads.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.record(name, (time.perf_counter() - start) * 1000.0, **attributes)
+
+
+def record_span(name: str, duration_ms: float, **attributes):
+    """
+    Records a span that was timed manually, such as time-to-first-token.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(name, duration_ms, **attributes)
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace is not None else None
+
+
+# ============================
+# Latency Summary
+# ============================
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def summarize(log_path: str = TRACE_LOG_PATH) -> Dict[str, Dict[str, float]]:
+    """
+    Summarizes span durations from a trace log.
+
+    Args:
+        log_path (str): Path to the JSON-lines trace log.
+
+    Returns:
+        Dict[str, Dict[str, float]]: count, p50, p95 and p99 in milliseconds per span name.
+    """
+    durations: Dict[str, List[float]] = {}
+    if not os.path.exists(log_path):
+        return {}
+
+    with open(log_path, "r", encoding="utf-8") as log_file:
+        for line in log_file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict) or "span" not in record or "duration_ms" not in record:
+                continue
+            durations.setdefault(record["span"], []).append(float(record["duration_ms"]))
+
+    summary = {}
+    for span_name, values in durations.items():
+        values.sort()
+        summary[span_name] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+    return summary
+
+
+def print_summary(log_path: str = TRACE_LOG_PATH):
+    summary = summarize(log_path)
+    if not summary:
+        print(f"No spans found in {log_path}")
+        return
+    print(f"{'span':<24}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    for span_name, stats in sorted(summary.items()):
+        print(
+            f"{span_name:<24}{stats['count']:>8}"
+            f"{stats['p50']:>12.1f}{stats['p95']:>12.1f}{stats['p99']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    print_summary(sys.argv[1] if len(sys.argv) > 1 else TRACE_LOG_PATH)